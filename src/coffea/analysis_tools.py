@@ -4,15 +4,23 @@ These helper classes were previously part of ``coffea.processor``
 but have been migrated and updated to be compatible with awkward-array 1.0
 """
 
+import numbers
+import operator
 import warnings
-from collections import namedtuple
-from functools import lru_cache
+from collections import OrderedDict, namedtuple
+from collections.abc import Mapping
 
 import awkward
+import dask
 import dask.array
+import dask.base
+import dask.highlevelgraph
 import dask_awkward
+import dask_awkward.lib.core
+import dask_histogram.core
 import hist
 import hist.dask
+import numba
 import numpy
 from dask_awkward.lib.core import compatible_partitions
 from dask_awkward.utils import IncompatiblePartitions
@@ -41,6 +49,7 @@ class WeightStatistics:
         self.minw = min(self.minw, other.minw)
         self.maxw = max(self.maxw, other.maxw)
         self.n += other.n
+        return self
 
     def __add__(self, other):
         temp = WeightStatistics(self.sumw, self.sumw2, self.minw, self.maxw, self.n)
@@ -50,6 +59,249 @@ class WeightStatistics:
         return self.add(other)
 
 
+class _Memo:
+    """Memo of the arrays computed by an object, bounded in number of entries and in bytes
+
+    Owned by the object, so that the memoized arrays are released with it. The least recently
+    used entries are evicted first. Delayed arrays are only graphs and count for no bytes.
+    """
+
+    def __init__(self, maxsize, maxbytes):
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self._entries = OrderedDict()
+        self._nbytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def nbytes(self):
+        return self._nbytes
+
+    def get(self, key, compute):
+        """The memoized value of key, or else ``compute()``, memoized if it fits"""
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return self._entries[key][0]
+        value = compute()
+        nbytes = value.nbytes if isinstance(value, numpy.ndarray) else 0
+        if self.maxsize > 0 and nbytes <= self.maxbytes:
+            self._entries[key] = (value, nbytes)
+            self._nbytes += nbytes
+            while len(self._entries) > self.maxsize or self._nbytes > self.maxbytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._nbytes -= evicted
+        return value
+
+    def clear(self):
+        self._entries.clear()
+        self._nbytes = 0
+
+    def __getstate__(self):
+        # the memoized arrays are not worth serializing
+        return {"maxsize": self.maxsize, "maxbytes": self.maxbytes}
+
+    def __setstate__(self, state):
+        self.__init__(state["maxsize"], state["maxbytes"])
+
+
+def _modifier(weight, variation, shift, up):
+    """Ratio of a weight variation to the nominal weight (``variation`` may be modified in place)"""
+    if shift:
+        if up:
+            variation += weight
+        else:
+            variation = weight - variation
+    variation[weight != 0.0] /= weight[weight != 0.0]
+    return variation
+
+
+class _ModifierBlock(Mapping):
+    """Modifiers stored as the rows of a single 2D array
+
+    The modifiers added are collected as separate rows, and stacked into the block the first
+    time it is read; the rows then become views of the block.
+    """
+
+    def __init__(self, size, dtype):
+        self._size = size
+        self._dtype = dtype
+        self._block = numpy.empty((0, size), dtype=dtype)
+        self._list = []
+        self._rows = {}
+
+    def __setitem__(self, name, modifier):
+        modifier = numpy.asarray(modifier, dtype=self._dtype)
+        if name in self._rows:
+            if len(self._block) == len(self._list):
+                self._block[self._rows[name]] = modifier
+                return
+            self._list[self._rows[name]] = modifier
+        else:
+            self._rows[name] = len(self._list)
+            self._list.append(modifier)
+
+    def __getitem__(self, name):
+        return self._list[self._rows[name]]
+
+    def __iter__(self):
+        return iter(self._rows)
+
+    def __len__(self):
+        return len(self._rows)
+
+    @property
+    def block(self):
+        """The (number of modifiers, number of events) array of the modifiers, in insertion order"""
+        if len(self._block) != len(self._list):
+            self._block = numpy.empty((len(self._list), self._size), dtype=self._dtype)
+            for row, modifier in enumerate(self._list):
+                self._block[row] = modifier
+            self._list = list(self._block)
+        return self._block
+
+
+class _LazyModifiers(Mapping):
+    """Modifiers recomputed from the weights they were added with whenever they are accessed
+
+    The arrays are kept by reference, so they must not be modified in place afterwards.
+    """
+
+    def __init__(self, dtype):
+        self._dtype = dtype
+        self._inputs = {}
+
+    def set_inputs(self, name, weight, variation, shift, up):
+        self._inputs[name] = (weight, variation, shift, up)
+
+    def __getitem__(self, name):
+        weight, variation, shift, up = self._inputs[name]
+        return _modifier(weight, variation.astype(self._dtype), shift, up)
+
+    def __iter__(self):
+        return iter(self._inputs)
+
+    def __len__(self):
+        return len(self._inputs)
+
+
+def _variation_matrix(weight, modifiers, operations, dtype=None):
+    """Fill the (n_events, n_variations) weight matrix, one column per operation"""
+    out = numpy.empty((len(weight), len(operations)), dtype=dtype or weight.dtype)
+    for column, (index, divide) in enumerate(operations):
+        if index is None:
+            out[:, column] = weight
+        elif divide:
+            numpy.divide(weight, modifiers[index], out=out[:, column])
+        else:
+            numpy.multiply(weight, modifiers[index], out=out[:, column])
+    return out
+
+
+def _variation_matrix_partition(weight, *modifiers, operations):
+    if awkward.backend(weight) == "typetracer":
+        out = numpy.empty((0, len(operations)), dtype=weight.layout.dtype)
+        return awkward.Array(
+            awkward.from_numpy(out, regulararray=True, highlevel=False).to_typetracer(
+                forget_length=True
+            )
+        )
+    out = _variation_matrix(
+        awkward.to_numpy(weight),
+        [awkward.to_numpy(modifier) for modifier in modifiers],
+        operations,
+    )
+    return awkward.from_numpy(out, regulararray=True)
+
+
+def _category_index(axis, values):
+    """Index of values along a category axis, the axis size for values not in the axis"""
+    uniques, inverse = numpy.unique(values, return_inverse=True)
+    lookup = numpy.empty(len(uniques), dtype=numpy.intp)
+    for i, value in enumerate(uniques.tolist()):
+        try:
+            lookup[i] = axis.index(value)
+        except KeyError:
+            lookup[i] = len(axis)
+    return lookup[inverse]
+
+
+def _fill_variations(histogram, axis, labels, matrix, values):
+    """Fill histogram with each column of matrix as weight, at the corresponding label of the axis named axis
+
+    The bin of each event is computed once and all the variations are filled by a single
+    ``numpy.bincount``. Histograms with growing axes or storages other than ``Double`` and
+    ``Weight`` are filled one variation at a time.
+    """
+    storage = histogram.storage_type
+    categories = (hist.axis.StrCategory, hist.axis.IntCategory)
+    if (
+        storage not in (hist.storage.Double, hist.storage.Weight)
+        or any(ax.traits.growth for ax in histogram.axes)
+        or any(label not in histogram.axes[axis] for label in labels)
+        or set(values) != {ax.name for ax in histogram.axes if ax.name != axis}
+    ):
+        for column, label in enumerate(labels):
+            histogram.fill(**values, **{axis: label}, weight=matrix[:, column])
+        return histogram
+
+    view = histogram.view(flow=True)
+    strides = numpy.cumprod((1,) + view.shape[:0:-1])[::-1]
+    flat = numpy.zeros(len(matrix), dtype=numpy.intp)
+    valid = numpy.ones(len(matrix), dtype=bool)
+    columns = None
+    for ax, size, stride in zip(histogram.axes, view.shape, strides):
+        offset = 1 if ax.traits.underflow else 0
+        if ax.name == axis:
+            columns = numpy.array([ax.index(label) + offset for label in labels])
+            columns = columns * stride
+            continue
+        if isinstance(ax, categories):
+            index = _category_index(ax, numpy.asarray(values[ax.name]))
+        else:
+            index = numpy.asarray(ax.index(numpy.asarray(values[ax.name])))
+        index = index + offset
+        valid &= (index >= 0) & (index < size)
+        flat += index * stride
+
+    bins = (flat[valid, None] + columns[None, :]).ravel()
+    weights = matrix[valid].ravel()
+    if storage is hist.storage.Weight:
+        view.value += numpy.bincount(bins, weights, view.size).reshape(view.shape)
+        view.variance += numpy.bincount(bins, weights**2, view.size).reshape(view.shape)
+    else:
+        view += numpy.bincount(bins, weights, view.size).reshape(view.shape)
+    return histogram
+
+
+def _partitionwise_hist(label, function, inputs, histref, **kwargs):
+    """A ``hist.dask.Hist`` like histref, the sum of the histograms returned by function for each partition"""
+    name = f"{label}-" + dask.base.tokenize(function, inputs, histref, kwargs)
+    layer = dask_awkward.lib.core.partitionwise_layer(
+        function, name, *inputs, histref=histref, **kwargs
+    )
+    graph = dask.highlevelgraph.HighLevelGraph.from_collections(
+        name, layer, dependencies=inputs
+    )
+    return _partitioned_hist(graph, name, inputs[0].npartitions, histref)
+
+
+def _partitioned_hist(graph, name, npartitions, histref):
+    """A ``hist.dask.Hist`` like histref, the sum of the histograms of the partitions of layer name"""
+    partitioned = dask_histogram.core.PartitionedHistogram(
+        graph, name, npartitions, histref=histref
+    )
+    aggregated = partitioned.collapse()
+
+    # a hist.dask histogram with the axes of histref, computed by the aggregation
+    out = hist.dask.Hist(
+        *histref.axes, storage=histref.storage_type(), metadata=histref.metadata
+    )
+    rebuild, args = out.__dask_postpersist__()
+    return rebuild(aggregated.dask, *args, rename={out.dask_name: aggregated.name})
+
+
 class Weights:
     """Container for event weights and associated systematic shifts
 
@@ -65,14 +317,55 @@ class Weights:
         storeIndividual : bool, optional
             store not only the total weight + variations, but also each individual weight.
             Default is false.
+        dtype : str or numpy.dtype, optional
+            floating point type of the stored weights and modifiers, e.g. ``"float32"`` to halve
+            their memory footprint. Default is ``"float64"``.
+        modifierStorage : str, optional
+            how the modifiers (the ratios of the weight variations to the nominal weights) are
+            stored in eager mode:
+
+            - ``"separate"`` (default): one array per modifier
+            - ``"block"``: the rows of a single 2D array, grown as modifiers are added
+            - ``"lazy"``: the arrays passed to ``add`` and ``add_multivariation`` are kept,
+              and the modifiers are recomputed from them whenever they are used. This avoids
+              allocating new arrays for the modifiers, at the cost of recomputing them, and
+              saves memory when the caller keeps those arrays anyway (e.g. columns of the
+              events). They are not copied: modifying them in place afterwards changes the
+              modifiers.
+
+            In delayed mode, the modifiers are always separate dask arrays.
+        cache_size : int, optional
+            maximum number of event weight vectors memoized by ``weight`` and ``partial_weight``
+            (0 to disable the memo). Default is 32.
+        cache_bytes : int, optional
+            maximum total size in bytes of the memoized event weight vectors. Default is 256 MiB.
     """
 
-    def __init__(self, size, storeIndividual=False):
-        self._weight = None if size is None else numpy.ones(size)
+    def __init__(
+        self,
+        size,
+        storeIndividual=False,
+        dtype="float64",
+        modifierStorage="separate",
+        cache_size=32,
+        cache_bytes=256 * 1024**2,
+    ):
+        if modifierStorage not in ("separate", "block", "lazy"):
+            raise ValueError(
+                f"modifierStorage must be 'separate', 'block' or 'lazy', not {modifierStorage!r}"
+            )
+        self._dtype = numpy.dtype(dtype)
+        self._weight = None if size is None else numpy.ones(size, dtype=self._dtype)
         self._weights = {}
-        self._modifiers = {}
+        if size is not None and modifierStorage == "block":
+            self._modifiers = _ModifierBlock(size, self._dtype)
+        elif size is not None and modifierStorage == "lazy":
+            self._modifiers = _LazyModifiers(self._dtype)
+        else:
+            self._modifiers = {}
         self._weightStats = {}
         self._storeIndividual = storeIndividual
+        self._memo = _Memo(cache_size, cache_bytes)
 
     @property
     def weightStatistics(self):
@@ -85,13 +378,14 @@ class Weights:
             # and we default to one or is it an invalid weight and we should never use this
             # event in the first place (0) ?
             weight = weight.filled(1.0)
+        weight = weight.astype(self._dtype, copy=False)
         self._weight = self._weight * weight
         if self._storeIndividual:
             self._weights[name] = weight
         self.__add_variation(name, weight, weightUp, weightDown, shift)
         self._weightStats[name] = WeightStatistics(
-            weight.sum(),
-            (weight**2).sum(),
+            weight.sum(dtype=numpy.float64),
+            numpy.square(weight, dtype=numpy.float64).sum(),
             weight.min(),
             weight.max(),
             weight.size,
@@ -104,6 +398,8 @@ class Weights:
             # and we default to one or is it an invalid weight and we should never use this
             # event in the first place (0) ?
             weight = dask_awkward.fill_none(weight, 1.0)
+        if self._dtype != numpy.float64:
+            weight = dask_awkward.values_astype(weight, self._dtype)
         if self._weight is None:
             self._weight = weight
         else:
@@ -147,6 +443,7 @@ class Weights:
                 "Avoid using 'Up' and 'Down' in weight names, instead pass appropriate shifts to add() call"
             )
         weight = coffea.util._ensure_flat(weight, allow_missing=True)
+        self._memo.clear()
         if isinstance(weight, numpy.ndarray) and isinstance(
             self._weight, numpy.ndarray
         ):
@@ -169,6 +466,7 @@ class Weights:
             # and we default to one or is it an invalid weight and we should never use this
             # event in the first place (0) ?
             weight = weight.filled(1.0)
+        weight = weight.astype(self._dtype, copy=False)
         self._weight = self._weight * weight
         if self._storeIndividual:
             self._weights[name] = weight
@@ -186,8 +484,8 @@ class Weights:
             systName = f"{name}_{modifier}"
             self.__add_variation(systName, weight, weightUp, weightDown, shift)
         self._weightStats[name] = WeightStatistics(
-            weight.sum(),
-            (weight**2).sum(),
+            weight.sum(dtype=numpy.float64),
+            numpy.square(weight, dtype=numpy.float64).sum(),
             weight.min(),
             weight.max(),
             weight.size,
@@ -202,6 +500,8 @@ class Weights:
             # and we default to one or is it an invalid weight and we should never use this
             # event in the first place (0) ?
             weight = dask_awkward.fill_none(weight, 1.0)
+        if self._dtype != numpy.float64:
+            weight = dask_awkward.values_astype(weight, self._dtype)
         if self._weight is None:
             self._weight = weight
         else:
@@ -261,6 +561,7 @@ class Weights:
                 "Avoid using 'Up' and 'Down' in weight names, instead pass appropriate shifts to add() call"
             )
         weight = coffea.util._ensure_flat(weight, allow_missing=True)
+        self._memo.clear()
         if isinstance(weight, numpy.ndarray) and isinstance(
             self._weight, numpy.ndarray
         ):
@@ -280,22 +581,20 @@ class Weights:
 
     def __add_variation_eager(self, name, weight, weightUp, weightDown, shift):
         """Helper function to add an eagerly calculated weight variation."""
-        if weightUp is not None:
-            weightUp = coffea.util._ensure_flat(weightUp, allow_missing=True)
-            if isinstance(weightUp, numpy.ma.MaskedArray):
-                weightUp = weightUp.filled(1.0)
-            if shift:
-                weightUp += weight
-            weightUp[weight != 0.0] /= weight[weight != 0.0]
-            self._modifiers[name + "Up"] = weightUp
-        if weightDown is not None:
-            weightDown = coffea.util._ensure_flat(weightDown, allow_missing=True)
-            if isinstance(weightDown, numpy.ma.MaskedArray):
-                weightDown = weightDown.filled(1.0)
-            if shift:
-                weightDown = weight - weightDown
-            weightDown[weight != 0.0] /= weight[weight != 0.0]
-            self._modifiers[name + "Down"] = weightDown
+        for suffix, variation in (("Up", weightUp), ("Down", weightDown)):
+            if variation is None:
+                continue
+            variation = coffea.util._ensure_flat(variation, allow_missing=True)
+            if isinstance(variation, numpy.ma.MaskedArray):
+                variation = variation.filled(1.0)
+            if isinstance(self._modifiers, _LazyModifiers):
+                self._modifiers.set_inputs(
+                    name + suffix, weight, variation, shift, suffix == "Up"
+                )
+            else:
+                self._modifiers[name + suffix] = _modifier(
+                    weight, variation, shift, suffix == "Up"
+                ).astype(self._dtype, copy=False)
 
     def __add_variation_delayed(self, name, weight, weightUp, weightDown, shift):
         """Helper function to add a delayed-calculation weight variation."""
@@ -306,6 +605,8 @@ class Weights:
             if shift:
                 weightUp = weightUp + weight
             weightUp = dask_awkward.where(weight != 0.0, weightUp / weight, weightUp)
+            if self._dtype != numpy.float64:
+                weightUp = dask_awkward.values_astype(weightUp, self._dtype)
             self._modifiers[name + "Up"] = weightUp
         if weightDown is not None:
             weightDown = coffea.util._ensure_flat(weightDown, allow_missing=True)
@@ -316,6 +617,8 @@ class Weights:
             weightDown = dask_awkward.where(
                 weight != 0.0, weightDown / weight, weightDown
             )
+            if self._dtype != numpy.float64:
+                weightDown = dask_awkward.values_astype(weightDown, self._dtype)
             self._modifiers[name + "Down"] = weightDown
 
     def __add_variation(
@@ -347,7 +650,6 @@ class Weights:
         elif isinstance(weight, dask_awkward.Array):
             self.__add_variation_delayed(name, weight, weightUp, weightDown, shift)
 
-    @lru_cache
     def weight(self, modifier=None):
         """Current event weight vector
 
@@ -364,7 +666,12 @@ class Weights:
         """
         if modifier is None:
             return self._weight
-        elif "Down" in modifier and modifier not in self._modifiers:
+        return self._memo.get(
+            ("weight", modifier), lambda: self._weight_modified(modifier)
+        )
+
+    def _weight_modified(self, modifier):
+        if "Down" in modifier and modifier not in self._modifiers:
             return self._weight / self._modifiers[modifier.replace("Down", "Up")]
         return self._weight * self._modifiers[modifier]
 
@@ -393,11 +700,12 @@ class Weights:
                 The weight vector, corresponding to only the effect of the
                 corrections specified.
         """
-        return self._partial_weight(
-            include=tuple(include), exclude=tuple(exclude), modifier=modifier
+        include, exclude = frozenset(include), frozenset(exclude)
+        return self._memo.get(
+            ("partial_weight", include, exclude, modifier),
+            lambda: self._partial_weight(include, exclude, modifier),
         )
 
-    @lru_cache
     def _partial_weight(self, include, exclude, modifier=None):
         if not self._storeIndividual:
             raise ValueError(
@@ -416,7 +724,7 @@ class Weights:
 
         w = None
         if isinstance(self._weight, numpy.ndarray):
-            w = numpy.ones(self._weight.size)
+            w = numpy.ones(self._weight.size, dtype=self._dtype)
         elif isinstance(self._weight, dask_awkward.Array):
             w = dask_awkward.ones_like(self._weight)
 
@@ -433,6 +741,104 @@ class Weights:
             return w / self._modifiers[modifier.replace("Down", "Up")]
         return w * self._modifiers[modifier]
 
+    def _variation_operations(self, modifiers, nominal):
+        """The modifier arrays and (array index, divide) operation of each column of the weight matrix"""
+        if modifiers is None:
+            modifiers = sorted(self.variations)
+        labels = (["nominal"] if nominal else []) + list(modifiers)
+        operations = [(None, False)] if nominal else []
+        arrays = []
+        indices = {}
+        for modifier in modifiers:
+            if "Down" in modifier and modifier not in self._modifiers:
+                key, divide = modifier.replace("Down", "Up"), True
+            else:
+                key, divide = modifier, False
+            if key not in indices:
+                indices[key] = len(arrays)
+                arrays.append(self._modifiers[key])
+            operations.append((indices[key], divide))
+        return labels, arrays, operations
+
+    def weight_matrix(self, modifiers=None, nominal=True):
+        """Event weight vectors of several systematic variations, as a single array
+
+        Parameters
+        ----------
+            modifiers : list of str, optional
+                the systematic uncertainty shifts, of form ``str(name + 'Up')`` or (Down),
+                by default all the available ones (see ``variations``), sorted
+            nominal : bool, optional
+                add the nominal event weight as first column. Default is true.
+
+        Returns
+        -------
+            weights : numpy.ndarray | dask_awkward.Array
+                The (number of events, number of variations) contiguous array whose columns are the
+                weight vectors of the nominal weight (if requested) and of each modifier, in order.
+                In delayed mode, an array of regular lists with one entry per variation.
+        """
+        labels, arrays, operations = self._variation_operations(modifiers, nominal)
+        if isinstance(self._weight, numpy.ndarray):
+            return _variation_matrix(self._weight, arrays, operations)
+        return dask_awkward.map_partitions(
+            _variation_matrix_partition,
+            self._weight,
+            *arrays,
+            operations=operations,
+            label="weight-matrix",
+        )
+
+    def fill_variations(self, histogram, axis, modifiers=None, nominal=True, **values):
+        """Fill a histogram once for several systematic variations of the event weight
+
+        Each event is filled at the label ``"nominal"`` (if requested) and at the label of
+        each modifier along the ``axis`` category axis of the histogram, weighted by the
+        corresponding event weight (see ``weight_matrix``). In eager mode, the bin of each
+        event along the other axes is computed only once for all the variations. In delayed
+        mode, one fill per variation is staged on the histogram, all executed together when
+        it is computed.
+
+        Parameters
+        ----------
+            histogram : hist.Hist | hist.dask.Hist
+                the histogram to fill, with a ``hist.axis.StrCategory`` axis named ``axis``
+            axis : str
+                name of the systematic variation axis
+            modifiers : list of str, optional
+                the systematic uncertainty shifts, by default all the available ones, sorted
+            nominal : bool, optional
+                fill the nominal event weight at the label ``"nominal"``. Default is true.
+            **values : numpy.ndarray | dask_awkward.Array
+                the values to fill, for each of the other axes of the histogram
+
+        Returns
+        -------
+            histogram : hist.Hist | hist.dask.Hist
+                ``histogram``, filled in place
+        """
+        labels, arrays, operations = self._variation_operations(modifiers, nominal)
+        if isinstance(self._weight, numpy.ndarray):
+            matrix = _variation_matrix(self._weight, arrays, operations)
+            values = {
+                name: (
+                    awkward.to_numpy(value)
+                    if isinstance(value, awkward.Array)
+                    else numpy.asarray(value)
+                )
+                for name, value in values.items()
+            }
+            return _fill_variations(histogram, axis, labels, matrix, values)
+
+        if set(values) != {ax.name for ax in histogram.axes if ax.name != axis}:
+            raise ValueError(
+                f"Provide one array of values for each axis of the histogram other than {axis}"
+            )
+        matrix = self.weight_matrix(modifiers, nominal)
+        for column, label in enumerate(labels):
+            histogram.fill(**values, **{axis: label}, weight=matrix[:, column])
+        return histogram
+
     @property
     def variations(self):
         """List of available modifiers"""
@@ -443,15 +849,73 @@ class Weights:
         return keys
 
 
+class _WeightedYields:
+    """Sums of weights and of squared weights of the steps of a cutflow or N-1 selection
+
+    The sums are those computed by ``_selection_counts`` for each weight variation: a
+    (2, n_variations, n_counts) array in eager mode, or its flattening as a delayed array
+    in delayed mode.
+    """
+
+    def __init__(self, variations, sums, size, delayed_mode):
+        self.variations = variations
+        self._sums = sums
+        self._size = size
+        self._delayed_mode = delayed_mode
+
+    def result(self, steps):
+        """The sums of weights and of squared weights of some steps, as ``{variation: list}``"""
+        out = []
+        for power in range(2):
+            if not self._delayed_mode:
+                sums = self._sums[power][:, steps]
+                out.append(dict(zip(self.variations, sums.tolist())))
+                continue
+            offset = power * len(self.variations)
+            out.append(
+                {
+                    variation: [
+                        self._sums[(offset + k) * self._size + step] for step in steps
+                    ]
+                    for k, variation in enumerate(self.variations)
+                }
+            )
+        return tuple(out)
+
+    def hist(self, steps, name):
+        """The ``Weight`` histogram of the yields of some steps, on an integer axis named name"""
+        h = hist.Hist(
+            hist.axis.Integer(0, len(steps), name=name),
+            hist.axis.StrCategory(self.variations, name="variation"),
+            storage=hist.storage.Weight(),
+        )
+        if self._delayed_mode:
+            return _partitionwise_hist(
+                "cutflow-yields",
+                _yields_hist_partition,
+                [self._sums],
+                h,
+                nvariations=len(self.variations),
+                size=self._size,
+                steps=steps,
+            )
+        view = h.view(flow=False)
+        view.value = self._sums[0][:, steps].T
+        view.variance = self._sums[1][:, steps].T
+        return h
+
+
 class NminusOneToNpz:
     """Object to be returned by NminusOne.to_npz()"""
 
-    def __init__(self, file, labels, nev, masks, saver):
+    def __init__(self, file, labels, nev, masks, saver, yields=None):
         self._file = file
         self._labels = labels
         self._nev = nev
         self._masks = masks
         self._saver = saver
+        # the weight variations and the sums of weights to save, if any
+        self._yields = {} if yields is None else yields
 
     def __repr__(self):
         return f"NminusOneToNpz(file={self._file}), labels={self._labels})"
@@ -472,17 +936,36 @@ class NminusOneToNpz:
     def masks(self):
         return self._masks
 
+    @property
+    def yields(self):
+        return self._yields
+
     def compute(self):
         self._nev = list(dask.compute(*self._nev))
         self._masks = list(dask.compute(*self._masks))
-        self._saver(self._file, labels=self._labels, nev=self._nev, masks=self._masks)
+        (self._yields,) = dask.compute(self._yields)
+        self._saver(
+            self._file,
+            labels=self._labels,
+            nev=self._nev,
+            masks=self._masks,
+            **self._yields,
+        )
 
 
 class CutflowToNpz:
     """Object to be returned by Cutflow.to_npz()"""
 
     def __init__(
-        self, file, labels, nevonecut, nevcutflow, masksonecut, maskscutflow, saver
+        self,
+        file,
+        labels,
+        nevonecut,
+        nevcutflow,
+        masksonecut,
+        maskscutflow,
+        saver,
+        yields=None,
     ):
         self._file = file
         self._labels = labels
@@ -491,6 +974,8 @@ class CutflowToNpz:
         self._masksonecut = masksonecut
         self._maskscutflow = maskscutflow
         self._saver = saver
+        # the weight variations and the sums of weights to save, if any
+        self._yields = {} if yields is None else yields
 
     def __repr__(self):
         return f"CutflowToNpz(file={self._file}), labels={self._labels})"
@@ -519,6 +1004,10 @@ class CutflowToNpz:
     def maskscutflow(self):
         return self._maskscutflow
 
+    @property
+    def yields(self):
+        return self._yields
+
     def compute(self):
         self._nevonecut, self._nevcutflow = dask.compute(
             self._nevonecut, self._nevcutflow
@@ -530,6 +1019,7 @@ class CutflowToNpz:
         self._nevcutflow = list(self._nevcutflow)
         self._masksonecut = list(self._masksonecut)
         self._maskscutflow = list(self._maskscutflow)
+        (self._yields,) = dask.compute(self._yields)
         self._saver(
             self._file,
             labels=self._labels,
@@ -537,21 +1027,33 @@ class CutflowToNpz:
             nevcutflow=self._nevcutflow,
             masksonecut=self._masksonecut,
             maskscutflow=self._maskscutflow,
+            **self._yields,
         )
 
 
 class NminusOne:
     """Object to be returned by PackedSelection.nminusone()"""
 
-    def __init__(self, names, nev, masks, delayed_mode):
+    def __init__(self, names, nev, masks, delayed_mode, yields=None, selection=None):
         self._names = names
         self._nev = nev
-        self._masks = masks
+        # a list, or None to build it from selection when the masks are first needed
+        self.__masks = masks
         self._delayed_mode = delayed_mode
+        self._yields = yields
+        # the packed selections and the bit indices of the cuts, to fill plot_vars from
+        self._selection = selection
+        self._steps = [0] + list(range(2 * len(names) + 1, 3 * len(names) + 2))
 
     def __repr__(self):
         return f"NminusOne(selections={self._names})"
 
+    @property
+    def _masks(self):
+        if self.__masks is None:
+            self.__masks = _selection_masks(*self._selection, "nminusone")
+        return self.__masks
+
     def result(self):
         """Returns the results of the N-1 selection as a namedtuple
 
@@ -570,6 +1072,34 @@ class NminusOne:
         labels = ["initial"] + [f"N - {i}" for i in self._names] + ["N"]
         return NminusOneResult(labels, self._nev, self._masks)
 
+    def weighted_result(self):
+        """Returns the weighted yields of the N-1 selection as a namedtuple
+
+        Only available if weights were given to ``PackedSelection.nminusone``.
+
+        Returns
+        -------
+            result : NminusOneWeightedResult
+                A namedtuple with the following attributes:
+
+                variations : list of strings
+                    The weight variations, ``"nominal"`` followed by the requested modifiers
+                sumw : dict of lists of floats or dask_awkward.lib.core.Scalar objects
+                    The sum of weights of the events in each step of the N-1 selection, for each variation
+                sumw2 : dict of lists of floats or dask_awkward.lib.core.Scalar objects
+                    The sum of squared weights of the events in each step of the N-1 selection, for each variation
+        """
+        if self._yields is None:
+            raise ValueError(
+                "The N-1 selection has no weights, pass weights to PackedSelection.nminusone"
+            )
+        NminusOneWeightedResult = namedtuple(
+            "NminusOneWeightedResult", ["labels", "variations", "sumw", "sumw2"]
+        )
+        labels = ["initial"] + [f"N - {i}" for i in self._names] + ["N"]
+        sumw, sumw2 = self._yields.result(self._steps)
+        return NminusOneWeightedResult(labels, self._yields.variations, sumw, sumw2)
+
     def to_npz(self, file, compressed=False, compute=False):
         """Saves the results of the N-1 selection to a .npz file
 
@@ -595,13 +1125,21 @@ class NminusOne:
                 that can be used to start writing the data by calling compute().
         """
         labels, nev, masks = self.result()
+        yields = None
+        if self._yields is not None:
+            _, variations, sumw, sumw2 = self.weighted_result()
+            yields = {
+                "variations": variations,
+                "sumw": [sumw[v] for v in variations],
+                "sumw2": [sumw2[v] for v in variations],
+            }
 
         if compressed:
             saver = numpy.savez_compressed
         else:
             saver = numpy.savez
 
-        out = NminusOneToNpz(file, labels, nev, masks, saver)
+        out = NminusOneToNpz(file, labels, nev, masks, saver, yields)
         if compute:
             out.compute()
             return None
@@ -639,6 +1177,10 @@ class NminusOne:
     def yieldhist(self):
         """Returns the N-1 selection yields as a ``hist.Hist`` object
 
+        If weights were given to ``PackedSelection.nminusone``, the histogram has ``Weight``
+        storage and a second ``"variation"`` category axis, and holds the sums of weights and of
+        squared weights of each variation (see ``weighted_result``).
+
         Returns
         -------
             h : hist.Hist or hist.dask.Hist
@@ -647,7 +1189,9 @@ class NminusOne:
                 The bin labels of the histogram
         """
         labels = ["initial"] + [f"N - {i}" for i in self._names] + ["N"]
-        if not self._delayed_mode:
+        if self._yields is not None:
+            h = self._yields.hist(self._steps, "N-1")
+        elif not self._delayed_mode:
             h = hist.Hist(hist.axis.Integer(0, len(labels), name="N-1"))
             h.fill(numpy.arange(len(labels), dtype=int), weight=self._nev)
 
@@ -705,14 +1249,17 @@ class NminusOne:
                 The bin labels of y axis of the histogram.
         """
         if self._delayed_mode:
+            reference = (
+                self._masks[0] if self._selection is None else self._selection[0]
+            )
             for name, var in vars.items():
-                if not compatible_partitions(var, self._masks[0]):
-                    raise IncompatiblePartitions("plot_vars", var, self._masks[0])
+                if not compatible_partitions(var, reference):
+                    raise IncompatiblePartitions("plot_vars", var, reference)
         else:
             for name, var in vars.items():
-                if len(var) != len(self._masks[0]):
+                if len(var) != self._nev[0]:
                     raise ValueError(
-                        f"The variable '{name}' has length '{len(var)}', but the masks have length '{len(self._masks[0])}'"
+                        f"The variable '{name}' has length '{len(var)}', but the masks have length '{self._nev[0]}'"
                     )
 
         hists = []
@@ -724,17 +1271,10 @@ class NminusOne:
         edges = [None] * len(vars) if edges is None else edges
         transform = [None] * len(vars) if transform is None else transform
 
-        if axes is not None:
-            axes = axes
-        else:
-            axes = []
-            for (name, var), b, s1, s2, e, t in zip(
-                vars.items(), bins, start, stop, edges, transform
-            ):
-                ax = coffea.util._gethistogramaxis(
-                    name, var, b, s1, s2, e, t, self._delayed_mode
-                )
-                axes.append(ax)
+        if axes is None:
+            axes = coffea.util._gethistogramaxes(
+                vars, bins, start, stop, edges, transform, self._delayed_mode
+            )
 
         checklengths = [
             len(x) == len(vars) for x in (axes, bins, start, stop, edges, transform)
@@ -744,51 +1284,68 @@ class NminusOne:
                 "vars, axes, bins, start, stop, edges, and transform must be the same length"
             )
 
-        if not self._delayed_mode:
-            for (name, var), axis in zip(vars.items(), axes):
-                h = hist.Hist(
-                    axis,
-                    hist.axis.Integer(0, len(labels), name="N-1"),
-                )
-                arr = awkward.flatten(var)
-                h.fill(arr, awkward.zeros_like(arr, dtype=int))
-                for i, mask in enumerate(self.result().masks, 1):
-                    arr = awkward.flatten(var[mask])
-                    h.fill(arr, awkward.full_like(arr, i, dtype=int))
-                hists.append(h)
-
-        else:
-            for (name, var), axis in zip(vars.items(), axes):
-                h = hist.dask.Hist(
-                    axis,
-                    hist.axis.Integer(0, len(labels), name="N-1"),
-                )
-                arr = dask_awkward.flatten(var)
-                h.fill(arr, dask_awkward.zeros_like(arr, dtype=int))
-                for i, mask in enumerate(self.result().masks, 1):
-                    arr = dask_awkward.flatten(var[mask])
-                    h.fill(arr, dask_awkward.full_like(arr, i, dtype=int))
-                hists.append(h)
+        for var, axis in zip(vars.values(), axes):
+            histref = hist.Hist(axis, hist.axis.Integer(0, len(labels), name="N-1"))
+            hists.append(self.__steps_hist(var, histref))
 
         return hists, labels
 
+    def __steps_hist(self, var, histref):
+        """Histogram of var for each step, see ``_steps_hist``"""
+        if self._selection is not None:
+            return _steps_hist(
+                var,
+                [self._selection[0]],
+                histref,
+                self._delayed_mode,
+                indices=self._selection[1],
+                kind="nminusone",
+            )
+        return _steps_hist(var, self._masks, histref, self._delayed_mode)
+
 
 class Cutflow:
     """Object to be returned by PackedSelection.cutflow()"""
 
     def __init__(
-        self, names, nevonecut, nevcutflow, masksonecut, maskscutflow, delayed_mode
+        self,
+        names,
+        nevonecut,
+        nevcutflow,
+        masksonecut,
+        maskscutflow,
+        delayed_mode,
+        yields=None,
+        selection=None,
     ):
         self._names = names
         self._nevonecut = nevonecut
         self._nevcutflow = nevcutflow
-        self._masksonecut = masksonecut
-        self._maskscutflow = maskscutflow
+        # lists, or None to build them from selection when the masks are first needed
+        self.__masksonecut = masksonecut
+        self.__maskscutflow = maskscutflow
         self._delayed_mode = delayed_mode
+        self._yields = yields
+        # the packed selections and the bit indices of the cuts, to fill plot_vars from
+        self._selection = selection
+        self._stepsonecut = [0] + list(range(1, len(names) + 1))
+        self._stepscutflow = [0] + list(range(len(names) + 1, 2 * len(names) + 1))
 
     def __repr__(self):
         return f"Cutflow(selections={self._names})"
 
+    @property
+    def _masksonecut(self):
+        if self.__masksonecut is None:
+            self.__masksonecut = _selection_masks(*self._selection, "onecut")
+        return self.__masksonecut
+
+    @property
+    def _maskscutflow(self):
+        if self.__maskscutflow is None:
+            self.__maskscutflow = _selection_masks(*self._selection, "cutflow")
+        return self.__maskscutflow
+
     def result(self):
         """Returns the results of the cutflow as a namedtuple
 
@@ -819,6 +1376,46 @@ class Cutflow:
             self._maskscutflow,
         )
 
+    def weighted_result(self):
+        """Returns the weighted yields of the cutflow as a namedtuple
+
+        Only available if weights were given to ``PackedSelection.cutflow``.
+
+        Returns
+        -------
+            result : CutflowWeightedResult
+                A namedtuple with the following attributes:
+
+                variations : list of strings
+                    The weight variations, ``"nominal"`` followed by the requested modifiers
+                sumwonecut, sumw2onecut : dict of lists of floats or dask_awkward.lib.core.Scalar objects
+                    The sums of weights and of squared weights of the events that survive each cut alone, for each variation
+                sumwcutflow, sumw2cutflow : dict of lists of floats or dask_awkward.lib.core.Scalar objects
+                    The sums of weights and of squared weights of the events that survive the cumulative cutflow, for each variation
+        """
+        if self._yields is None:
+            raise ValueError(
+                "The cutflow has no weights, pass weights to PackedSelection.cutflow"
+            )
+        CutflowWeightedResult = namedtuple(
+            "CutflowWeightedResult",
+            [
+                "labels",
+                "variations",
+                "sumwonecut",
+                "sumw2onecut",
+                "sumwcutflow",
+                "sumw2cutflow",
+            ],
+        )
+        labels = ["initial"] + list(self._names)
+        return CutflowWeightedResult(
+            labels,
+            self._yields.variations,
+            *self._yields.result(self._stepsonecut),
+            *self._yields.result(self._stepscutflow),
+        )
+
     def to_npz(self, file, compressed=False, compute=False):
         """Saves the results of the cutflow to a .npz file
 
@@ -844,6 +1441,13 @@ class Cutflow:
                 that can be used to start writing the data by calling compute().
         """
         labels, nevonecut, nevcutflow, masksonecut, maskscutflow = self.result()
+        yields = None
+        if self._yields is not None:
+            _, variations, *sums = self.weighted_result()
+            keys = ["sumwonecut", "sumw2onecut", "sumwcutflow", "sumw2cutflow"]
+            yields = {"variations": variations}
+            for key, values in zip(keys, sums):
+                yields[key] = [values[v] for v in variations]
 
         if compressed:
             saver = numpy.savez_compressed
@@ -851,7 +1455,14 @@ class Cutflow:
             saver = numpy.savez
 
         out = CutflowToNpz(
-            file, labels, nevonecut, nevcutflow, masksonecut, maskscutflow, saver
+            file,
+            labels,
+            nevonecut,
+            nevcutflow,
+            masksonecut,
+            maskscutflow,
+            saver,
+            yields,
         )
         if compute:
             out.compute()
@@ -888,6 +1499,10 @@ class Cutflow:
     def yieldhist(self):
         """Returns the cutflow yields as ``hist.Hist`` objects
 
+        If weights were given to ``PackedSelection.cutflow``, the histograms have ``Weight``
+        storage and a second ``"variation"`` category axis, and hold the sums of weights and of
+        squared weights of each variation (see ``weighted_result``).
+
         Returns
         -------
             honecut : hist.Hist or hist.dask.Hist
@@ -899,7 +1514,11 @@ class Cutflow:
         """
         labels = ["initial"] + list(self._names)
 
-        if not self._delayed_mode:
+        if self._yields is not None:
+            honecut = self._yields.hist(self._stepsonecut, "onecut")
+            hcutflow = self._yields.hist(self._stepscutflow, "cutflow")
+
+        elif not self._delayed_mode:
             honecut = hist.Hist(hist.axis.Integer(0, len(labels), name="onecut"))
             hcutflow = honecut.copy()
             hcutflow.axes.name = ("cutflow",)
@@ -973,14 +1592,17 @@ class Cutflow:
                 The bin labels of the y axis of the histograms.
         """
         if self._delayed_mode:
+            reference = (
+                self._masksonecut[0] if self._selection is None else self._selection[0]
+            )
             for name, var in vars.items():
-                if not compatible_partitions(var, self._masksonecut[0]):
-                    raise IncompatiblePartitions("plot_vars", var, self._masksonecut[0])
+                if not compatible_partitions(var, reference):
+                    raise IncompatiblePartitions("plot_vars", var, reference)
         else:
             for name, var in vars.items():
-                if len(var) != len(self._masksonecut[0]):
+                if len(var) != self._nevonecut[0]:
                     raise ValueError(
-                        f"The variable '{name}' has length '{len(var)}', but the masks have length '{len(self._masksonecut[0])}'"
+                        f"The variable '{name}' has length '{len(var)}', but the masks have length '{self._nevonecut[0]}'"
                     )
 
         histsonecut, histscutflow = [], []
@@ -992,17 +1614,10 @@ class Cutflow:
         edges = [None] * len(vars) if edges is None else edges
         transform = [None] * len(vars) if transform is None else transform
 
-        if axes is not None:
-            axes = axes
-        else:
-            axes = []
-            for (name, var), b, s1, s2, e, t in zip(
-                vars.items(), bins, start, stop, edges, transform
-            ):
-                ax = coffea.util._gethistogramaxis(
-                    name, var, b, s1, s2, e, t, self._delayed_mode
-                )
-                axes.append(ax)
+        if axes is None:
+            axes = coffea.util._gethistogramaxes(
+                vars, bins, start, stop, edges, transform, self._delayed_mode
+            )
 
         checklengths = [
             len(x) == len(vars) for x in (axes, bins, start, stop, edges, transform)
@@ -1012,53 +1627,321 @@ class Cutflow:
                 "vars, axes, bins, start, stop, edges, and transform must be the same length"
             )
 
-        if not self._delayed_mode:
-            for (name, var), axis in zip(vars.items(), axes):
-                honecut = hist.Hist(
-                    axis,
-                    hist.axis.Integer(0, len(labels), name="onecut"),
-                )
-                hcutflow = honecut.copy()
-                hcutflow.axes.name = name, "cutflow"
+        for var, axis in zip(vars.values(), axes):
+            honecut = hist.Hist(axis, hist.axis.Integer(0, len(labels), name="onecut"))
+            hcutflow = honecut.copy()
+            hcutflow.axes.name = axis.name, "cutflow"
+            histsonecut.append(self.__steps_hist(var, honecut, "onecut"))
+            histscutflow.append(self.__steps_hist(var, hcutflow, "cutflow"))
 
-                arr = awkward.flatten(var)
-                honecut.fill(arr, awkward.zeros_like(arr, dtype=int))
-                hcutflow.fill(arr, awkward.zeros_like(arr, dtype=int))
+        return histsonecut, histscutflow, labels
 
-                for i, mask in enumerate(self.result().masksonecut, 1):
-                    arr = awkward.flatten(var[mask])
-                    honecut.fill(arr, awkward.full_like(arr, i, dtype=int))
-                histsonecut.append(honecut)
+    def __steps_hist(self, var, histref, kind):
+        """Histogram of var for each step of the cuts alone or of the cutflow, see ``_steps_hist``"""
+        if self._selection is not None:
+            return _steps_hist(
+                var,
+                [self._selection[0]],
+                histref,
+                self._delayed_mode,
+                indices=self._selection[1],
+                kind=kind,
+            )
+        masks = self._masksonecut if kind == "onecut" else self._maskscutflow
+        return _steps_hist(var, masks, histref, self._delayed_mode)
+
+
+@numba.njit
+def _selection_counts_kernel(data, words, bits, weights):
+    ncuts = len(words)
+    # events passing each cut, failing first at each cut, and failing only each cut
+    # (the last entry of the last two counting the events passing all the cuts)
+    counts = numpy.zeros((3, ncuts + 1), dtype=numpy.int64)
+    sums = numpy.zeros((2, weights.shape[1], 3, ncuts + 1), dtype=numpy.float64)
+    for event in range(data.shape[0]):
+        nfail = 0
+        first = ncuts
+        failed = ncuts
+        for i in range(ncuts):
+            if data[event, words[i]] & bits[i]:
+                counts[0, i] += 1
+                for k in range(weights.shape[1]):
+                    sums[0, k, 0, i] += weights[event, k]
+                    sums[1, k, 0, i] += weights[event, k] ** 2
+            else:
+                nfail += 1
+                if first == ncuts:
+                    first = i
+                failed = i
+        counts[1, first] += 1
+        if nfail <= 1:
+            counts[2, failed] += 1
+        for k in range(weights.shape[1]):
+            sums[0, k, 1, first] += weights[event, k]
+            sums[1, k, 1, first] += weights[event, k] ** 2
+            if nfail <= 1:
+                sums[0, k, 2, failed] += weights[event, k]
+                sums[1, k, 2, failed] += weights[event, k] ** 2
+    return counts, sums
+
+
+def _selection_counts(data, indices, weights=None):
+    """Cutflow and N-1 counts of the selections at the given bit indices of packed data, in one pass
 
-                for i, mask in enumerate(self.result().maskscutflow, 1):
-                    arr = awkward.flatten(var[mask])
-                    hcutflow.fill(arr, awkward.full_like(arr, i, dtype=int))
-                histscutflow.append(hcutflow)
+    Parameters
+    ----------
+        data : numpy.ndarray
+            The (n_events,) packed selections, or the (n_events, n_words) bitset of uint64 words
+        indices : list of int
+            The bit index of each selection, in cutflow order
+        weights : numpy.ndarray, optional
+            The (n_events,) event weights, or the (n_events, n_variations) weight matrix of several
+            variations, to also compute the sums of weights and of squared weights
+
+    Returns
+    -------
+        counts : numpy.ndarray
+            The number of events, passing each cut alone, passing each step of the cutflow, passing
+            all the cuts but each one and passing all the cuts, in a single vector of length
+            ``3 * len(indices) + 2``
+        sums : numpy.ndarray or None
+            The sums of weights and of squared weights of the same events, of shape
+            (2, ``3 * len(indices) + 2``), or (2, n_variations, ``3 * len(indices) + 2``) for a
+            weight matrix
+    """
+    indices = numpy.asarray(indices, dtype=numpy.int64)
+    if data.ndim == 1:
+        data = data.reshape(-1, 1)
+        words = numpy.zeros(len(indices), dtype=numpy.int64)
+        bits = (numpy.uint64(1) << indices.astype(numpy.uint64)).astype(data.dtype)
+    else:
+        words = indices // 64
+        bits = numpy.uint64(1) << (indices % 64).astype(numpy.uint64)
+    if weights is None:
+        matrix = numpy.empty((len(data), 0), dtype=numpy.float64)
+    else:
+        matrix = numpy.asarray(weights, dtype=numpy.float64).reshape(len(data), -1)
+    raw_counts, raw_sums = _selection_counts_kernel(data, words, bits, matrix)
+
+    def combine(raw):
+        onecut, firstfail, onlyfail = raw[..., 0, :], raw[..., 1, :], raw[..., 2, :]
+        ncuts = len(indices)
+        total = firstfail.sum(axis=-1, keepdims=True)
+        # the events passing the i first cuts fail first at a later cut, or pass all of them
+        cutflow = numpy.flip(numpy.cumsum(numpy.flip(firstfail, -1), -1), -1)[..., 1:]
+        nminusone = onlyfail[..., :ncuts] + onlyfail[..., ncuts:]
+        return numpy.concatenate(
+            [total, onecut[..., :ncuts], cutflow, nminusone, onlyfail[..., ncuts:]],
+            axis=-1,
+        )
 
-        else:
-            for (name, var), axis in zip(vars.items(), axes):
-                honecut = hist.dask.Hist(
-                    axis,
-                    hist.axis.Integer(0, len(labels), name="onecut"),
-                )
-                hcutflow = honecut.copy()
-                hcutflow.axes.name = name, "cutflow"
+    if weights is None:
+        return combine(raw_counts), None
+    sums = combine(raw_sums)
+    return combine(raw_counts), sums[:, 0] if numpy.ndim(weights) == 1 else sums
+
+
+def _selection_counts_partition(data, *weights, indices, nvariations):
+    size = 3 * len(indices) + 2
+    if awkward.backend(data) == "typetracer":
+        counts = numpy.zeros((1, size), dtype=numpy.int64)
+        sums = numpy.zeros((1, 2 * nvariations * size), dtype=numpy.float64)
+    else:
+        counts, sums = _selection_counts(
+            awkward.to_numpy(data),
+            indices,
+            awkward.to_numpy(weights[0]) if weights else None,
+        )
+        counts = counts.reshape(1, size)
+        sums = numpy.zeros((1, 0)) if sums is None else sums.reshape(1, -1)
+    layout = awkward.contents.RecordArray(
+        [
+            awkward.from_numpy(counts, regulararray=True, highlevel=False),
+            awkward.from_numpy(sums, regulararray=True, highlevel=False),
+        ],
+        ["counts", "sums"],
+    )
+    if awkward.backend(data) == "typetracer":
+        layout = layout.to_typetracer(forget_length=True)
+    return awkward.Array(layout)
+
+
+def _selection_steps(data, indices, kind):
+    """Whether each event enters each step of the cuts alone, the cutflow or the N-1 selection
 
-                arr = dask_awkward.flatten(var)
-                honecut.fill(arr, dask_awkward.zeros_like(arr, dtype=int))
-                hcutflow.fill(arr, dask_awkward.zeros_like(arr, dtype=int))
+    Parameters
+    ----------
+        data : numpy.ndarray
+            The (n_events,) packed selections, or the (n_events, n_words) bitset of uint64 words
+        indices : list of int
+            The bit index of each selection, in cutflow order
+        kind : str
+            ``"onecut"``, ``"cutflow"`` or ``"nminusone"``
+
+    Returns
+    -------
+        steps : numpy.ndarray
+            The (n_events, n_steps) boolean matrix of the events entering each step, the first
+            step being the initial one that all events enter
+    """
+    indices = numpy.asarray(indices, dtype=numpy.int64)
+    if data.ndim == 1:
+        bits = (numpy.uint64(1) << indices.astype(numpy.uint64)).astype(data.dtype)
+        passed = (data.reshape(-1, 1) & bits) != 0
+    else:
+        bits = numpy.uint64(1) << (indices % 64).astype(numpy.uint64)
+        passed = (data[:, indices // 64] & bits) != 0
+    if kind == "onecut":
+        steps = [passed]
+    elif kind == "cutflow":
+        steps = [numpy.logical_and.accumulate(passed, axis=1)]
+    else:
+        nfail = len(indices) - passed.sum(axis=1, keepdims=True)
+        steps = [(nfail == 0) | ((nfail == 1) & ~passed), nfail == 0]
+    return numpy.concatenate([numpy.ones((len(data), 1), dtype=bool), *steps], axis=1)
+
+
+def _steps_hist_partition(var, *selection, histref, indices=None, kind=None):
+    """Fill an empty copy of histref with var at the index of each step that the events enter
+
+    The steps are computed from the packed selections at the given bit indices, see
+    ``_selection_steps``, or are the initial step followed by the given masks. The values of
+    the events are expanded over their steps, to be filled at once.
+    """
+    var = awkward.typetracer.length_zero_if_typetracer(var)
+    selection = [
+        awkward.to_numpy(awkward.typetracer.length_zero_if_typetracer(array))
+        for array in selection
+    ]
+    if indices is not None:
+        steps = _selection_steps(selection[0], indices, kind)
+    else:
+        steps = numpy.column_stack([numpy.ones(len(var), dtype=bool), *selection])
+    events, steps = numpy.nonzero(steps)
+    values = var[events]
+    if values.ndim > 1:
+        steps = numpy.repeat(steps, awkward.to_numpy(awkward.num(values, axis=1)))
+        values = awkward.flatten(values)
+    h = histref.copy().reset()
+    h.fill(awkward.to_numpy(values), steps)
+    return h
+
+
+def _steps_hist(var, selection, histref, delayed_mode, **kwargs):
+    """Histogram of var for each step, see ``_steps_hist_partition``
+
+    In delayed mode, a ``hist.dask.Hist`` filled by a single task per partition.
+    """
+    if not delayed_mode:
+        return _steps_hist_partition(var, *selection, histref=histref, **kwargs)
+    return _partitionwise_hist(
+        "plot-vars",
+        _steps_hist_partition,
+        [var, *selection],
+        histref,
+        **kwargs,
+    )
+
+
+def _yields_hist_partition(sums, *, histref, nvariations, size, steps):
+    """The Weight histogram of the yields of some steps, from summed (flattened) sums"""
+    h = histref.copy()
+    if awkward.backend(sums) == "typetracer":
+        return h
+    sums = awkward.to_numpy(sums).reshape(2, nvariations, size)[:, :, steps]
+    view = h.view(flow=False)
+    view.value = sums[0].T
+    view.variance = sums[1].T
+    return h
+
+
+def _from_numpy_partition(out, typetracer):
+    """An awkward array of a numpy array, as a typetracer of unknown length if requested"""
+    layout = awkward.from_numpy(out, regulararray=True, highlevel=False)
+    if typetracer:
+        layout = layout.to_typetracer(forget_length=True)
+    return awkward.Array(layout)
+
+
+def _bitset_words(bits):
+    """Group (bit index, value) pairs by 64-bit word: {word: (consider, require)}"""
+    words = {}
+    for index, value in bits:
+        word, bit = divmod(index, 64)
+        consider, require = words.get(word, (0, 0))
+        words[word] = (consider | 1 << bit, require | int(value) << bit)
+    return words
+
+
+def _bitset_require(data, words):
+    """Events of an (n_events, n_words) bitset whose considered bits have the required values"""
+    mask = numpy.ones(len(data), dtype=bool)
+    for word, (consider, require) in words.items():
+        mask &= (data[:, word] & numpy.uint64(consider)) == numpy.uint64(require)
+    return mask
+
+
+def _bitset_any(data, words):
+    """Events of an (n_events, n_words) bitset with any of the considered bits set"""
+    mask = numpy.zeros(len(data), dtype=bool)
+    for word, (consider, _) in words.items():
+        mask |= (data[:, word] & numpy.uint64(consider)) != 0
+    return mask
+
+
+def _selection_masks(data, indices, kind):
+    """Masks of the steps of an eager N-1 selection ("nminusone") or cutflow ("onecut", "cutflow")
+
+    They are computed from the packed selections, an integer vector or an (n_events, n_words)
+    bitset, and the bit indices of the cuts.
+    """
 
-                for i, mask in enumerate(self.result().masksonecut, 1):
-                    arr = dask_awkward.flatten(var[mask])
-                    honecut.fill(arr, dask_awkward.full_like(arr, i, dtype=int))
-                histsonecut.append(honecut)
+    def mask(bits, reducer):
+        if data.ndim == 2:
+            return reducer(data, _bitset_words((index, True) for index in bits))
+        consider = data.dtype.type(sum(1 << index for index in bits))
+        packed = data & consider
+        return packed == consider if reducer is _bitset_require else packed != 0
+
+    if kind == "nminusone":
+        return [
+            mask(indices[:i] + indices[i + 1 :], _bitset_require)
+            for i in range(len(indices))
+        ] + [mask(indices, _bitset_require)]
+    if kind == "onecut":
+        return [mask([index], _bitset_any) for index in indices]
+    return [mask(indices[: i + 1], _bitset_require) for i in range(len(indices))]
+
+
+def _bitset_add_partition(*arrays, start, nwords, has_data):
+    """Pack the selections in arrays (after the existing words, if has_data) from bit start on"""
+    if awkward.backend(arrays[-1]) == "typetracer":
+        out = numpy.empty((0, nwords), dtype=numpy.uint64)
+        return _from_numpy_partition(out, typetracer=True)
+    selections = arrays[1:] if has_data else arrays
+    out = numpy.zeros((len(arrays[-1]), nwords), dtype=numpy.uint64)
+    if has_data:
+        data = awkward.to_numpy(arrays[0])
+        out[:, : data.shape[1]] = data
+    for index, selection in enumerate(selections, start=start):
+        word, bit = divmod(index, 64)
+        numpy.bitwise_or(
+            out[:, word],
+            numpy.uint64(1 << bit),
+            where=awkward.to_numpy(selection),
+            out=out[:, word],
+        )
+    return _from_numpy_partition(out, typetracer=False)
 
-                for i, mask in enumerate(self.result().maskscutflow, 1):
-                    arr = dask_awkward.flatten(var[mask])
-                    hcutflow.fill(arr, dask_awkward.full_like(arr, i, dtype=int))
-                histscutflow.append(hcutflow)
 
-        return histsonecut, histscutflow, labels
+def _bitset_mask_partition(data, *, words, reducer):
+    if awkward.backend(data) == "typetracer":
+        return awkward.Array(
+            awkward.Array(numpy.empty(0, dtype=bool)).layout.to_typetracer(
+                forget_length=True
+            )
+        )
+    return awkward.Array(reducer(awkward.to_numpy(data), words))
 
 
 class PackedSelection:
@@ -1076,6 +1959,14 @@ class PackedSelection:
             is ``uint32``, which allows up to 32 booleans to be stored, but
             if a smaller or larger number of selections needs to be stored,
             one can choose ``uint16`` or ``uint64`` instead.
+            With ``"bitset"``, any number of selections can be stored, in an
+            (number of events, number of words) array of ``uint64`` words
+            which gains a word every 64 selections.
+        cache_size : int, optional
+            maximum number of masks memoized by ``require``, ``all``, ``allfalse`` and ``any``
+            (0 to disable the memo). Default is 32.
+        cache_bytes : int, optional
+            maximum total size in bytes of the memoized masks. Default is 64 MiB.
     """
 
     _supported_types = {
@@ -1084,15 +1975,29 @@ class PackedSelection:
         numpy.dtype("uint64"): 64,
     }
 
-    def __init__(self, dtype="uint32"):
-        self._dtype = numpy.dtype(dtype)
+    def __init__(self, dtype="uint32", cache_size=32, cache_bytes=64 * 1024**2):
+        self._bitset = isinstance(dtype, str) and dtype == "bitset"
+        self._dtype = numpy.dtype("uint64" if self._bitset else dtype)
         if self._dtype not in PackedSelection._supported_types:
             raise ValueError(f"dtype {dtype} is not supported")
         self._names = []
+        self._pending = []
         self._data = None
+        self._memo = _Memo(cache_size, cache_bytes)
+
+    @property
+    def _data(self):
+        """The packed selections, including the delayed selections pending in a bitset"""
+        if self._pending:
+            self.__pack_pending()
+        return self._packed
+
+    @_data.setter
+    def _data(self, data):
+        self._packed = data
 
     def __repr__(self):
-        delayed_mode = None if self._data is None else self.delayed_mode
+        delayed_mode = None if not self._names else self.delayed_mode
         return f"PackedSelection(selections={tuple(self._names)}, delayed_mode={delayed_mode}, items={len(self._names)}, maxitems={self.maxitems})"
 
     @property
@@ -1102,7 +2007,7 @@ class PackedSelection:
 
     @property
     def delayed_mode(self):
-        if isinstance(self._data, dask_awkward.Array):
+        if self._pending or isinstance(self._data, dask_awkward.Array):
             return True
         elif isinstance(self._data, numpy.ndarray):
             return False
@@ -1114,8 +2019,49 @@ class PackedSelection:
 
     @property
     def maxitems(self):
+        """Maximum number of selections, None if unlimited"""
+        if self._bitset:
+            return None
         return PackedSelection._supported_types[self._dtype]
 
+    def __add_bitset_delayed(self, name, selection):
+        """Add a new delayed boolean array to a bitset
+
+        The selections are only packed when the packed array is used, all those added
+        in the meantime by a single layer.
+        """
+        self._pending.append(selection)
+        self._names.append(name)
+
+    def __pack_pending(self):
+        """Pack the delayed selections pending in a bitset"""
+        pending, self._pending = self._pending, []
+        data = () if self._packed is None else (self._packed,)
+        self._packed = dask_awkward.map_partitions(
+            _bitset_add_partition,
+            *data,
+            *pending,
+            start=len(self._names) - len(pending),
+            nwords=(len(self._names) + 63) // 64,
+            has_data=len(data) > 0,
+            label="packed-selection-add",
+        )
+
+    def __add_bitset_eager(self, name, selection):
+        """Add a new eager boolean array to a bitset"""
+        word, bit = divmod(len(self._names), 64)
+        if word == self._data.shape[1]:
+            data = numpy.zeros((len(self._data), word + 1), dtype=numpy.uint64)
+            data[:, :word] = self._data
+            self._data = data
+        numpy.bitwise_or(
+            self._data[:, word],
+            numpy.uint64(1 << bit),
+            where=selection,
+            out=self._data[:, word],
+        )
+        self._names.append(name)
+
     def __add_delayed(self, name, selection, fill_value):
         """Add a new delayed boolean array"""
         selection = coffea.util._ensure_flat(selection, allow_missing=True)
@@ -1125,6 +2071,8 @@ class PackedSelection:
             sel_type = dask_awkward.type(selection)
         if sel_type.primitive != "bool":
             raise ValueError(f"Expected a boolean array, received {sel_type.primitive}")
+        if len(self._names) == 0 and self._bitset:
+            return self.__add_bitset_delayed(name, selection)
         if len(self._names) == 0:
             self._data = dask_awkward.zeros_like(selection, dtype=self._dtype)
         if isinstance(selection, dask_awkward.Array) and not self.delayed_mode:
@@ -1135,10 +2083,14 @@ class PackedSelection:
             raise RuntimeError(
                 f"Exhausted all slots in PackedSelection: {self}, consider a larger dtype or fewer selections"
             )
-        elif not dask_awkward.lib.core.compatible_partitions(self._data, selection):
+        elif not dask_awkward.lib.core.compatible_partitions(
+            self._pending[0] if self._pending else self._data, selection
+        ):
             raise ValueError(
                 f"New selection '{name}' has a different partition structure than existing selections"
             )
+        if self._bitset:
+            return self.__add_bitset_delayed(name, selection)
         self._data = numpy.bitwise_or(
             self._data,
             selection * self._dtype.type(1 << len(self._names)),
@@ -1153,7 +2105,8 @@ class PackedSelection:
         if selection.dtype != bool:
             raise ValueError(f"Expected a boolean array, received {selection.dtype}")
         if len(self._names) == 0:
-            self._data = numpy.zeros(len(selection), dtype=self._dtype)
+            shape = (len(selection), 1) if self._bitset else len(selection)
+            self._data = numpy.zeros(shape, dtype=self._dtype)
         if isinstance(selection, numpy.ndarray) and self.delayed_mode:
             raise ValueError(
                 f"New selection '{name}' is not delayed while PackedSelection is!"
@@ -1162,10 +2115,12 @@ class PackedSelection:
             raise RuntimeError(
                 f"Exhausted all slots in PackedSelection: {self}, consider a larger dtype or fewer selections"
             )
-        elif self._data.shape != selection.shape:
+        elif self._data.shape[:1] != selection.shape:
             raise ValueError(
-                f"New selection '{name}' has a different shape than existing selections ({selection.shape} vs. {self._data.shape})"
+                f"New selection '{name}' has a different shape than existing selections ({selection.shape} vs. {self._data.shape[:1]})"
             )
+        if self._bitset:
+            return self.__add_bitset_eager(name, selection)
         numpy.bitwise_or(
             self._data,
             self._dtype.type(1 << len(self._names)),
@@ -1194,6 +2149,7 @@ class PackedSelection:
                 "Dask arrays are not supported, please convert them to dask_awkward.Array by using dask_awkward.from_dask_array()"
             )
         selection = coffea.util._ensure_flat(selection, allow_missing=True)
+        self._memo.clear()
         if isinstance(selection, numpy.ndarray):
             self.__add_eager(name, selection, fill_value)
         elif isinstance(selection, dask_awkward.Array):
@@ -1212,7 +2168,6 @@ class PackedSelection:
         for name, selection in selections.items():
             self.add(name, selection, fill_value)
 
-    @lru_cache
     def require(self, **names):
         """Return a mask vector corresponding to specific requirements
 
@@ -1244,16 +2199,88 @@ class PackedSelection:
                 raise ValueError(
                     "All arguments must be strings that refer to the names of existing selections"
                 )
+        names = frozenset((name, bool(val)) for name, val in names.items())
+        return self._memo.get(("require", names), lambda: self._require(names))
 
+    def _require(self, names):
+        if self._bitset:
+            return self.__bitset_mask(names, _bitset_require)
         consider = 0
         require = 0
-        for name, val in names.items():
-            val = bool(val)
+        for name, val in names:
             idx = self._names.index(name)
             consider |= 1 << idx
             require |= int(val) << idx
         return (self._data & self._dtype.type(consider)) == require
 
+    def __bitset_mask(self, names, reducer):
+        """Mask of the events of the bitset, reduced word by word"""
+        words = _bitset_words((self._names.index(name), val) for name, val in names)
+        if not self.delayed_mode:
+            return reducer(self._data, words)
+        return dask_awkward.map_partitions(
+            _bitset_mask_partition,
+            self._data,
+            words=words,
+            reducer=reducer,
+            label="packed-selection-mask",
+        )
+
+    def __weight_variations(self, weights, modifiers):
+        """The variation labels and the weights (a vector, or a matrix of variations) to sum"""
+        if weights is None:
+            if modifiers is not None:
+                raise ValueError("modifiers can only be given with a Weights object")
+            return None, None
+        if isinstance(weights, Weights):
+            modifiers = [] if modifiers is None else list(modifiers)
+            variations = ["nominal"] + modifiers
+            weights = weights.weight_matrix(modifiers, nominal=True)
+        elif modifiers is not None:
+            raise ValueError("modifiers can only be given with a Weights object")
+        else:
+            variations = ["nominal"]
+            weights = coffea.util._ensure_flat(weights)
+        if self.delayed_mode:
+            if not isinstance(weights, dask_awkward.Array) or not compatible_partitions(
+                self._data, weights
+            ):
+                raise ValueError(
+                    "The weights must be a dask_awkward.Array with the same partition structure as the selections"
+                )
+        elif not isinstance(weights, numpy.ndarray) or len(weights) != len(self._data):
+            raise ValueError(
+                f"The weights must be a numpy.ndarray with the same length as the selections ({len(self._data)})"
+            )
+        return variations, weights
+
+    def __counts(self, names, weights=None, nvariations=0):
+        """Cutflow and N-1 counts of the named selections, see ``_selection_counts``
+
+        In delayed mode, the counts of each partition are computed by a single task, and summed.
+        The sums of weights are returned as a (2, n_variations, n_counts) array in eager mode, and
+        as a flat array in delayed mode.
+        """
+        indices = [self._names.index(name) for name in names]
+        size = 3 * len(names) + 2
+        if not self.delayed_mode:
+            counts, sums = _selection_counts(self._data, indices, weights)
+            if sums is not None:
+                sums = sums.reshape(2, nvariations, size)
+            return counts.tolist(), sums
+        weights = () if weights is None else (weights,)
+        partitions = dask_awkward.map_partitions(
+            _selection_counts_partition,
+            self._data,
+            *weights,
+            indices=indices,
+            nvariations=nvariations,
+            label="packed-selection-counts",
+        )
+        counts = dask_awkward.sum(partitions.counts, axis=0)
+        sums = dask_awkward.sum(partitions.sums, axis=0) if weights else None
+        return [counts[i] for i in range(size)], sums
+
     def all(self, *names):
         """Shorthand for `require`, where all the values are True.
         If no arguments are given, all the added selections are required to be True.
@@ -1298,13 +2325,19 @@ class PackedSelection:
                 raise ValueError(
                     "All arguments must be strings that refer to the names of existing selections"
                 )
+        names = frozenset(names)
+        return self._memo.get(("any", names), lambda: self._any(names))
+
+    def _any(self, names):
+        if self._bitset:
+            return self.__bitset_mask(((name, True) for name in names), _bitset_any)
         consider = 0
         for name in names:
             idx = self._names.index(name)
             consider |= 1 << idx
         return (self._data & self._dtype.type(consider)) != 0
 
-    def nminusone(self, *names):
+    def nminusone(self, *names, weights=None, modifiers=None):
         """Compute the "N-1" style selection for a set of selections
 
         The N-1 style selection for a set of selections, returns an object which can return a list of the number of events
@@ -1320,6 +2353,12 @@ class PackedSelection:
         ----------
             ``*names`` : args
                 The named selections to use, need to be a subset of the selections already added
+            weights : numpy.ndarray or dask_awkward.Array or Weights, optional
+                If given, the sums of weights and of squared weights of the events of each step are
+                computed along with the numbers of events, see ``NminusOne.weighted_result``
+            modifiers : list of str, optional
+                If ``weights`` is a ``Weights`` object, the systematic variations of the event weight
+                to sum in addition to the nominal weight
 
         Returns
         -------
@@ -1332,24 +2371,31 @@ class PackedSelection:
                     "All arguments must be strings that refer to the names of existing selections"
                 )
 
-        masks = []
-        for i, cut in enumerate(names):
-            mask = self.all(*(names[:i] + names[i + 1 :]))
-            masks.append(mask)
-        mask = self.all(*names)
-        masks.append(mask)
-
-        if not self.delayed_mode:
-            nev = [len(self._data)]
-            nev.extend(numpy.sum(masks, axis=1))
-
-        else:
-            nev = [dask_awkward.count(self._data, axis=0)]
-            nev.extend([dask_awkward.sum(mask) for mask in masks])
-
-        return NminusOne(names, nev, masks, self.delayed_mode)
+        variations, weights = self.__weight_variations(weights, modifiers)
+        counts, sums = self.__counts(names, weights, len(variations or ()))
+        steps = [0] + list(range(2 * len(names) + 1, 3 * len(names) + 2))
+        nev = [counts[i] for i in steps]
+
+        # eager masks are only computed if needed
+        return NminusOne(
+            names,
+            nev,
+            (
+                [self.all(*(names[:i] + names[i + 1 :])) for i in range(len(names))]
+                + [self.all(*names)]
+                if self.delayed_mode
+                else None
+            ),
+            self.delayed_mode,
+            (
+                _WeightedYields(variations, sums, 3 * len(names) + 2, self.delayed_mode)
+                if variations is not None
+                else None
+            ),
+            (self._data, [self._names.index(name) for name in names]),
+        )
 
-    def cutflow(self, *names):
+    def cutflow(self, *names, weights=None, modifiers=None):
         """Compute the cutflow for a set of selections
 
         Returns an object which can return a list of the number of events that pass all the previous selections including the current one
@@ -1364,6 +2410,12 @@ class PackedSelection:
         ----------
             ``*names`` : args
                 The named selections to use, need to be a subset of the selections already added
+            weights : numpy.ndarray or dask_awkward.Array or Weights, optional
+                If given, the sums of weights and of squared weights of the events of each step are
+                computed along with the numbers of events, see ``Cutflow.weighted_result``
+            modifiers : list of str, optional
+                If ``weights`` is a ``Weights`` object, the systematic variations of the event weight
+                to sum in addition to the nominal weight
 
         Returns
         -------
@@ -1376,25 +2428,221 @@ class PackedSelection:
                     "All arguments must be strings that refer to the names of existing selections"
                 )
 
-        masksonecut, maskscutflow = [], []
-        for i, cut in enumerate(names):
-            mask1 = self.any(cut)
-            mask2 = self.all(*(names[: i + 1]))
-            masksonecut.append(mask1)
-            maskscutflow.append(mask2)
+        variations, weights = self.__weight_variations(weights, modifiers)
+        counts, sums = self.__counts(names, weights, len(variations or ()))
+        nevonecut = counts[:1] + counts[1 : len(names) + 1]
+        nevcutflow = counts[:1] + counts[len(names) + 1 : 2 * len(names) + 1]
 
-        if not self.delayed_mode:
-            nevonecut = [len(self._data)]
-            nevcutflow = [len(self._data)]
-            nevonecut.extend(numpy.sum(masksonecut, axis=1))
-            nevcutflow.extend(numpy.sum(maskscutflow, axis=1))
+        masksonecut, maskscutflow = None, None
+        if self.delayed_mode:
+            masksonecut = [self.any(cut) for cut in names]
+            maskscutflow = [self.all(*(names[: i + 1])) for i in range(len(names))]
+        # eager masks are only computed if needed
+        return Cutflow(
+            names,
+            nevonecut,
+            nevcutflow,
+            masksonecut,
+            maskscutflow,
+            self.delayed_mode,
+            (
+                _WeightedYields(variations, sums, 3 * len(names) + 2, self.delayed_mode)
+                if variations is not None
+                else None
+            ),
+            (self._data, [self._names.index(name) for name in names]),
+        )
 
-        else:
-            nevonecut = [dask_awkward.count(self._data, axis=0)]
-            nevcutflow = [dask_awkward.count(self._data, axis=0)]
-            nevonecut.extend([dask_awkward.sum(mask1) for mask1 in masksonecut])
-            nevcutflow.extend([dask_awkward.sum(mask2) for mask2 in maskscutflow])
 
-        return Cutflow(
-            names, nevonecut, nevcutflow, masksonecut, maskscutflow, self.delayed_mode
+def _book_fill_partition(*inputs, histrefs, fills):
+    """Fill empty copies of histrefs with all the fills of a ``HistogramBook``, for one partition
+
+    Each array is masked once for all the fills sharing the array and the mask, and jagged
+    values are broadcast with the other values and the weight of their fill and flattened.
+    """
+    inputs = [awkward.typetracer.length_zero_if_typetracer(array) for array in inputs]
+    masked = {}
+
+    def get(index, mask):
+        if (index, mask) not in masked:
+            array = inputs[index]
+            masked[index, mask] = array if mask is None else array[inputs[mask]]
+        return masked[index, mask]
+
+    hists = [histref.copy().reset() for histref in histrefs]
+    for histogram, mask, weight, names, indices, constants in fills:
+        arrays = [get(index, mask) for index in indices]
+        if weight is not None:
+            arrays.append(get(weight, mask))
+        if any(getattr(array, "ndim", 1) > 1 for array in arrays):
+            arrays = [
+                awkward.flatten(array, axis=None)
+                for array in awkward.broadcast_arrays(*arrays)
+            ]
+        arrays = [awkward.to_numpy(array) for array in arrays]
+        kwargs = {} if weight is None else {"weight": arrays.pop()}
+        hists[histogram].fill(**dict(zip(names, arrays)), **constants, **kwargs)
+    return tuple(hists)
+
+
+class HistogramBook:
+    """Histograms whose fills are collected and executed together
+
+    The histograms of an analysis are booked with ``book`` and filled with ``fill``, which
+    only records the request. When the result is requested, all the fills are executed by
+    a single function that masks each array once per mask and fills all the histograms. In
+    delayed mode, this is a single task per partition, instead of separate tasks for each
+    fill of each ``hist.dask.Hist``.
+
+    Parameters
+    ----------
+        delayed : bool, optional
+            Whether the fills are of ``dask_awkward.Array`` objects, to return ``hist.dask.Hist``
+            histograms, or of in-memory arrays, to return ``hist.Hist`` histograms. Default is true.
+    """
+
+    def __init__(self, delayed=True):
+        self._delayed = delayed
+        self._histrefs = {}
+        self._fills = []
+
+    def __repr__(self):
+        return f"HistogramBook(histograms={list(self._histrefs)}, fills={len(self._fills)})"
+
+    @property
+    def names(self):
+        """The names of the booked histograms"""
+        return list(self._histrefs)
+
+    def book(self, name, histogram):
+        """Book a histogram
+
+        Parameters
+        ----------
+            name : str
+                The name of the histogram
+            histogram : hist.Hist or hist.dask.Hist
+                An empty histogram, with the axes, storage and metadata of the histogram to fill
+        """
+        if name in self._histrefs:
+            raise ValueError(f"A histogram named {name} is already booked")
+        self._histrefs[name] = hist.Hist(
+            *histogram.axes,
+            storage=histogram.storage_type(),
+            metadata=histogram.metadata,
         )
+
+    def fill(self, name, mask=None, weight=None, **values):
+        """Request to fill a booked histogram
+
+        Parameters
+        ----------
+            name : str
+                The name of the histogram
+            mask : numpy.ndarray or dask_awkward.Array, optional
+                The boolean mask of the events to fill
+            weight : numpy.ndarray or dask_awkward.Array, optional
+                The weight of the events
+            **values : numpy.ndarray or awkward.Array or dask_awkward.Array or str or number
+                The values to fill, for each axis of the histogram, or a single value for all the
+                events. Jagged values are broadcast with the other values and the weight and
+                flattened.
+        """
+        if name not in self._histrefs:
+            raise ValueError(f"No histogram named {name} is booked")
+        if set(values) != set(self._histrefs[name].axes.name):
+            raise ValueError(
+                f"Provide one array of values for each axis of the histogram {name}"
+            )
+        arrays = [
+            *(x for x in values.values() if not isinstance(x, (str, numbers.Number))),
+            *(x for x in (mask, weight) if x is not None),
+        ]
+        for array in arrays:
+            if isinstance(array, dask_awkward.Array) != self._delayed:
+                raise ValueError(
+                    "The arrays must be dask_awkward.Array objects in delayed mode, and in-memory arrays otherwise"
+                )
+        self._fills.append((name, mask, weight, values))
+
+    def __plan(self):
+        """The unique input arrays, and the fills as indices of the histograms and arrays"""
+        inputs, indices = [], {}
+
+        def index(array):
+            if array is None:
+                return None
+            key = array.name if self._delayed else id(array)
+            if key not in indices:
+                indices[key] = len(inputs)
+                inputs.append(array)
+            return indices[key]
+
+        names = list(self._histrefs)
+        fills = []
+        for name, mask, weight, values in self._fills:
+            constants = {
+                axis: value
+                for axis, value in values.items()
+                if isinstance(value, (str, numbers.Number))
+            }
+            arrays = {
+                axis: value for axis, value in values.items() if axis not in constants
+            }
+            fills.append(
+                (
+                    names.index(name),
+                    index(mask),
+                    index(weight),
+                    list(arrays),
+                    [index(array) for array in arrays.values()],
+                    constants,
+                )
+            )
+        return inputs, fills
+
+    def result(self):
+        """Returns the filled histograms
+
+        Returns
+        -------
+            hists : dict of hist.Hist or hist.dask.Hist
+                The histograms by name. In delayed mode, the ``hist.dask.Hist`` histograms are
+                computed from the same tasks, filling all the histograms of each partition.
+        """
+        inputs, fills = self.__plan()
+        histrefs = list(self._histrefs.values())
+        if not self._delayed:
+            hists = _book_fill_partition(*inputs, histrefs=histrefs, fills=fills)
+            return dict(zip(self._histrefs, hists))
+        if not inputs:
+            raise ValueError("HistogramBook needs at least one delayed fill")
+        for array in inputs[1:]:
+            if not compatible_partitions(inputs[0], array):
+                raise IncompatiblePartitions("HistogramBook", inputs[0], array)
+
+        name = "histogram-book-" + dask.base.tokenize(inputs, histrefs, fills)
+        layer = dask_awkward.lib.core.partitionwise_layer(
+            _book_fill_partition, name, *inputs, histrefs=histrefs, fills=fills
+        )
+        graph = dask.highlevelgraph.HighLevelGraph.from_collections(
+            name, layer, dependencies=inputs
+        )
+        hists = {}
+        for i, (key, histref) in enumerate(self._histrefs.items()):
+            pick = f"{name}-{i}"
+            layers = dict(graph.layers)
+            layers[pick] = dask.highlevelgraph.MaterializedLayer(
+                {
+                    (pick, partition): (operator.getitem, (name, partition), i)
+                    for partition in range(inputs[0].npartitions)
+                }
+            )
+            dependencies = dict(graph.dependencies, **{pick: {name}})
+            hists[key] = _partitioned_hist(
+                dask.highlevelgraph.HighLevelGraph(layers, dependencies),
+                pick,
+                inputs[0].npartitions,
+                histref,
+            )
+        return hists
@@ -1,4 +1,9 @@
-from coffea.dataset_tools.apply_processor import apply_to_dataset, apply_to_fileset
+from coffea.dataset_tools.apply_processor import (
+    apply_to_dataset,
+    apply_to_fileset,
+    compute_with_checkpoints,
+    compute_with_dynamic_steps,
+)
 from coffea.dataset_tools.manipulations import (
     filter_files,
     get_failed_steps_for_dataset,
@@ -14,6 +19,8 @@ __all__ = [
     "preprocess",
     "apply_to_dataset",
     "apply_to_fileset",
+    "compute_with_checkpoints",
+    "compute_with_dynamic_steps",
     "max_chunks",
     "slice_chunks",
     "filter_files",
@@ -1,11 +1,22 @@
 from __future__ import annotations
 
+import concurrent.futures
 import copy
+import itertools
+import math
+import time
+import tracemalloc
+from functools import partial
 from typing import Any, Callable, Dict, Hashable, List, Set, Tuple, Union
 
 import awkward
 import dask.base
+import dask.utils
 import dask_awkward
+import distributed
+import numpy
+import uproot
+from uproot._util import no_filter
 
 from coffea.dataset_tools.preprocess import (
     DatasetSpec,
@@ -14,8 +25,9 @@ from coffea.dataset_tools.preprocess import (
     FilesetSpecOptional,
 )
 from coffea.nanoevents import BaseSchema, NanoAODSchema, NanoEventsFactory
-from coffea.processor import ProcessorABC
-from coffea.util import decompress_form
+from coffea.nanoevents.locality import annotate_input_layers
+from coffea.processor import CheckpointStore, ProcessorABC, accumulate
+from coffea.util import _remove_not_interpretable, compress_form, decompress_form
 
 DaskOutputBaseType = Union[
     dask.base.DaskMethodsMixin,
@@ -37,6 +49,8 @@ def apply_to_dataset(
     schemaclass: BaseSchema = NanoAODSchema,
     metadata: dict[Hashable, Any] = {},
     uproot_options: dict[str, Any] = {},
+    data_locality: dict[str, str | list[str]] | Callable[[str], Any] | None = None,
+    locality_annotation: str = "workers",
 ) -> DaskOutputType | tuple[DaskOutputType, dask_awkward.Array]:
     """
     Apply the supplied function or processor to the supplied dataset.
@@ -52,6 +66,10 @@ def apply_to_dataset(
             Metadata for the dataset that is accessible by the input analysis. Should also be dask-serializable.
         uproot_options: dict[str, Any], default {}
             Options to pass to uproot. Pass at least {"allow_read_errors_with_report": True} to turn on file access reports.
+        data_locality: dict[str, str | list[str]] | Callable[[str], Any] | None, default None
+            Mapping from PFN prefixes to the hosts close to the data, used to annotate the input tasks.
+        locality_annotation: str, default "workers"
+            Type of data-locality annotation, "workers" or "resources".
 
     Returns
     -------
@@ -70,6 +88,8 @@ def apply_to_dataset(
         schemaclass=schemaclass,
         known_base_form=maybe_base_form,
         uproot_options=uproot_options,
+        data_locality=data_locality,
+        locality_annotation=locality_annotation,
     ).events()
 
     report = None
@@ -84,6 +104,16 @@ def apply_to_dataset(
     else:
         raise ValueError("data_manipulation must either be a ProcessorABC or Callable")
 
+    if data_locality is not None:
+        # annotate the input tasks of the final graph, which are fused with their dependents
+        collections, repack = dask.base.unpack_collections(out)
+        (out,) = repack(
+            [
+                annotate_input_layers(collection, data_locality, locality_annotation)
+                for collection in collections
+            ]
+        )
+
     if report is not None:
         return out, report
     return (out,)
@@ -94,6 +124,8 @@ def apply_to_fileset(
     fileset: FilesetSpec | FilesetSpecOptional,
     schemaclass: BaseSchema = NanoAODSchema,
     uproot_options: dict[str, Any] = {},
+    data_locality: dict[str, str | list[str]] | Callable[[str], Any] | None = None,
+    locality_annotation: str = "workers",
 ) -> dict[str, DaskOutputType] | tuple[dict[str, DaskOutputType], dask_awkward.Array]:
     """
     Apply the supplied function or processor to the supplied fileset (set of datasets).
@@ -107,6 +139,10 @@ def apply_to_fileset(
             The nanoevents schema to interpret the input dataset with.
         uproot_options: dict[str, Any], default {}
             Options to pass to uproot. Pass at least {"allow_read_errors_with_report": True} to turn on file access reports.
+        data_locality: dict[str, str | list[str]] | Callable[[str], Any] | None, default None
+            Mapping from PFN prefixes to the hosts close to the data, used to annotate the input tasks.
+        locality_annotation: str, default "workers"
+            Type of data-locality annotation, "workers" or "resources".
 
     Returns
     -------
@@ -118,12 +154,14 @@ def apply_to_fileset(
     out = {}
     report = {}
     for name, dataset in fileset.items():
-        metadata = copy.deepcopy(dataset.get("metadata", {}))
-        if metadata is None:
-            metadata = {}
-        metadata.setdefault("dataset", name)
         dataset_out = apply_to_dataset(
-            data_manipulation, dataset, schemaclass, metadata, uproot_options
+            data_manipulation,
+            dataset,
+            schemaclass,
+            _dataset_metadata(name, dataset),
+            uproot_options,
+            data_locality,
+            locality_annotation,
         )
         if isinstance(dataset_out, tuple) and len(dataset_out) > 1:
             out[name], report[name] = dataset_out
@@ -132,3 +170,413 @@ def apply_to_fileset(
     if len(report) > 0:
         return out, report
     return out
+
+
+def _file_form(filename, object_path, uproot_options):
+    array = uproot.dask(
+        {filename: object_path},
+        ak_add_doc=True,
+        filter_name=no_filter,
+        filter_typename=no_filter,
+        filter_branch=partial(_remove_not_interpretable, emit_warning=False),
+        **uproot_options,
+    )
+    if isinstance(array, tuple):
+        # (array, report) with allow_read_errors_with_report
+        array = array[0]
+    return compress_form(array.layout.form.to_json())
+
+
+def _dataset_metadata(name, dataset):
+    """The metadata passed to the analysis of a dataset, including its name"""
+    metadata = copy.deepcopy(dataset.get("metadata", {}))
+    if metadata is None:
+        metadata = {}
+    metadata.setdefault("dataset", name)
+    return metadata
+
+
+def _step_dataset(dataset, filename, info, step, forms, uproot_options):
+    """A copy of a dataset restricted to one step of one of its files
+
+    Unless the dataset has a form, the form of the file is read once and cached in ``forms``.
+    """
+    step_dataset = dict(dataset)
+    if step_dataset.get("form", None) is None:
+        if filename not in forms:
+            forms[filename] = _file_form(filename, info["object_path"], uproot_options)
+        step_dataset["form"] = forms[filename]
+    step_dataset["files"] = {filename: dict(info, steps=[list(step)])}
+    return step_dataset
+
+
+def _repack_first(repack, *results):
+    return repack(results)[0]
+
+
+def _compute_as_completed(collections, max_in_flight):
+    """Compute (tag, collection) pairs, yielding the (tag, result) pairs as they complete
+
+    At most ``max_in_flight`` collections are computed at the same time, using the default
+    distributed client if there is one (as futures), or else threads running the default dask
+    scheduler. A new collection is started as soon as another one completes.
+    """
+    collections = iter(collections)
+    try:
+        client = distributed.default_client()
+    except ValueError:
+        client = None
+
+    if client is not None:
+
+        def submit(collection):
+            # one future per collection, however many dask collections it contains
+            collections, repack = dask.base.unpack_collections(collection)
+            futures = client.compute(list(collections))
+            return client.submit(_repack_first, repack, *futures, pure=False)
+
+        tags = {}
+        futures = distributed.as_completed()
+        for tag, collection in itertools.islice(collections, max_in_flight):
+            future = submit(collection)
+            tags[future] = tag
+            futures.add(future)
+        for future in futures:
+            yield tags.pop(future), future.result()
+            future.release()
+            for tag, collection in itertools.islice(collections, 1):
+                future = submit(collection)
+                tags[future] = tag
+                futures.add(future)
+        return
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        in_flight = {}
+        for tag, collection in itertools.islice(collections, max_in_flight):
+            in_flight[executor.submit(dask.compute, collection)] = tag
+        while in_flight:
+            done, _ = concurrent.futures.wait(
+                in_flight, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                (result,) = future.result()
+                yield in_flight.pop(future), result
+            for tag, collection in itertools.islice(collections, len(done)):
+                in_flight[executor.submit(dask.compute, collection)] = tag
+
+
+def compute_with_checkpoints(
+    data_manipulation: ProcessorABC | GenericHEPAnalysis,
+    fileset: FilesetSpec,
+    checkpoint: CheckpointStore | str,
+    schemaclass: BaseSchema = NanoAODSchema,
+    uproot_options: dict[str, Any] = {},
+    max_in_flight: int = 16,
+) -> dict[str, Any] | tuple[dict[str, Any], dict[str, awkward.Array]]:
+    """
+    Apply the supplied function or processor to each step of the supplied fileset, compute it and merge the results.
+    The computed output of each step is stored in a checkpoint store as soon as it is available, and the steps
+    already present in the store are not computed again: an interrupted computation is resumed by calling this
+    function again with the same store.
+    The steps are computed concurrently, on the default distributed client if there is one: a new step is
+    started whenever one completes, so that a slow step does not hold back the others.
+    Parameters
+    ----------
+        data_manipulation : ProcessorABC or GenericHEPAnalysis
+            The user analysis code to run on the input dataset
+        fileset: FilesetSpec
+            The data to be acted upon by the data manipulation passed in, with the steps of each file.
+        checkpoint: CheckpointStore | str
+            The checkpoint store, or the directory of a local checkpoint store.
+        schemaclass: BaseSchema, default NanoAODSchema
+            The nanoevents schema to interpret the input dataset with.
+        uproot_options: dict[str, Any], default {}
+            Options to pass to uproot. Pass at least {"allow_read_errors_with_report": True} to turn on file access reports.
+        max_in_flight: int, default 16
+            Maximum number of steps computed at the same time, i.e. the maximum amount of work lost when the
+            computation is interrupted.
+
+    Returns
+    -------
+        out : dict[str, Any]
+            The computed output of the analysis workflow, merged over the steps of each dataset (see
+            ``coffea.processor.accumulate``), keyed by dataset name.
+        report : dict[str, awkward.Array], optional
+            The file access reports of the steps of each dataset, concatenated, if file access reports are turned on.
+            They are stored in the checkpoint store alongside the outputs.
+    """
+    if max_in_flight < 1:
+        raise ValueError("max_in_flight must be at least 1")
+    if not isinstance(checkpoint, CheckpointStore):
+        checkpoint = CheckpointStore(checkpoint)
+    with_report = bool(uproot_options.get("allow_read_errors_with_report", False))
+
+    out = {}
+    reports = {}
+
+    def merge(name, result):
+        if with_report:
+            result, report = result
+            reports.setdefault(name, []).append(report)
+        out[name] = accumulate([out.get(name, None), result], inplace=True)
+
+    def steps_to_compute():
+        for name, dataset in fileset.items():
+            metadata = _dataset_metadata(name, dataset)
+            forms = {}
+            for filename, info in dataset["files"].items():
+                for step in info["steps"]:
+                    key = CheckpointStore.key(
+                        name, filename, info.get("uuid", None), step
+                    )
+                    if key in checkpoint:
+                        merge(name, checkpoint.load(key))
+                        continue
+                    step_out = apply_to_dataset(
+                        data_manipulation,
+                        _step_dataset(
+                            dataset, filename, info, step, forms, uproot_options
+                        ),
+                        schemaclass,
+                        metadata,
+                        uproot_options,
+                    )
+                    yield (name, key), step_out if with_report else step_out[0]
+
+    for (name, key), result in _compute_as_completed(steps_to_compute(), max_in_flight):
+        checkpoint.save(key, result)
+        merge(name, result)
+
+    if with_report:
+        return out, {
+            name: awkward.concatenate(report) for name, report in reports.items()
+        }
+    return out
+
+
+def _measure_compute(collection, measure_memory):
+    """Compute a collection in the calling thread, measuring its wall time and peak traced memory"""
+    tracing = tracemalloc.is_tracing()
+    if measure_memory:
+        if not tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+    try:
+        tic = time.perf_counter()
+        (result,) = dask.compute(collection, scheduler="sync")
+        wall_time = time.perf_counter() - tic
+        peak_memory = None
+        if measure_memory:
+            peak_memory = tracemalloc.get_traced_memory()[1] - baseline
+    finally:
+        if measure_memory and not tracing:
+            tracemalloc.stop()
+    return result, wall_time, peak_memory
+
+
+def _fit_linear_cost(sizes, costs):
+    """(intercept, slope) of cost = intercept + slope * size, fitted to samples
+
+    The intercept accounts for the fixed cost of a step (e.g. opening the file and reading the
+    metadata), which does not grow with the step size. If it cannot be fitted (fewer than two
+    different sizes, or a cost not growing with the size), the cost is taken proportional to
+    the size.
+    """
+    sizes = numpy.asarray(sizes, dtype=numpy.float64)
+    costs = numpy.asarray(costs, dtype=numpy.float64)
+    if len(numpy.unique(sizes)) > 1:
+        slope, intercept = numpy.polyfit(sizes, costs, 1)
+        if slope * sizes.max() > 1e-6 * costs.max():
+            return max(intercept, 0.0), slope
+    return 0.0, numpy.median(costs / sizes)
+
+
+def _fit_step_size(samples, target_wall_time, target_memory):
+    """Largest step size meeting the targets, from (entries, wall time, peak memory) samples"""
+    samples = [sample for sample in samples if sample[0] > 0]
+    if len(samples) == 0:
+        return None
+    sizes = [n for n, _, _ in samples]
+    candidates = []
+    for target, costs in (
+        (target_wall_time, [wall_time for _, wall_time, _ in samples]),
+        (target_memory, [memory for _, _, memory in samples]),
+    ):
+        if target is None:
+            continue
+        intercept, slope = _fit_linear_cost(sizes, costs)
+        if target <= intercept:
+            # the fixed cost alone exceeds the target: take the cost proportional to the size
+            intercept, slope = 0.0, numpy.median(numpy.divide(costs, sizes))
+        if slope > 0:
+            candidates.append((target - intercept) / slope)
+    if len(candidates) == 0:
+        return None
+    # rounding errors of the fit should not cost an entry
+    return math.floor(min(candidates) + 1e-6)
+
+
+def _resize_steps(steps, step_size, skip=()):
+    """Merge the consecutive steps not in skip and split them again into steps of about step_size entries"""
+    ranges = []
+    for start, stop in steps:
+        if (start, stop) in skip:
+            continue
+        if ranges and ranges[-1][1] == start:
+            ranges[-1][1] = stop
+        else:
+            ranges.append([start, stop])
+
+    out = []
+    for start, stop in ranges:
+        n_steps = max(round((stop - start) / step_size), 1)
+        actual_step_size = math.ceil((stop - start) / n_steps)
+        out.extend(
+            [
+                start + i * actual_step_size,
+                min(start + (i + 1) * actual_step_size, stop),
+            ]
+            for i in range(n_steps)
+        )
+    return out
+
+
+def compute_with_dynamic_steps(
+    data_manipulation: ProcessorABC | GenericHEPAnalysis,
+    fileset: FilesetSpec,
+    target_wall_time: float | None = 60.0,
+    target_memory: int | str | None = None,
+    samples_per_dataset: int = 2,
+    min_step_size: int = 1,
+    max_step_size: int | None = None,
+    schemaclass: BaseSchema = NanoAODSchema,
+    uproot_options: dict[str, Any] = {},
+    scheduler: None | Callable | str = None,
+) -> tuple[dict[str, Any], dict[str, int | None]]:
+    """
+    Apply the supplied function or processor to the supplied fileset, with step sizes adapted to the cost of the analysis.
+    A few steps of each dataset, shortened to different sizes, are first computed one at a time in the calling
+    process, measuring their wall time and peak memory (traced by ``tracemalloc``). Both are fitted as a fixed cost
+    per step plus a cost per entry. The remaining entries of each dataset are then split into steps sized to take
+    about ``target_wall_time`` and to stay below ``target_memory``, and computed together.
+    Parameters
+    ----------
+        data_manipulation : ProcessorABC or GenericHEPAnalysis
+            The user analysis code to run on the input dataset
+        fileset: FilesetSpec
+            The data to be acted upon by the data manipulation passed in, with the steps of each file (as returned by
+            ``preprocess``). The sampled steps are taken from these steps, which should therefore be small enough
+            to be safely computed.
+        target_wall_time: float | None, default 60.0
+            The target wall time of each step, in seconds, as measured by computing one step in a single thread.
+        target_memory: int | str | None, default None
+            The maximum memory allocated by each step, in bytes or as a string (e.g. "2 GiB"). Measuring the memory
+            slows down the sampled steps.
+        samples_per_dataset: int, default 2
+            Number of steps of each dataset to sample, taken from different files where possible. At least two are
+            needed to measure the fixed cost of a step.
+        min_step_size: int, default 1
+            The smallest step size to use.
+        max_step_size: int | None, default None
+            If specified, the largest step size to use.
+        schemaclass: BaseSchema, default NanoAODSchema
+            The nanoevents schema to interpret the input dataset with.
+        uproot_options: dict[str, Any], default {}
+            Options to pass to uproot.
+        scheduler: None | Callable | str, default None
+            Specifies the scheduler that dask should use to compute the remaining steps.
+
+    Returns
+    -------
+        out : dict[str, Any]
+            The computed output of the analysis workflow, merged over the sampled and remaining steps of each dataset
+            (see ``coffea.processor.accumulate``), keyed by dataset name.
+        step_sizes : dict[str, int | None]
+            The step size chosen for each dataset, None if it could not be measured (the steps are then left
+            unchanged). ``preprocess`` takes a single ``step_size`` for all the datasets of a fileset, so for later
+            runs the datasets with different step sizes should be preprocessed separately.
+    """
+    if samples_per_dataset < 1:
+        raise ValueError("samples_per_dataset must be at least 1")
+    if isinstance(target_memory, str):
+        target_memory = dask.utils.parse_bytes(target_memory)
+
+    out = {}
+    step_sizes = {}
+    remaining = {}
+    for name, dataset in fileset.items():
+        metadata = _dataset_metadata(name, dataset)
+
+        # the first step of each file, then the second, ...
+        files = [(filename, info) for filename, info in dataset["files"].items()]
+        sampled = []
+        depth = 0
+        while len(sampled) < samples_per_dataset and any(
+            len(info["steps"]) > depth for _, info in files
+        ):
+            for filename, info in files:
+                if len(info["steps"]) > depth and len(sampled) < samples_per_dataset:
+                    sampled.append((filename, info, tuple(info["steps"][depth])))
+            depth += 1
+
+        # the sampled steps are shortened to different sizes, to tell the fixed cost of a
+        # step from its cost per entry; their remainders are computed with the other steps
+        splits = {}
+        samples = []
+        forms = {}
+        for i, (filename, info, step) in enumerate(sampled):
+            size = math.ceil((step[1] - step[0]) * (i + 1) / len(sampled))
+            sample_step = (step[0], step[0] + size)
+            splits.setdefault(filename, {})[step] = sample_step
+            step_out = apply_to_dataset(
+                data_manipulation,
+                _step_dataset(
+                    dataset, filename, info, sample_step, forms, uproot_options
+                ),
+                schemaclass,
+                metadata,
+                uproot_options,
+            )
+            result, wall_time, peak_memory = _measure_compute(
+                step_out[0], target_memory is not None
+            )
+            out[name] = accumulate([out.get(name, None), result], inplace=True)
+            samples.append((size, wall_time, peak_memory))
+
+        step_size = _fit_step_size(samples, target_wall_time, target_memory)
+        if step_size is not None:
+            step_size = max(step_size, min_step_size)
+            if max_step_size is not None:
+                step_size = min(step_size, max_step_size)
+        step_sizes[name] = step_size
+
+        rest_files = {}
+        for filename, info in files:
+            file_splits = splits.get(filename, {})
+            steps = []
+            for step in info["steps"]:
+                step = tuple(step)
+                if step in file_splits:
+                    step = (file_splits[step][1], step[1])
+                    if step[0] == step[1]:
+                        continue
+                steps.append(step)
+            skip = set(file_splits.values())
+            if step_size is None:
+                steps = [list(step) for step in steps]
+            else:
+                steps = _resize_steps(steps, step_size, skip)
+            if len(steps) > 0:
+                rest_files[filename] = dict(info, steps=steps)
+        if len(rest_files) > 0:
+            remaining[name] = dict(dataset, files=rest_files)
+
+    if len(remaining) > 0:
+        (computed,) = dask.compute(
+            apply_to_fileset(data_manipulation, remaining, schemaclass, uproot_options),
+            scheduler=scheduler,
+        )
+        for name, result in computed.items():
+            out[name] = accumulate([out.get(name, None), result], inplace=True)
+    return out, step_sizes
@@ -88,9 +88,24 @@ def get_indices_query(input_str: str, maxN: int) -> List[int]:
 
 
 class DataDiscoveryCLI:
-    def __init__(self):
+    def __init__(
+        self,
+        rucio_client=None,
+        max_workers=8,
+        replicas_cache_file=".replicas_cache.json",
+        replicas_cache_ttl=3600,
+    ):
+        """
+        rucio_client: rucio client shared by all the queries, created at the first query if not given
+        max_workers: maximum number of concurrent rucio queries
+        replicas_cache_file: persistent cache of the replicas queries (None to disable it)
+        replicas_cache_ttl: validity of the cached replicas in seconds
+        """
         self.console = Console()
-        self.rucio_client = None
+        self.rucio_client = rucio_client
+        self.max_workers = max_workers
+        self.replicas_cache_file = replicas_cache_file
+        self.replicas_cache_ttl = replicas_cache_ttl
         self.selected_datasets = []
         self.selected_datasets_metadata = []
         self.last_query = ""
@@ -99,6 +114,10 @@ class DataDiscoveryCLI:
         self.sites_allowlist = None
         self.sites_blocklist = None
         self.sites_regex = None
+        self.sites_xrootd_prefix = None
+        self.probe_reader = None
+        self.replicas_cost_model = None
+        self.max_site_fraction = None
         self.last_replicas_results = None
         self.final_output = None
         self.preprocessed_total = None
@@ -190,6 +209,11 @@ Some basic commands:
             self.rucio_client = rucio_utils.get_rucio_client()
         print(self.rucio_client)
 
+    def _get_client(self):
+        if self.rucio_client is None:
+            self.rucio_client = rucio_utils.get_rucio_client()
+        return self.rucio_client
+
     def do_whoami(self):
         # Your code here
         if not self.rucio_client:
@@ -206,15 +230,18 @@ Some basic commands:
         with self.console.status(f"Querying rucio for: [bold red]{query}[/]"):
             outlist, outtree = rucio_utils.query_dataset(
                 query,
-                client=self.rucio_client,
+                client=self._get_client(),
                 tree=True,
                 scope="cms",  # TODO configure scope
             )
-            # Now let's print the results as a tree
-            print_dataset_query(query, outtree, self.console, self.selected_datasets)
-            self.last_query = query
-            self.last_query_list = outlist
-            self.last_query_tree = outtree
+        self._set_query_results(query, outlist, outtree)
+
+    def _set_query_results(self, query, outlist, outtree):
+        # Now let's print the results as a tree
+        print_dataset_query(query, outtree, self.console, self.selected_datasets)
+        self.last_query = query
+        self.last_query_list = outlist
+        self.last_query_tree = outtree
         print("Use the command [bold red]select[/] to selected the datasets")
 
     def do_query_results(self):
@@ -285,6 +312,7 @@ Some basic commands:
               - round-robin (take files randomly from available sites),
               - choose: ask the user to choose from a list of sites
               - first: take the first site from the rucio query
+              - best: rank the sites by measured throughput and latency, balancing the load among sites
         selection: list of indices or 'all' to select all the selected datasets for replicas query
         """
         if selection is None:
@@ -299,27 +327,30 @@ Some basic commands:
             for ind in indices
         ]
 
+        with self.console.status(
+            f"Querying rucio for replicas of [bold red]{len(datasets)}[/] datasets"
+        ):
+            if self.sites_xrootd_prefix is None:
+                self.sites_xrootd_prefix = rucio_utils.get_xrootd_sites_map()
+            all_replicas = rucio_utils.get_datasets_files_replicas(
+                [dataset for dataset, _ in datasets],
+                allowlist_sites=self.sites_allowlist,
+                blocklist_sites=self.sites_blocklist,
+                regex_sites=self.sites_regex,
+                mode="full",
+                client=self._get_client(),
+                max_workers=self.max_workers,
+                cache_file=self.replicas_cache_file,
+                cache_ttl=self.replicas_cache_ttl,
+                sites_xrootd_prefix=self.sites_xrootd_prefix,
+            )
+
         for dataset, dataset_metadata in datasets:
-            with self.console.status(
-                f"Querying rucio for replicas: [bold red]{dataset}[/]"
-            ):
-                try:
-                    (
-                        outfiles,
-                        outsites,
-                        sites_counts,
-                    ) = rucio_utils.get_dataset_files_replicas(
-                        dataset,
-                        allowlist_sites=self.sites_allowlist,
-                        blocklist_sites=self.sites_blocklist,
-                        regex_sites=self.sites_regex,
-                        mode="full",
-                        client=self.rucio_client,
-                    )
-                except Exception as e:
-                    print(f"\n[red bold] Exception: {e}[/]")
-                    return
-                self.last_replicas_results = (outfiles, outsites, sites_counts)
+            if isinstance(all_replicas[dataset], Exception):
+                print(f"\n[red bold] Exception: {all_replicas[dataset]}[/]")
+                return
+            outfiles, outsites, sites_counts = all_replicas[dataset]
+            self.last_replicas_results = (outfiles, outsites, sites_counts)
 
             print(f"[cyan]Sites availability for dataset: [red]{dataset}")
             table = Table(title="Available replicas")
@@ -342,7 +373,7 @@ Some basic commands:
             if mode is None:
                 mode = Prompt.ask(
                     "Select sites",
-                    choices=["round-robin", "choose", "first", "quit"],
+                    choices=["round-robin", "choose", "first", "best", "quit"],
                     default="round-robin",
                 )
 
@@ -405,6 +436,33 @@ Some basic commands:
                 self.replica_results[dataset] = output
                 self.replica_results_metadata[dataset] = dataset_metadata
 
+            elif mode == "best":
+                with self.console.status(
+                    f"Probing sites for best replicas: [bold red]{dataset}[/]"
+                ):
+                    # the full listing only keeps the replicas on disk and available
+                    output, best_sites = rucio_utils.select_best_replicas(
+                        [
+                            [
+                                {
+                                    "pfn": f,
+                                    "site": s,
+                                    "type": "DISK",
+                                    "state": "AVAILABLE",
+                                }
+                                for f, s in zip(files, sites)
+                            ]
+                            for files, sites in zip(outfiles, outsites)
+                        ],
+                        probe_reader=self.probe_reader,
+                        cost_model=self.replicas_cost_model,
+                        max_site_fraction=self.max_site_fraction,
+                    )
+                for f, s in zip(output, best_sites):
+                    files_by_site[s].append(f)
+                self.replica_results[dataset] = output
+                self.replica_results_metadata[dataset] = dataset_metadata
+
             elif mode == "quit":
                 print("[orange]Doing nothing...")
                 return
@@ -577,12 +635,23 @@ Some basic commands:
             - "round-robin": select randomly from the available sites for each file
             - "choose": filter the sites with a list of indices for all the files
             - "first": take the first result returned by rucio
+            - "best": rank the sites by measured throughput and latency, balancing the load among sites
             - "manual": to be prompt for manual decision dataset by dataset
         """
+        with self.console.status(
+            f"Querying rucio for [bold red]{len(dataset_definition)}[/] datasets"
+        ):
+            all_queries = rucio_utils.query_datasets(
+                list(dataset_definition.keys()),
+                client=self._get_client(),
+                max_workers=self.max_workers,
+                tree=True,
+                scope="cms",
+            )
         for dataset_query, dataset_meta in dataset_definition.items():
             print(f"\nProcessing query: {dataset_query}")
             # Adding queries
-            self.do_query(dataset_query)
+            self._set_query_results(dataset_query, *all_queries[dataset_query])
             # Now selecting the results depending on the interactive mode or not.
             # Metadata are passed to the selection function to associated them with the selected dataset.
             if query_results_strategy not in ["all", "manual"]:
@@ -603,9 +672,9 @@ Some basic commands:
         if replicas_strategy == "manual":
             out_replicas = self.do_replicas(mode=None, selection="all")
         else:
-            if replicas_strategy not in ["round-robin", "choose", "first"]:
+            if replicas_strategy not in ["round-robin", "choose", "first", "best"]:
                 raise ValueError(
-                    "Invalid replicas-strategy: please choose between manual|round-robin|choose|first"
+                    "Invalid replicas-strategy: please choose between manual|round-robin|choose|first|best"
                 )
             out_replicas = self.do_replicas(mode=replicas_strategy, selection="all")
         # Now list all
@@ -682,13 +751,19 @@ if __name__ == "__main__":
     )
     parser.add_argument(
         "--replicas-strategy",
-        help="Mode for selecting replicas for datasets: [manual|round-robin|first|choose]",
+        help="Mode for selecting replicas for datasets: [manual|round-robin|first|choose|best]",
         default="round-robin",
         required=False,
     )
+    parser.add_argument(
+        "--max-workers",
+        help="Maximum number of concurrent rucio queries",
+        type=int,
+        default=8,
+    )
     args = parser.parse_args()
 
-    cli = DataDiscoveryCLI()
+    cli = DataDiscoveryCLI(max_workers=args.max_workers)
 
     if args.allow_sites:
         cli.sites_allowlist = args.allow_sites
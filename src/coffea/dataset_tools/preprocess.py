@@ -16,6 +16,7 @@ import numpy
 import uproot
 from uproot._util import no_filter
 
+from coffea.nanoevents.mapping import replicas_uproot_options
 from coffea.util import _remove_not_interpretable, compress_form, decompress_form
 
 
@@ -29,6 +30,8 @@ def get_steps(
     save_form: bool = False,
     step_size_safety_factor: float = 0.5,
     uproot_options: dict = {},
+    sums_object_path: str | None = None,
+    sums_branches: tuple[str] = (),
 ) -> awkward.Array | dask_awkward.Array:
     """
     Given a list of normalized file and object paths (defined in uproot), determine the steps for each file according to the supplied processing options.
@@ -53,6 +56,10 @@ def get_steps(
         step_size_safety_factor: float, default 0.5
             When using align_clusters, if a resulting step is larger than step_size by this factor
             warn the user that the resulting steps may be highly irregular.
+        sums_object_path: str | None, default None
+            If specified, the path of a (small) tree in each file whose sums_branches are summed over all entries.
+        sums_branches: tuple[str], default ()
+            The branches of sums_object_path to sum, missing branches result in NaN.
 
     Returns
     -------
@@ -143,33 +150,32 @@ def get_steps(
         if out_steps is not None and len(out_steps) == 0:
             out_steps = [[0, 0]]
 
-        array.append(
-            {
-                "file": arg.file,
-                "object_path": arg.object_path,
-                "steps": out_steps,
-                "num_entries": num_entries,
-                "uuid": out_uuid,
-                "form": form_json,
-                "form_hash_md5": form_hash,
-            }
-        )
+        item = {
+            "file": arg.file,
+            "object_path": arg.object_path,
+            "steps": out_steps,
+            "num_entries": num_entries,
+            "uuid": out_uuid,
+            "form": form_json,
+            "form_hash_md5": form_hash,
+        }
+        if sums_object_path is not None:
+            item["sums"] = _sum_branches(the_file, sums_object_path, sums_branches)
+        array.append(item)
 
     if len(array) == 0:
-        array = awkward.Array(
-            [
-                {
-                    "file": "junk",
-                    "object_path": "junk",
-                    "steps": [[0, 0]],
-                    "num_entries": 0,
-                    "uuid": "junk",
-                    "form": "junk",
-                    "form_hash_md5": "junk",
-                },
-                None,
-            ]
-        )
+        junk = {
+            "file": "junk",
+            "object_path": "junk",
+            "steps": [[0, 0]],
+            "num_entries": 0,
+            "uuid": "junk",
+            "form": "junk",
+            "form_hash_md5": "junk",
+        }
+        if sums_object_path is not None:
+            junk["sums"] = [0.0]
+        array = awkward.Array([junk, None])
         array = awkward.Array(array.layout.form.length_zero_array(highlevel=False))
     else:
         array = awkward.Array(array)
@@ -182,10 +188,31 @@ def get_steps(
     return array
 
 
+_nanoaod_sums_branches = ("genEventCount", "genEventSumw", "genEventSumw2")
+
+
+def _sum_branches(the_file, object_path, branches):
+    """Sum each of the branches over all the entries of object_path, NaN if missing"""
+    out = [math.nan] * len(branches)
+    if object_path not in the_file:
+        return out
+    tree = the_file[object_path]
+    for i, branch in enumerate(branches):
+        # older NanoAOD versions suffix the Runs tree branches with an underscore
+        for name in (branch, branch + "_"):
+            if name in tree:
+                values = tree[name].array(library="np")
+                if values.dtype != object:
+                    out[i] = float(numpy.sum(values, dtype="float64"))
+                break
+    return out
+
+
 @dataclass
 class UprootFileSpec:
     object_path: str
     steps: list[list[int]] | list[int] | None
+    replicas: list[str] | None
 
 
 @dataclass
@@ -220,6 +247,17 @@ FilesetSpecOptional = Dict[str, DatasetSpecOptional]
 FilesetSpec = Dict[str, DatasetSpec]
 
 
+def _file_replicas(file_info):
+    files = file_info["files"] if "files" in file_info else file_info
+    if not isinstance(files, dict):
+        return {}
+    return {
+        pfn: info["replicas"]
+        for pfn, info in files.items()
+        if isinstance(info, dict) and info.get("replicas")
+    }
+
+
 def _normalize_file_info(file_info):
     normed_files = None
     if isinstance(file_info, list) or (
@@ -249,6 +287,23 @@ def _normalize_file_info(file_info):
 _trivial_file_fields = {"run", "luminosityBlock", "event"}
 
 
+def _aggregate_sums(processed_files, object_path, branches):
+    files = {}
+    total = {"num_entries": 0}
+    for item in awkward.drop_none(
+        processed_files[["file", "num_entries", "sums"]]
+    ).to_list():
+        file_sums = {"num_entries": item["num_entries"]}
+        total["num_entries"] += item["num_entries"]
+        for branch, value in zip(branches, item["sums"]):
+            if math.isnan(value):
+                continue
+            file_sums[branch] = value
+            total[branch] = total.get(branch, 0.0) + value
+        files[item["file"]] = file_sums
+    return {"object_path": object_path, "total": total, "files": files}
+
+
 def preprocess(
     fileset: FilesetSpecOptional,
     step_size: None | int = None,
@@ -261,6 +316,8 @@ def preprocess(
     scheduler: None | Callable | str = None,
     uproot_options: dict = {},
     step_size_safety_factor: float = 0.5,
+    sums_object_path: None | str = None,
+    sums_branches: tuple[str] = _nanoaod_sums_branches,
 ) -> tuple[FilesetSpec, FilesetSpecOptional]:
     """
     Given a list of normalized file and object paths (defined in uproot), determine the steps for each file according to the supplied processing options.
@@ -286,10 +343,17 @@ def preprocess(
         scheduler: None | Callable | str, default None
             Specifies the scheduler that dask should use to execute the preprocessing task graph.
         uproot_options: dict, default {}
-            Options to pass to get_steps for opening files with uproot.
+            Options to pass to get_steps for opening files with uproot. Files with a ``replicas`` list
+            fail over to the next replica if they cannot be opened.
         step_size_safety_factor: float, default 0.5
             When using align_clusters, if a resulting step is larger than step_size by this factor
             warn the user that the resulting steps may be highly irregular.
+        sums_object_path: None | str, default None
+            If specified (e.g. "Runs" for NanoAOD), sum the sums_branches of this tree over all the entries of each file,
+            while the file is open for preprocessing. The per-file and per-dataset sums (and event counts) are stored
+            in the "sums" entry of each dataset metadata, avoiding an extra pass over the data for normalization.
+        sums_branches: tuple[str], default ("genEventCount", "genEventSumw", "genEventSumw2")
+            The branches of sums_object_path to sum. Branches missing in a file are not included in its sums.
     Returns
     -------
         out_available : FilesetSpec
@@ -324,12 +388,19 @@ def preprocess(
             file_exceptions=file_exceptions,
             save_form=save_form,
             step_size_safety_factor=step_size_safety_factor,
-            uproot_options=uproot_options,
+            sums_object_path=sums_object_path,
+            sums_branches=sums_branches,
+            uproot_options=(
+                replicas_uproot_options(info["files"], uproot_options)
+                if "files" in info
+                else replicas_uproot_options(info, uproot_options)
+            ),
         )
 
     (all_processed_files,) = dask.compute(files_to_preprocess, scheduler=scheduler)
 
     for name, processed_files in all_processed_files.items():
+        replicas = _file_replicas(fileset[name])
         processed_files_without_forms = processed_files[
             ["file", "object_path", "steps", "num_entries", "uuid"]
         ]
@@ -424,6 +495,11 @@ def preprocess(
                 "uuid": item["uuid"],
             }
 
+        for files in (files_available, files_out):
+            for pfn, finfo in files.items():
+                if pfn in replicas:
+                    finfo["replicas"] = list(replicas[pfn])
+
         if "files" in out_updated[name]:
             out_updated[name]["files"] = files_out
             out_available[name]["files"] = files_available
@@ -448,4 +524,12 @@ def preprocess(
             out_updated[name]["metadata"] = None
             out_available[name]["metadata"] = None
 
+        if sums_object_path is not None:
+            sums = _aggregate_sums(processed_files, sums_object_path, sums_branches)
+            for out in (out_updated, out_available):
+                metadata = out[name]["metadata"]
+                metadata = {} if metadata is None else metadata
+                metadata["sums"] = copy.deepcopy(sums)
+                out[name]["metadata"] = metadata
+
     return out_available, out_updated
@@ -1,11 +1,14 @@
 # import getpass
 import json
+import math
 import os
 import re
 import subprocess
 import time
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 
+import fsspec
 from rucio.client import Client
 
 # Rucio needs the default configuration --> taken from CMS cvmfs defaults
@@ -57,12 +60,48 @@ def get_rucio_client(proxy=None) -> Client:
         raise e
 
 
-def get_xrootd_sites_map():
+def _read_site_storage(site_name, conf):
+    """
+    Read the xrootd prefix rules of a site from its `storage.json` file.
+    Returns a list of (rse, rules) pairs.
+    """
+    if not os.path.exists(conf):
+        return []
+    try:
+        with open(conf) as file:
+            data = json.load(file)
+    except Exception:
+        return []
+    out = []
+    for site in data:
+        if site["type"] != "DISK":
+            continue
+        if site["rse"] is None:
+            continue
+        for proc in site["protocols"]:
+            if proc["protocol"] == "XRootD":
+                if proc["access"] not in ["global-ro", "global-rw"]:
+                    continue
+                if "prefix" not in proc:
+                    if "rules" in proc:
+                        out.append(
+                            (
+                                site["rse"],
+                                {rule["lfn"]: rule["pfn"] for rule in proc["rules"]},
+                            )
+                        )
+                else:
+                    out.append((site["rse"], proc["prefix"]))
+    return out
+
+
+def get_xrootd_sites_map(max_workers=16):
     """
     The mapping between RSE (sites) and the xrootd prefix rules is read
     from `/cvmfs/cms/cern.ch/SITECONF/*site*/storage.json`.
 
     This function returns the list of xrootd prefix rules for each site.
+    The `storage.json` files are read concurrently by a pool of `max_workers` threads.
     """
     sites_xrootd_access = defaultdict(dict)
     # Check if the cache file has been modified in the last 10 minutes
@@ -81,30 +120,16 @@ def get_xrootd_sites_map():
             for s in os.listdir("/cvmfs/cms.cern.ch/SITECONF/")
             if s.startswith("T")
         ]
-        for site_name, conf in sites:
-            if not os.path.exists(conf):
-                continue
-            try:
-                data = json.load(open(conf))
-            except Exception:
-                continue
-            for site in data:
-                if site["type"] != "DISK":
-                    continue
-                if site["rse"] is None:
-                    continue
-                for proc in site["protocols"]:
-                    if proc["protocol"] == "XRootD":
-                        if proc["access"] not in ["global-ro", "global-rw"]:
-                            continue
-                        if "prefix" not in proc:
-                            if "rules" in proc:
-                                for rule in proc["rules"]:
-                                    sites_xrootd_access[site["rse"]][rule["lfn"]] = (
-                                        rule["pfn"]
-                                    )
-                        else:
-                            sites_xrootd_access[site["rse"]] = proc["prefix"]
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            results = pool.map(lambda site: _read_site_storage(*site), sites)
+            for site_rules in results:
+                for rse, rules in site_rules:
+                    if isinstance(rules, dict):
+                        if not isinstance(sites_xrootd_access[rse], dict):
+                            sites_xrootd_access[rse] = {}
+                        sites_xrootd_access[rse].update(rules)
+                    else:
+                        sites_xrootd_access[rse] = rules
 
         json.dump(sites_xrootd_access, open(".sites_map.json", "w"))
 
@@ -128,6 +153,215 @@ def _get_pfn_for_site(path, rules):
         return rules + "/" + path.removeprefix("/")
 
 
+_site_performance_cache = {}
+
+
+def _default_probe_reader(pfn, nbytes):
+    with fsspec.open(pfn, "rb") as file:
+        return file.read(nbytes)
+
+
+def probe_site_performance(
+    site,
+    pfn,
+    probe_reader=None,
+    probe_bytes=1048576,
+    ttl=600,
+    cache=None,
+    clock=None,
+):
+    """
+    Measure the latency and throughput of a site by performing small probe reads
+    of one of its replicas. The result is cached per site for `ttl` seconds.
+
+    Parameters
+    ----------
+        site: str
+            Name of the site (RSE) being probed
+        pfn: str
+            Physical file name of a replica hosted at the site
+        probe_reader: callable, optional
+            Function `probe_reader(pfn, nbytes) -> bytes` used to perform the reads.
+            By default the file is opened with fsspec.
+        probe_bytes: int, default 1 MiB
+            Size of the read used to estimate the throughput
+        ttl: float, default 600
+            Validity of the cached measurement in seconds
+        cache: dict, optional
+            Cache of the measurements, by default a module-level one is used
+        clock: callable, optional
+            Function returning the current time in seconds used to time the reads,
+            by default `time.perf_counter`
+
+    Returns
+    -------
+        performance: dict
+            Dictionary with the "latency" (s) and "throughput" (bytes/s) measured for the site.
+            If the probe fails the latency and throughput are set to infinity and zero.
+    """
+    cache = _site_performance_cache if cache is None else cache
+    probe_reader = probe_reader if probe_reader else _default_probe_reader
+    clock = clock if clock else time.perf_counter
+    now = time.time()
+    if site in cache and now - cache[site]["timestamp"] < ttl:
+        return cache[site]
+
+    try:
+        start = clock()
+        probe_reader(pfn, 1)
+        latency = clock() - start
+        start = clock()
+        data = probe_reader(pfn, probe_bytes)
+        elapsed = clock() - start
+        throughput = len(data) / max(elapsed - latency, 1e-6)
+    except Exception:
+        latency = float("inf")
+        throughput = 0.0
+
+    cache[site] = {"latency": latency, "throughput": throughput, "timestamp": now}
+    return cache[site]
+
+
+def default_replica_cost(replica, performance):
+    """
+    Default cost model for the `best` replica selection: the expected time (s) needed to
+    read the full replica given the latency and throughput measured for its site.
+    Replicas that are not on disk or not available are strongly penalized, and replicas
+    on volatile storage (caches) are penalized.
+
+    Parameters
+    ----------
+        replica: dict
+            Replica information with keys "pfn", "site", "type", "state", "volatile" and "bytes".
+        performance: dict
+            Site performance as returned by `probe_site_performance`.
+    """
+    if performance["throughput"] <= 0:
+        return float("inf")
+    size = replica.get("bytes") or 1
+    cost = performance["latency"] + size / performance["throughput"]
+    if replica.get("type", "DISK") != "DISK":
+        cost *= 100
+    if replica.get("state", "AVAILABLE") != "AVAILABLE":
+        cost *= 100
+    if replica.get("volatile", False):
+        cost *= 10
+    return cost
+
+
+def select_best_replicas(
+    replicas,
+    probe_reader=None,
+    cost_model=None,
+    max_site_fraction=None,
+    probe_bytes=1048576,
+    probe_ttl=600,
+    probe_cache=None,
+):
+    """
+    Select one replica for each file ranking the sites with a cost model.
+
+    The sites are probed once (the measurements are cached with a TTL) and the cost of
+    each replica is computed with `cost_model`. Only the replicas on disk and available
+    are probed: the sites hosting none of them are passed to the cost model with an
+    infinite latency and no throughput. The files are then assigned greedily,
+    largest first, to the cheapest site, taking into account the load already assigned
+    to each site: the effective cost of a site grows with the number of files assigned to it,
+    and no site receives more than `max_site_fraction` of the files unless it is the only option.
+
+    Parameters
+    ----------
+        replicas: list
+            For each file, the list of replicas as dictionaries with keys
+            "pfn", "site" and optionally "type", "state", "volatile" and "bytes".
+        probe_reader: callable, optional
+            Reader used by `probe_site_performance`.
+        cost_model: callable, optional
+            Function `cost_model(replica, performance) -> float`, by default `default_replica_cost`.
+        max_site_fraction: float, optional
+            Maximum fraction of the files that can be read from a single site.
+        probe_bytes: int, default 1 MiB
+            Size of the probe read used to estimate the throughput.
+        probe_ttl: float, default 600
+            Validity of the cached site measurements in seconds.
+        probe_cache: dict, optional
+            Cache of the site measurements, by default a module-level one is used.
+
+    Returns
+    -------
+        files: list
+            The selected replica for each file
+        sites: list
+            The site of the selected replica for each file
+    """
+    cost_model = cost_model if cost_model else default_replica_cost
+    nfiles = len(replicas)
+    max_per_site = (
+        max(1, math.ceil(max_site_fraction * nfiles))
+        if max_site_fraction is not None
+        else nfiles
+    )
+
+    performance = {}
+    for file_replicas in replicas:
+        for replica in file_replicas:
+            # reading a replica on tape or not available could trigger a recall
+            if (
+                replica["site"] in performance
+                or replica.get("type", "DISK") != "DISK"
+                or replica.get("state", "AVAILABLE") != "AVAILABLE"
+            ):
+                continue
+            performance[replica["site"]] = probe_site_performance(
+                replica["site"],
+                replica["pfn"],
+                probe_reader=probe_reader,
+                probe_bytes=probe_bytes,
+                ttl=probe_ttl,
+                cache=probe_cache,
+            )
+
+    not_probed = {"latency": float("inf"), "throughput": 0.0}
+    costs = [
+        [
+            cost_model(replica, performance.get(replica["site"], not_probed))
+            for replica in file_replicas
+        ]
+        for file_replicas in replicas
+    ]
+
+    # Assign the most expensive files first so that they get the best sites
+    order = sorted(
+        range(nfiles),
+        key=lambda i: min(costs[i], default=float("inf")),
+        reverse=True,
+    )
+    site_load = defaultdict(float)
+    site_nfiles = defaultdict(int)
+    outfiles = [None] * nfiles
+    outsites = [None] * nfiles
+    for ifile in order:
+        candidates = [
+            i
+            for i, replica in enumerate(replicas[ifile])
+            if site_nfiles[replica["site"]] < max_per_site
+        ]
+        if not candidates:
+            candidates = list(range(len(replicas[ifile])))
+        best = min(
+            candidates,
+            key=lambda i: site_load[replicas[ifile][i]["site"]] + costs[ifile][i],
+        )
+        replica = replicas[ifile][best]
+        cost = costs[ifile][best]
+        site_load[replica["site"]] += cost if math.isfinite(cost) else 0.0
+        site_nfiles[replica["site"]] += 1
+        outfiles[ifile] = replica["pfn"]
+        outsites[ifile] = replica["site"]
+
+    return outfiles, outsites
+
+
 def get_dataset_files_replicas(
     dataset,
     allowlist_sites=None,
@@ -137,6 +371,10 @@ def get_dataset_files_replicas(
     partial_allowed=False,
     client=None,
     scope="cms",
+    sites_xrootd_prefix=None,
+    probe_reader=None,
+    cost_model=None,
+    max_site_fraction=None,
 ):
     """
     This function queries the Rucio server to get information about the location
@@ -150,7 +388,8 @@ def get_dataset_files_replicas(
     The fileset returned by the function is controlled by the `mode` parameter:
     - "full": returns the full set of replicas and sites (passing the filtering parameters)
     - "first": returns the first replica found for each file
-    - "best": to be implemented (ServiceX..)
+    - "best": returns the replica with the lowest cost for each file, see `select_best_replicas`.
+      The replicas on tape, volatile or not available are not discarded but ranked by the cost model.
     - "roundrobin": try to distribute the replicas over different sites
 
     Parameters
@@ -164,6 +403,14 @@ def get_dataset_files_replicas(
         client: rucio Client, optional
         partial_allowed: bool, default False
         scope:  rucio scope, "cms"
+        sites_xrootd_prefix: dict, optional
+            Mapping between sites and xrootd prefix rules, by default taken from `get_xrootd_sites_map`
+        probe_reader: callable, optional
+            Reader used to probe the sites in "best" mode, see `probe_site_performance`
+        cost_model: callable, optional
+            Cost model used to rank the replicas in "best" mode, see `default_replica_cost`
+        max_site_fraction: float, optional
+            Maximum fraction of the files read from a single site in "best" mode
 
     Returns
     -------
@@ -171,47 +418,45 @@ def get_dataset_files_replicas(
            depending on the `mode` option.
            - If `mode=="full"`, returns the complete list of replicas for each file in the dataset
            - If `mode=="first"`, returns only the first replica for each file.
+           - If `mode=="best"`, returns only the best replica for each file.
 
         sites: list
            depending on the `mode` option.
            - If `mode=="full"`, returns the list of sites where the file replica is available for each file in the dataset
            - If `mode=="first"`, returns a list of sites for the first replica of each file.
+           - If `mode=="best"`, returns a list of sites for the best replica of each file.
 
         sites_counts: dict
            Metadata counting the coverage of the dataset by site
 
     """
-    sites_xrootd_prefix = get_xrootd_sites_map()
+    if mode not in ["full", "first", "best"]:
+        raise NotImplementedError(f"Mode {mode} not yet implemented!")
+    if sites_xrootd_prefix is None:
+        sites_xrootd_prefix = get_xrootd_sites_map()
     client = client if client else get_rucio_client()
     outsites = []
     outfiles = []
+    outreplicas = []
+
+    def _usable(filedata, site):
+        if site not in sites_xrootd_prefix:
+            return False
+        if mode == "best":
+            # the storage type and state are part of the cost model
+            return True
+        # Check actual availability
+        meta = filedata["pfns"][filedata["rses"][site][0]]
+        return not (
+            meta["type"] != "DISK"
+            or meta["volatile"]
+            or filedata["states"][site] != "AVAILABLE"
+        )
+
     for filedata in client.list_replicas([{"scope": scope, "name": dataset}]):
-        outfile = []
-        outsite = []
         rses = filedata["rses"]
-        found = False
         if allowlist_sites:
-            for site in allowlist_sites:
-                if site in rses:
-                    # Check actual availability
-                    meta = filedata["pfns"][rses[site][0]]
-                    if (
-                        meta["type"] != "DISK"
-                        or meta["volatile"]
-                        or filedata["states"][site] != "AVAILABLE"
-                        or site not in sites_xrootd_prefix
-                    ):
-                        continue
-                    outfile.append(
-                        _get_pfn_for_site(filedata["name"], sites_xrootd_prefix[site])
-                    )
-                    outsite.append(site)
-                    found = True
-
-            if not found and not partial_allowed:
-                raise Exception(
-                    f"No SITE available in the allowlist for file {filedata['name']}"
-                )
+            selected_sites = [site for site in allowlist_sites if site in rses]
         else:
             possible_sites = list(rses.keys())
             if blocklist_sites:
@@ -223,53 +468,60 @@ def get_dataset_files_replicas(
                 raise Exception(f"No SITE available for file {filedata['name']}")
 
             # now check for regex
-            for site in possible_sites:
-                if regex_sites:
-                    if re.search(regex_sites, site):
-                        # Check actual availability
-                        meta = filedata["pfns"][rses[site][0]]
-                        if (
-                            meta["type"] != "DISK"
-                            or meta["volatile"]
-                            or filedata["states"][site] != "AVAILABLE"
-                            or site not in sites_xrootd_prefix
-                        ):
-                            continue
-                        outfile.append(
-                            _get_pfn_for_site(
-                                filedata["name"], sites_xrootd_prefix[site]
-                            )
-                        )
-                        outsite.append(site)
-                        found = True
-                else:
-                    # Just take the first one
-                    # Check actual availability
-                    meta = filedata["pfns"][rses[site][0]]
-                    if (
-                        meta["type"] != "DISK"
-                        or meta["volatile"]
-                        or filedata["states"][site] != "AVAILABLE"
-                        or site not in sites_xrootd_prefix
-                    ):
-                        continue
-                    outfile.append(
-                        _get_pfn_for_site(filedata["name"], sites_xrootd_prefix[site])
-                    )
-                    outsite.append(site)
-                    found = True
+            selected_sites = [
+                site
+                for site in possible_sites
+                if not regex_sites or re.search(regex_sites, site)
+            ]
 
+        outfile = []
+        outsite = []
+        outreplica = []
+        for site in selected_sites:
+            if not _usable(filedata, site):
+                continue
+            pfn = _get_pfn_for_site(filedata["name"], sites_xrootd_prefix[site])
+            meta = filedata["pfns"][rses[site][0]]
+            outfile.append(pfn)
+            outsite.append(site)
+            outreplica.append(
+                {
+                    "pfn": pfn,
+                    "site": site,
+                    "type": meta["type"],
+                    "state": filedata["states"][site],
+                    "volatile": meta["volatile"],
+                    "bytes": filedata.get("bytes", None),
+                }
+            )
+        found = len(outfile) > 0
+
+        if not found and allowlist_sites and not partial_allowed:
+            raise Exception(
+                f"No SITE available in the allowlist for file {filedata['name']}"
+            )
         if not found and not partial_allowed:
             raise Exception(f"No SITE available for file {filedata['name']}")
+
+        if mode == "full":
+            outfiles.append(outfile)
+            outsites.append(outsite)
+        elif not found:
+            # partial datasets: files without any usable replica are skipped
+            continue
+        elif mode == "first":
+            outfiles.append(outfile[0])
+            outsites.append(outsite[0])
         else:
-            if mode == "full":
-                outfiles.append(outfile)
-                outsites.append(outsite)
-            elif mode == "first":
-                outfiles.append(outfile[0])
-                outsites.append(outsite[0])
-            else:
-                raise NotImplementedError(f"Mode {mode} not yet implemented!")
+            outreplicas.append(outreplica)
+
+    if mode == "best":
+        outfiles, outsites = select_best_replicas(
+            outreplicas,
+            probe_reader=probe_reader,
+            cost_model=cost_model,
+            max_site_fraction=max_site_fraction,
+        )
 
     # Computing replicas by site:
     sites_counts = defaultdict(int)
@@ -277,13 +529,136 @@ def get_dataset_files_replicas(
         for sites_by_file in outsites:
             for site in sites_by_file:
                 sites_counts[site] += 1
-    elif mode == "first":
-        for site_by_file in outsites:
+    else:
+        for site in outsites:
             sites_counts[site] += 1
 
     return outfiles, outsites, sites_counts
 
 
+def _load_replicas_cache(cache_file, ttl):
+    if cache_file is None or not os.path.exists(cache_file):
+        return {}
+    try:
+        with open(cache_file) as file:
+            cache = json.load(file)
+    except Exception:
+        return {}
+    now = time.time()
+    return {
+        key: entry for key, entry in cache.items() if now - entry["timestamp"] < ttl
+    }
+
+
+def _save_replicas_cache(cache_file, cache):
+    # atomic write, so that concurrent sessions never read a partial cache
+    tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+    with open(tmp_file, "w") as file:
+        json.dump(cache, file)
+    os.replace(tmp_file, cache_file)
+
+
+def get_datasets_files_replicas(
+    datasets,
+    allowlist_sites=None,
+    blocklist_sites=None,
+    regex_sites=None,
+    mode="full",
+    partial_allowed=False,
+    client=None,
+    scope="cms",
+    max_workers=8,
+    cache_file=".replicas_cache.json",
+    cache_ttl=3600,
+    **kwargs,
+):
+    """
+    Bulk version of `get_dataset_files_replicas`: the replicas of a list of datasets are queried
+    concurrently by a bounded pool of threads sharing the same rucio client and sites map.
+
+    The results are cached in the json file `cache_file`, keyed by the dataset name (and the query options),
+    and reused for `cache_ttl` seconds. Pass `cache_file=None` to disable the cache.
+
+    Parameters
+    ----------
+        datasets: list
+            List of dataset names
+        allowlist_sites, blocklist_sites, regex_sites, mode, partial_allowed, scope:
+            see `get_dataset_files_replicas`
+        client: rucio Client, optional
+            Client shared by all the queries
+        max_workers: int, default 8
+            Maximum number of concurrent queries
+        cache_file: str, default ".replicas_cache.json"
+            Path of the persistent cache of the replicas results
+        cache_ttl: float, default 3600
+            Validity of the cached results in seconds
+        kwargs:
+            Other options passed to `get_dataset_files_replicas`
+
+    Returns
+    -------
+        results: dict
+            For each dataset, the tuple (files, sites, sites_counts) returned by `get_dataset_files_replicas`.
+            If the query for a dataset failed the exception is returned instead.
+    """
+    options = {
+        "allowlist_sites": allowlist_sites,
+        "blocklist_sites": blocklist_sites,
+        "regex_sites": regex_sites,
+        "mode": mode,
+        "partial_allowed": partial_allowed,
+        "scope": scope,
+    }
+    options_key = json.dumps(options, sort_keys=True)
+    # the "best" mode depends on live site measurements and it is not cached
+    use_cache = cache_file is not None and mode != "best"
+    cache = _load_replicas_cache(cache_file, cache_ttl) if use_cache else {}
+
+    results = {}
+    to_query = []
+    for dataset in datasets:
+        entry = cache.get(dataset, None)
+        if entry is not None and entry["options"] == options_key:
+            results[dataset] = (
+                entry["files"],
+                entry["sites"],
+                defaultdict(int, entry["sites_counts"]),
+            )
+        elif dataset not in to_query:
+            to_query.append(dataset)
+
+    if len(to_query) > 0:
+        client = client if client else get_rucio_client()
+        if kwargs.get("sites_xrootd_prefix", None) is None:
+            kwargs["sites_xrootd_prefix"] = get_xrootd_sites_map()
+
+        def _query(dataset):
+            try:
+                return get_dataset_files_replicas(
+                    dataset, client=client, **options, **kwargs
+                )
+            except Exception as e:
+                return e
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            for dataset, result in zip(to_query, pool.map(_query, to_query)):
+                results[dataset] = result
+                if use_cache and not isinstance(result, Exception):
+                    cache[dataset] = {
+                        "timestamp": time.time(),
+                        "options": options_key,
+                        "files": result[0],
+                        "sites": result[1],
+                        "sites_counts": dict(result[2]),
+                    }
+
+        if use_cache:
+            _save_replicas_cache(cache_file, cache)
+
+    return {dataset: results[dataset] for dataset in datasets}
+
+
 def query_dataset(
     query: str, client=None, tree: bool = False, datatype="container", scope="cms"
 ):
@@ -322,3 +697,29 @@ def query_dataset(
         return out, outdict
     else:
         return out
+
+
+def query_datasets(queries, client=None, max_workers=8, **kwargs):
+    """
+    Run several `query_dataset` queries concurrently with a bounded pool of threads
+    sharing the same rucio client.
+
+    Parameters
+    ---------
+        queries: list of str
+        client: rucio client
+        max_workers: int, default 8
+            Maximum number of concurrent queries
+        kwargs:
+            Options passed to `query_dataset`
+
+    Returns
+    -------
+       dict with the output of `query_dataset` for each query
+    """
+    client = client if client else get_rucio_client()
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        results = pool.map(
+            lambda query: query_dataset(query, client=client, **kwargs), queries
+        )
+        return dict(zip(queries, results))
@@ -1,32 +1,12 @@
+import numbers
 from copy import deepcopy
 
-import numba
 import numpy
 
+from coffea.lookup_tools.dense_mapped_lookup import dense_mapped_lookup
 from coffea.lookup_tools.lookup_base import lookup_base
 
 
-# methods for dealing with b-tag SFs
-@numba.jit(forceobj=True)
-def numba_apply_1d(functions, variables):
-    out = numpy.empty(variables.shape)
-    for i in range(functions.size):
-        out[i] = functions[i](variables[i])
-    return out
-
-
-def numbaize(fstr, varlist):
-    """
-    Convert function string to numba function
-    Supports only simple math for now
-    """
-
-    lstr = "lambda {}: {}".format(",".join(varlist), fstr)
-    func = eval(lstr, {"log": numpy.log, "sqrt": numpy.sqrt})
-    nfunc = numba.njit(func)
-    return nfunc
-
-
 # methods for dealing with b-tag SFs
 class dense_evaluated_lookup(lookup_base):
     def __init__(self, values, dims, feval_dim=None):
@@ -55,11 +35,9 @@ class dense_evaluated_lookup(lookup_base):
             raise Exception(
                 "Evaluation dimensions not specified in dense_evaluated_lookup"
             )
-        funcs = numpy.zeros(shape=values.shape, dtype="O")
-        for i in range(values.size):
-            idx = numpy.unravel_index(i, shape=values.shape)
-            funcs[idx] = numbaize(values[idx], ["x"])
-        self._values = deepcopy(funcs)
+        # each distinct formula is compiled once and evaluated on all its bins together
+        self._formulas, mapping = numpy.unique(values, return_inverse=True)
+        self._mapping = mapping.reshape(values.shape)
         # TODO: support for multidimensional functions and functions with variables other than 'x'
         if len(feval_dim) > 1:
             raise Exception(
@@ -74,7 +52,7 @@ class dense_evaluated_lookup(lookup_base):
                 numpy.clip(
                     numpy.searchsorted(self._axes, args[0], side="right") - 1,
                     0,
-                    self._values.shape[0] - 1,
+                    self._mapping.shape[0] - 1,
                 )
             )
         else:
@@ -84,11 +62,39 @@ class dense_evaluated_lookup(lookup_base):
                         numpy.searchsorted(self._axes[dim], args[dim], side="right")
                         - 1,
                         0,
-                        self._values.shape[len(self._axes) - dim - 1] - 1,
+                        self._mapping.shape[len(self._axes) - dim - 1] - 1,
                     )
                 )
         indices.reverse()
-        return numba_apply_1d(self._values[tuple(indices)], args[self._feval_dim])
+        mapidx = self._mapping[tuple(indices)]
+        out = numpy.empty(mapidx.shape)
+        for ifunc in numpy.unique(mapidx):
+            func = self._formulas[ifunc]
+            if not callable(func):
+                func = dense_mapped_lookup._compile(func)
+            where = mapidx == ifunc
+            if isinstance(func, numbers.Number):
+                out[where] = func
+            else:
+                out[where] = func(args[self._feval_dim][where])
+        return out
+
+    def __setstate__(self, state):
+        if "_values" in state:
+            # pickled by older versions, with the numba function of the formula of each bin:
+            # the functions compiled from the same formula are grouped as its formula
+            values = state.pop("_values")
+            formulas = {}
+            mapping = numpy.empty(values.shape, dtype=numpy.intp)
+            for idx, func in numpy.ndenumerate(values):
+                code = func.py_func.__code__
+                key = (code.co_code, code.co_consts, code.co_names)
+                mapping[idx] = formulas.setdefault(key, (len(formulas), func))[0]
+            state["_formulas"] = numpy.empty(len(formulas), dtype="O")
+            for ifunc, func in formulas.values():
+                state["_formulas"][ifunc] = func
+            state["_mapping"] = mapping
+        self.__dict__.update(state)
 
     def __repr__(self):
         myrepr = object.__repr__(self) + "\n"
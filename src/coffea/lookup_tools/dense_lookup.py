@@ -1,10 +1,72 @@
 from copy import deepcopy
 
+import numba
 import numpy
 
 from coffea.lookup_tools.lookup_base import lookup_base
 
 
+def _pack_axes(axes):
+    """Concatenate the bin edges of axes, and detect the axes with uniform binning
+
+    Returns the concatenated edges, the offset of the edges of each axis, and for each axis
+    the lower edge and the inverse bin width, or a zero inverse width for non-uniform axes.
+    """
+    edges = [numpy.asarray(axis, dtype=numpy.float64) for axis in axes]
+    offsets = numpy.cumsum([0] + [len(axis) for axis in edges])
+    lows = numpy.zeros(len(edges))
+    scales = numpy.zeros(len(edges))
+    for i, axis in enumerate(edges):
+        widths = numpy.diff(axis)
+        if len(widths) and numpy.all(widths > 0) and numpy.allclose(widths, widths[0]):
+            lows[i] = axis[0]
+            scales[i] = 1.0 / widths[0]
+    return numpy.concatenate(edges), offsets, lows, scales
+
+
+@numba.njit
+def _bin_index(x, edges, low, scale):
+    """The index of the bin of x, as ``numpy.searchsorted(edges, x, side="right") - 1``
+
+    For uniform binning (non-zero scale), the index is estimated arithmetically and then
+    corrected against the edges, so that values at the edges fall in the same bins.
+    """
+    nedges = len(edges)
+    if scale == 0.0 or x != x:
+        return numpy.searchsorted(edges, x, side="right") - 1
+    t = (x - low) * scale
+    if t < 0.0:
+        i = -1
+    elif t >= nedges - 1:
+        i = nedges - 1
+    else:
+        i = int(t)
+    while i >= 0 and x < edges[i]:
+        i -= 1
+    while i < nedges - 1 and x >= edges[i + 1]:
+        i += 1
+    return i
+
+
+@numba.njit
+def _dense_lookup_kernel(args, values, shape, edges, offsets, lows, scales):
+    """Look up the flat C-ordered values of shape at the bins of each tuple of args"""
+    out = numpy.empty(len(args[0]), dtype=values.dtype)
+    for j in range(len(out)):
+        index = 0
+        for dim in range(len(shape)):
+            i = _bin_index(
+                args[dim][j],
+                edges[offsets[dim] : offsets[dim + 1]],
+                lows[dim],
+                scales[dim],
+            )
+            i = min(max(i, 0), shape[dim] - 1)
+            index = index * shape[dim] + i
+        out[j] = values[index]
+    return out
+
+
 class dense_lookup(lookup_base):
     def __init__(self, values, dims, feval_dim=None):
         super().__init__()
@@ -29,10 +91,40 @@ class dense_lookup(lookup_base):
         if vals_are_strings:
             raise Exception("dense_lookup cannot handle string values!")
         self._values = deepcopy(values)
+        self._pack()
+
+    def _pack(self):
+        """Prepare the flat values and packed axes evaluated by ``_dense_lookup_kernel``"""
+        axes = [self._axes] if self._dimension == 1 else self._axes
+        if self._dimension == 1 and not isinstance(self._axes, numpy.ndarray):
+            axes = [self._axes[0]]
+        self._packed_axes = _pack_axes(axes)
+        self._flat_values = numpy.ascontiguousarray(self._values).reshape(-1)
+        self._shape = numpy.array(self._values.shape[: self._dimension])
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if "_packed_axes" not in state:
+            self._pack()
 
     def _evaluate(self, *args, **kwargs):
         if len(args) != self._dimension:
             raise ValueError(f"Insufficient arguments for correction {self}")
+        if self._values.ndim != self._dimension:
+            # values with more dimensions than axes are looked up by slices
+            return self._evaluate_slices(*args)
+        args = numpy.broadcast_arrays(*(numpy.asarray(arg) for arg in args))
+        shape = args[0].shape
+        args = tuple(
+            numpy.ascontiguousarray(arg, dtype=numpy.float64).reshape(-1)
+            for arg in args
+        )
+        out = _dense_lookup_kernel(
+            args, self._flat_values, self._shape, *self._packed_axes
+        ).reshape(shape)
+        return out[()] if out.ndim == 0 else out
+
+    def _evaluate_slices(self, *args):
         indices = []
         if self._dimension == 1:
             axes = (
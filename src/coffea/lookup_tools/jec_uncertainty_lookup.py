@@ -1,21 +1,31 @@
 from copy import deepcopy
 
+import numba
 import numpy
-from scipy.interpolate import interp1d
 
+from coffea.lookup_tools.jme_standard_function import pack_bins, packed_bin_eval
 from coffea.lookup_tools.lookup_base import lookup_base
 
 
 def masked_bin_eval(dim1_indices, dimN_bins, dimN_vals):
-    dimN_indices = numpy.empty_like(dim1_indices)
-    for i in numpy.unique(dim1_indices):
-        idx = numpy.where(dim1_indices == i)
-        dimN_indices[idx] = numpy.clip(
-            numpy.searchsorted(dimN_bins[i], dimN_vals[idx], side="right") - 1,
-            0,
-            len(dimN_bins[i]) - 2,
-        )
-    return dimN_indices
+    return packed_bin_eval(dim1_indices, *pack_bins(dimN_bins), dimN_vals)[0]
+
+
+@numba.njit
+def interpolate_updown(dim1_indices, knots, ups, downs, vals, outs):
+    """
+    Linearly interpolate the up and down uncertainties of each value in the knots of
+    its bin, adding them to (up) and subtracting them from (down) the two columns of outs
+    """
+    for j in range(len(dim1_indices)):
+        i = dim1_indices[j]
+        # same arithmetic as scipy.interpolate.interp1d
+        hi = min(max(numpy.searchsorted(knots, vals[j]), 1), len(knots) - 1)
+        lo = hi - 1
+        slope = (ups[i, hi] - ups[i, lo]) / (knots[hi] - knots[lo])
+        outs[j, 0] += slope * (vals[j] - knots[lo]) + ups[i, lo]
+        slope = (downs[i, hi] - downs[i, lo]) / (knots[hi] - knots[lo])
+        outs[j, 1] -= slope * (vals[j] - knots[lo]) + downs[i, lo]
 
 
 class jec_uncertainty_lookup(lookup_base):
@@ -41,8 +51,9 @@ class jec_uncertainty_lookup(lookup_base):
         self._bins = bins_and_orders[0]
         self._eval_vars = knots_and_vars[1]
         self._eval_knots = knots_and_vars[0]["knots"]
-        self._eval_downs = []
-        self._eval_ups = []
+        # up and down uncertainties at each knot, for each bin
+        self._eval_downs = numpy.asarray(knots_and_vars[0]["downs"])
+        self._eval_ups = numpy.asarray(knots_and_vars[0]["ups"])
         self._formula_str = formula.strip('"')
         self._formula = None
         if self._formula_str != "None" and self._formula_str != "":
@@ -51,21 +62,14 @@ class jec_uncertainty_lookup(lookup_base):
         for binname in self._dim_order[1:]:
             binsaslists = self._bins[binname].tolist()
             self._bins[binname] = [numpy.array(bins) for bins in binsaslists]
-
-        # convert downs and ups into interp1ds
-        # (yes this only works for one binning dimension right now, fight me)
-        for bin in range(self._bins[self._dim_order[0]].size - 1):
-            self._eval_downs.append(
-                interp1d(self._eval_knots, knots_and_vars[0]["downs"][bin])
-            )
-            self._eval_ups.append(
-                interp1d(self._eval_knots, knots_and_vars[0]["ups"][bin])
-            )
+        self._pack_bins()
 
         # get the jit to compile if we've got more than one bin dim
         if len(self._dim_order) > 1:
-            masked_bin_eval(
-                numpy.array([0]), self._bins[self._dim_order[1]], numpy.array([0.0])
+            packed_bin_eval(
+                numpy.array([0]),
+                *self._packed_bins[self._dim_order[1]],
+                numpy.array([0.0]),
             )
 
         self._signature = deepcopy(self._dim_order)
@@ -79,6 +83,20 @@ class jec_uncertainty_lookup(lookup_base):
             if argname in self._dim_args.keys():
                 self._eval_args[argname] = self._dim_args[argname]
 
+    def _pack_bins(self):
+        self._packed_bins = {
+            binname: pack_bins(self._bins[binname]) for binname in self._dim_order[1:]
+        }
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if "_packed_bins" not in state:
+            self._pack_bins()
+        if isinstance(self._eval_ups, list):
+            # older versions stored an interp1d for each bin
+            self._eval_downs = numpy.stack([interp.y for interp in self._eval_downs])
+            self._eval_ups = numpy.stack([interp.y for interp in self._eval_ups])
+
     def _evaluate(self, *args, **kwargs):
         """uncertainties = f(args)"""
         bin_vals = {
@@ -98,16 +116,14 @@ class jec_uncertainty_lookup(lookup_base):
         )
 
         # get clamp values and clip the inputs
+        # (yes this only works for one binning dimension right now, fight me)
         outs = numpy.ones(shape=(args[0].size, 2), dtype=numpy.float32)
-        for i in numpy.unique(dim1_indices):
-            mask = numpy.where(dim1_indices == i)
-            vals = numpy.clip(
-                eval_vals[self._eval_vars[0]][mask],
-                self._eval_knots[0],
-                self._eval_knots[-1],
-            )
-            outs[:, 0][mask] += self._eval_ups[i](vals)
-            outs[:, 1][mask] -= self._eval_downs[i](vals)
+        vals = numpy.clip(
+            eval_vals[self._eval_vars[0]], self._eval_knots[0], self._eval_knots[-1]
+        )
+        interpolate_updown(
+            dim1_indices, self._eval_knots, self._eval_ups, self._eval_downs, vals, outs
+        )
 
         return outs
 
@@ -2,19 +2,12 @@ from copy import deepcopy
 
 import numpy
 
+from coffea.lookup_tools.jme_standard_function import pack_bins, packed_bin_eval
 from coffea.lookup_tools.lookup_base import lookup_base
 
 
 def masked_bin_eval(dim1_indices, dimN_bins, dimN_vals):
-    dimN_indices = numpy.empty_like(dim1_indices)
-    for i in numpy.unique(dim1_indices):
-        idx = numpy.where(dim1_indices == i)
-        dimN_indices[idx] = numpy.clip(
-            numpy.searchsorted(dimN_bins[i], dimN_vals[idx], side="right") - 1,
-            0,
-            len(dimN_bins[i]) - 2,
-        )
-    return dimN_indices
+    return packed_bin_eval(dim1_indices, *pack_bins(dimN_bins), dimN_vals)[0]
 
 
 class jersf_lookup(lookup_base):
@@ -48,11 +41,14 @@ class jersf_lookup(lookup_base):
         for binname in self._dim_order[1:]:
             binsaslists = self._bins[binname].tolist()
             self._bins[binname] = [numpy.array(bins) for bins in binsaslists]
+        self._pack_bins()
 
         # get the jit to compile if we've got more than one bin dim
         if len(self._dim_order) > 1:
-            masked_bin_eval(
-                numpy.array([0]), self._bins[self._dim_order[1]], numpy.array([0.0])
+            packed_bin_eval(
+                numpy.array([0]),
+                *self._packed_bins[self._dim_order[1]],
+                numpy.array([0.0]),
             )
 
         self._signature = deepcopy(self._dim_order)
@@ -66,6 +62,16 @@ class jersf_lookup(lookup_base):
             if argname in self._dim_args.keys():
                 self._eval_args[argname] = self._dim_args[argname]
 
+    def _pack_bins(self):
+        self._packed_bins = {
+            binname: pack_bins(self._bins[binname]) for binname in self._dim_order[1:]
+        }
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if "_packed_bins" not in state:
+            self._pack_bins()
+
     def _evaluate(self, *args, **kwargs):
         """SFs = f(args)"""
         bin_vals = {
@@ -86,7 +92,9 @@ class jersf_lookup(lookup_base):
         bin_indices = [dim1_indices]
         for binname in self._dim_order[1:]:
             bin_indices.append(
-                masked_bin_eval(bin_indices[0], self._bins[binname], bin_vals[binname])
+                packed_bin_eval(
+                    bin_indices[0], *self._packed_bins[binname], bin_vals[binname]
+                )[0]
             )
         bin_tuple = tuple(bin_indices)
 
@@ -1,51 +1,119 @@
+import functools
+import hashlib
+import importlib.util
+import os
+import sys
+import tempfile
 from copy import deepcopy
 
 import awkward
+import numba
 import numpy
-from numpy import sqrt  # noqa: F401
-from numpy import abs, exp, log, log10  # noqa: F401
-from numpy import maximum as max  # noqa: F401
-from numpy import minimum as min  # noqa: F401
-from numpy import power as pow  # noqa: F401
-
-# we need to import these ahead of time for function parsing
-from scipy.special import erf  # noqa: F401
 
 from coffea.lookup_tools.lookup_base import lookup_base
 
+_formula_module = """import numba
+from math import erf
+from numpy import sqrt
+from numpy import abs, exp, log, log10
+from numpy import maximum as max
+from numpy import minimum as min
+from numpy import power as pow
+
+
+@numba.vectorize(["float32({float32s})", "float64({float64s})"], cache=True)
+def formula({args}):
+    return {formula}
+"""
+
+
+def _compile_kernel(source, name):
+    """
+    Compile the kernel defined in source in memory, or import it from the directory
+    given by the COFFEA_FORMULA_CACHE environment variable, where numba caches it on disk
+    """
+    cache_dir = os.environ.get("COFFEA_FORMULA_CACHE")
+    if cache_dir is not None:
+        path = os.path.join(cache_dir, name + ".py")
+        try:
+            if not os.path.exists(path):
+                os.makedirs(cache_dir, exist_ok=True)
+                with tempfile.NamedTemporaryFile(
+                    "w", dir=cache_dir, suffix=".py", delete=False
+                ) as fout:
+                    fout.write(source)
+                os.replace(fout.name, path)
+        except OSError:
+            cache_dir = None
+    if cache_dir is None:
+        namespace = {}
+        exec(source.replace("cache=True", "cache=False"), namespace)
+        return namespace["formula"]
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    # numba looks the module up by name when loading the cached kernel
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module.formula
+
+
+@functools.lru_cache(maxsize=None)
+def _compile_formula(fstr, varlist):
+    """Compile a formula of the variables in varlist to a single elementwise numba kernel"""
+    source = _formula_module.format(
+        float32s=", ".join("float32" for _ in varlist),
+        float64s=", ".join("float64" for _ in varlist),
+        args=", ".join(varlist),
+        formula=fstr,
+    )
+    return _compile_kernel(
+        source, "formula_" + hashlib.sha1(source.encode()).hexdigest()
+    )
+
 
 def wrap_formula(fstr, varlist):
     """
-    Convert function string to python function
+    Convert function string to a compiled elementwise function
     Supports only simple math for now
     """
-    val = fstr
     try:
         val = float(fstr)
-        fstr = f"numpy.full_like({varlist[0]},{val:f})"
+        return lambda *args: numpy.full_like(args[0], val)
     except ValueError:
-        val = fstr
-    lstr = "lambda {}: {}".format(",".join(varlist), fstr)
-    func = eval(lstr)
-    return func
+        return _compile_formula(fstr, tuple(varlist))
 
 
-def masked_bin_eval(dim1_indices, dimN_bins, dimN_vals):
-    dimN_indices = numpy.empty_like(dim1_indices)
-    dimN_overflows = numpy.empty_like(dim1_indices, dtype=bool)
-    for i in numpy.unique(dim1_indices):
-        idx = numpy.where(dim1_indices == i)
-        dimN_indices[idx] = numpy.clip(
-            numpy.searchsorted(dimN_bins[i], dimN_vals[idx], side="right") - 1,
-            0,
-            len(dimN_bins[i]) - 2,
-        )
-        dimN_overflows[idx] = (dimN_vals[idx] > numpy.amax(dimN_bins[i])) | (
-            dimN_vals[idx] < numpy.amin(dimN_bins[i])
-        )
+def pack_bins(dimN_bins):
+    """
+    Concatenate the bin edges of a dimension binned differently in each bin of the first
+    dimension, returning the edges and the offsets of the edges of each first dimension bin
+    """
+    offsets = numpy.cumsum([0] + [len(bins) for bins in dimN_bins])
+    edges = numpy.concatenate([numpy.asarray(bins) for bins in dimN_bins])
+    return edges.astype(numpy.float64), offsets
+
+
+@numba.njit
+def packed_bin_eval(dim1_indices, dimN_edges, dimN_offsets, dimN_vals):
+    """
+    Find the bin of each value in the bins of the corresponding first dimension bin,
+    with the edges packed by pack_bins, and whether the value is outside of those bins
+    """
+    dimN_indices = numpy.empty(len(dim1_indices), dtype=numpy.int64)
+    dimN_overflows = numpy.empty(len(dim1_indices), dtype=numpy.bool_)
+    for j in range(len(dim1_indices)):
+        i = dim1_indices[j]
+        bins = dimN_edges[dimN_offsets[i] : dimN_offsets[i + 1]]
+        index = numpy.searchsorted(bins, dimN_vals[j], side="right") - 1
+        dimN_indices[j] = min(max(index, 0), len(bins) - 2)
+        dimN_overflows[j] = (dimN_vals[j] > bins[-1]) | (dimN_vals[j] < bins[0])
     return dimN_indices, dimN_overflows
 
 
+def masked_bin_eval(dim1_indices, dimN_bins, dimN_vals):
+    return packed_bin_eval(dim1_indices, *pack_bins(dimN_bins), dimN_vals)
+
+
 # idx_in is a tuple of indices in increasing jaggedness
 # idx_out is a list of flat indices
 def flatten_idxs(idx_in, jaggedarray):
@@ -106,20 +174,16 @@ class jme_standard_function(lookup_base):
         for binname in self._dim_order[1:]:
             binsaslists = self._bins[binname].tolist()
             self._bins[binname] = [numpy.array(bins) for bins in binsaslists]
+        self._pack_bins()
 
         # get the jit to compile if we've got more than one bin dim
         if len(self._dim_order) > 1:
-            masked_bin_eval(
+            packed_bin_eval(
                 numpy.array([0, 0]),
-                self._bins[self._dim_order[1]],
+                *self._packed_bins[self._dim_order[1]],
                 numpy.array([0.0, 0.0]),
             )
 
-        # compile the formula
-        argsize = len(self._param_order) + len(self._eval_vars)
-        some_ones = tuple([50 * numpy.ones(argsize) for i in range(argsize)])
-        _ = self._formula(*some_ones)
-
         self._signature = deepcopy(self._dim_order)
         for eval in self._eval_vars:
             if eval not in self._signature:
@@ -131,6 +195,25 @@ class jme_standard_function(lookup_base):
             if argname in self._dim_args.keys():
                 self._eval_args[argname] = self._dim_args[argname]
 
+    def _pack_bins(self):
+        self._packed_bins = {
+            binname: pack_bins(self._bins[binname]) for binname in self._dim_order[1:]
+        }
+
+    def __getstate__(self):
+        # the compiled formula is rebuilt from its string when unpickled
+        state = dict(self.__dict__)
+        state.pop("_formula")
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._formula = wrap_formula(
+            self._formula_str, self._param_order + self._eval_vars
+        )
+        if "_packed_bins" not in state:
+            self._pack_bins()
+
     def _evaluate(self, *args, **kwargs):
         """jec/jer = f(args)"""
         bin_vals = {
@@ -153,8 +236,8 @@ class jme_standard_function(lookup_base):
         )
         bin_indices = [dim1_indices]
         for binname in self._dim_order[1:]:
-            dimN_indices, dimN_overflows = masked_bin_eval(
-                bin_indices[0], self._bins[binname], bin_vals[binname]
+            dimN_indices, dimN_overflows = packed_bin_eval(
+                bin_indices[0], *self._packed_bins[binname], bin_vals[binname]
             )
             bin_indices.append(dimN_indices)
             overflows |= dimN_overflows
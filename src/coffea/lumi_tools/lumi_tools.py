@@ -282,6 +282,8 @@ class LumiList:
     """
 
     def __init__(self, runs=None, lumis=None, delayed=True):
+        # eager arrays merged with +=, concatenated when the array is accessed
+        self._pending = []
         if (runs is None) != (lumis is None):
             raise ValueError(
                 "Both runs and lumis must be provided when given to the constructor of LumiList."
@@ -306,15 +308,37 @@ class LumiList:
             if runs is not None:
                 self.array = numpy.unique(numpy.c_[runs, lumis], axis=0)
 
+    @property
+    def array(self):
+        if self._pending:
+            self._array = numpy.unique(
+                numpy.concatenate([self._array] + self._pending), axis=0
+            )
+            self._pending = []
+        return self._array
+
+    @array.setter
+    def array(self, value):
+        self._array = value
+        self._pending = []
+
+    def __setstate__(self, state):
+        # objects pickled before the merges were deferred only hold array
+        state = dict(state)
+        if "array" in state:
+            state["_array"] = state.pop("array")
+        state.setdefault("_pending", [])
+        self.__dict__.update(state)
+
     def __iadd__(self, other):
-        # TODO: re-apply unique? Or wait until end
         if isinstance(other, LumiList):
-            if isinstance(self.array, dask_awkward.Array):
+            if isinstance(self._array, dask_awkward.Array):
                 self.array = _lumilist_dak_unique(
                     awkward.concatenate([self.array, other.array], axis=0)
                 )
             else:
-                self.array = numpy.r_[self.array, other.array]
+                # merging many lists one at a time would copy at every addition
+                self._pending.append(other.array)
         else:
             raise ValueError("Expected LumiList object, got %r" % other)
         return self
@@ -11,6 +11,7 @@ import dask_awkward
 import fsspec
 import uproot
 
+from coffea.nanoevents.locality import with_data_locality
 from coffea.nanoevents.mapping import (
     CachedMapping,
     ParquetSourceMapping,
@@ -19,6 +20,7 @@ from coffea.nanoevents.mapping import (
     TrivialParquetOpener,
     TrivialUprootOpener,
     UprootSourceMapping,
+    replicas_uproot_options,
 )
 from coffea.nanoevents.schemas import BaseSchema, NanoAODSchema
 from coffea.nanoevents.util import key_to_tuple, quote, tuple_to_key, unquote
@@ -232,6 +234,8 @@ class NanoEventsFactory:
         known_base_form=None,
         decompression_executor=None,
         interpretation_executor=None,
+        data_locality=None,
+        locality_annotation="workers",
     ):
         """Quickly build NanoEvents from a root file
 
@@ -260,7 +264,8 @@ class NanoEventsFactory:
             metadata : dict, optional
                 Arbitrary metadata to add to the `base.NanoEvents` object
             uproot_options : dict, optional
-                Any options to pass to ``uproot.open`` or ``uproot.dask``
+                Any options to pass to ``uproot.open`` or ``uproot.dask``. If any file in ``file`` carries
+                a ``replicas`` list, reads fail over to the next replica (see ``mapping.FailoverSource``).
             access_log : list, optional
                 Pass a list instance to record which branches were lazily accessed by this instance
             use_ak_forth:
@@ -273,6 +278,13 @@ class NanoEventsFactory:
                 see: https://github.com/scikit-hep/uproot5/blob/main/src/uproot/_dask.py#L109
             interpretation_executor (None or Executor with a ``submit`` method):
                 see: https://github.com/scikit-hep/uproot5/blob/main/src/uproot/_dask.py#L113
+            data_locality: dict or callable, optional (delayed mode only)
+                Mapping from PFN prefixes to the hosts close to the data (or a function of the PFN, see
+                ``locality.discover_data_locality``). The input tasks are annotated so that the dask scheduler
+                prefers those hosts.
+            locality_annotation: str, default "workers"
+                Type of data-locality annotation: "workers" (loose worker restrictions) or "resources"
+                (the mapped values are names of worker resources).
         """
 
         if treepath is not uproot._util.unset and not isinstance(
@@ -296,6 +308,8 @@ class NanoEventsFactory:
                 RuntimeWarning,
             )
 
+        uproot_options = replicas_uproot_options(file, uproot_options)
+
         if (
             delayed
             and not isinstance(schemaclass, FunctionType)
@@ -325,6 +339,13 @@ class NanoEventsFactory:
                 interpretation_executor=interpretation_executor,
                 **uproot_options,
             )
+            if data_locality is not None:
+                opener = partial(
+                    with_data_locality,
+                    opener,
+                    data_locality=data_locality,
+                    annotation=locality_annotation,
+                )
 
             return cls(map_schema, opener, None, cache=None, is_dask=True)
         elif delayed and not schemaclass.__dask_capable__:
@@ -0,0 +1,221 @@
+"""Data-locality annotations for the input tasks of delayed NanoEvents
+
+The input layer of a delayed NanoEvents collection reads one step of one file per partition.
+Given a mapping from physical file name (PFN) prefixes to hosts, the tasks of this layer are
+annotated so that the dask distributed scheduler prefers the workers close to the data
+(e.g. co-located with the storage or with a site cache).
+"""
+
+import copy
+from collections import defaultdict
+from urllib.parse import urlparse
+
+from dask.blockwise import Blockwise
+from dask.highlevelgraph import HighLevelGraph
+from dask_awkward.layers import AwkwardInputLayer
+
+
+def hosts_for_file(pfn, data_locality):
+    """Find the hosts close to a file
+
+    Parameters
+    ----------
+        pfn : str
+            The physical file name
+        data_locality : dict[str, str | list[str]] or Callable[[str], str | list[str] | None]
+            Mapping from PFN prefixes to the host(s) close to the files starting with that prefix,
+            the longest matching prefix is used. Alternatively, a function of the PFN.
+
+    Returns
+    -------
+        hosts : list[str] | None
+            The hosts close to the file, or None if unknown
+    """
+    if callable(data_locality):
+        hosts = data_locality(pfn)
+    else:
+        matches = [prefix for prefix in data_locality if pfn.startswith(prefix)]
+        if len(matches) == 0:
+            return None
+        hosts = data_locality[max(matches, key=len)]
+    if hosts is None:
+        return None
+    if isinstance(hosts, str):
+        return [hosts]
+    return list(hosts)
+
+
+def discover_data_locality(client, port=None):
+    """Build a data-locality mapping from the workers of a dask distributed cluster
+
+    Files served over xrootd (``root://``) or http(s) by a host which also runs a dask worker
+    are mapped to that host.
+
+    Parameters
+    ----------
+        client : distributed.Client
+            The client connected to the cluster
+        port : int, optional
+            If given, only map the storage endpoints on this port
+
+    Returns
+    -------
+        data_locality : Callable[[str], list[str] | None]
+            A function of the PFN, usable as ``data_locality`` argument
+    """
+    workers = client.scheduler_info()["workers"]
+    hosts = {urlparse(address).hostname for address in workers}
+    hosts |= {info.get("host", None) for info in workers.values()}
+    hosts.discard(None)
+    return _WorkerHostsLocality(frozenset(hosts), port)
+
+
+class _WorkerHostsLocality:
+    def __init__(self, hosts, port):
+        self.hosts = hosts
+        self.port = port
+
+    def __call__(self, pfn):
+        url = urlparse(pfn)
+        if url.scheme not in ("root", "roots", "http", "https"):
+            return None
+        if self.port is not None and url.port != self.port:
+            return None
+        if url.hostname in self.hosts:
+            return [url.hostname]
+        return None
+
+
+class _PartitionAnnotation:
+    """Annotation value for each key of a layer, from a per-partition list"""
+
+    def __init__(self, values):
+        self.values = values
+
+    def __call__(self, key):
+        if isinstance(key, tuple) and len(key) > 1 and isinstance(key[-1], int):
+            if key[-1] < len(self.values):
+                return self.values[key[-1]]
+        return None
+
+
+def locality_annotations(files, data_locality, annotation="workers"):
+    """Build the dask annotations of an input layer reading ``files``
+
+    Parameters
+    ----------
+        files : list[str]
+            The PFN read by each partition
+        data_locality : dict or Callable
+            See ``hosts_for_file``
+        annotation : str, default "workers"
+            "workers" to restrict the tasks to the hosts close to the data (loose restrictions,
+            other workers are allowed when those are busy or missing), "resources" to require
+            one unit of the resource named as the mapped value (e.g. a site name advertised by
+            the workers with ``--resources``).
+
+    Returns
+    -------
+        annotations : dict
+    """
+    if annotation not in ("workers", "resources"):
+        raise ValueError(
+            f"Invalid data-locality annotation {annotation!r}, use workers or resources"
+        )
+    cache = {}
+    hosts = []
+    for pfn in files:
+        if pfn not in cache:
+            cache[pfn] = hosts_for_file(pfn, data_locality)
+        hosts.append(cache[pfn])
+
+    if annotation == "workers":
+        return {
+            "workers": _PartitionAnnotation(hosts),
+            "allow_other_workers": _PartitionAnnotation(
+                [None if h is None else True for h in hosts]
+            ),
+        }
+    return {
+        "resources": _PartitionAnnotation(
+            [None if h is None else {name: 1 for name in h} for h in hosts]
+        )
+    }
+
+
+def annotate_input_layers(collection, data_locality, annotation="workers"):
+    """Attach data-locality annotations to the tasks reading the uproot input layers of a dask collection
+
+    The input layers are fused with the partition-wise (blockwise) layers that depend on them
+    during graph optimization, and dask only fuses layers with identical annotations, so the
+    annotations are attached to the input layers and to all those layers. Calling this function
+    on the final outputs of an analysis therefore keeps the annotations on the tasks reading
+    the data, after optimization.
+
+    Parameters
+    ----------
+        collection : dask collection
+            A collection depending on uproot input layers, e.g. delayed NanoEvents or the output of
+            an analysis
+        data_locality : dict or Callable
+            See ``hosts_for_file``
+        annotation : str, default "workers"
+            See ``locality_annotations``
+
+    Returns
+    -------
+        collection : dask collection
+            A copy of the collection whose graph carries the annotations. The input collection is
+            not modified.
+    """
+    graph = collection.__dask_graph__()
+    if not isinstance(graph, HighLevelGraph):
+        return collection
+
+    dependents = defaultdict(set)
+    for name, deps in graph.dependencies.items():
+        for dep in deps:
+            dependents[dep].add(name)
+
+    layers = dict(graph.layers)
+    for name, layer in graph.layers.items():
+        if not isinstance(layer, AwkwardInputLayer):
+            continue
+        files = [
+            inp[0] if isinstance(inp, tuple) and isinstance(inp[0], str) else None
+            for inp in layer.inputs
+        ]
+        if any(pfn is None for pfn in files):
+            continue
+        annotations = locality_annotations(files, data_locality, annotation)
+
+        # the input layer, and the blockwise layers with the same partitioning
+        to_visit = [name]
+        visited = set()
+        while to_visit:
+            child_name = to_visit.pop()
+            if child_name in visited:
+                continue
+            visited.add(child_name)
+            child = graph.layers[child_name]
+            if child_name != name and (
+                not isinstance(child, Blockwise)
+                or len(child.output_indices) != 1
+                or len(child) != len(files)
+            ):
+                continue
+            child = copy.copy(child)
+            child.annotations = dict(annotations, **(child.annotations or {}))
+            layers[child_name] = child
+            to_visit.extend(dependents[child_name])
+
+    rebuild, args = collection.__dask_postpersist__()
+    return rebuild(HighLevelGraph(layers, graph.dependencies), *args)
+
+
+def with_data_locality(opener, data_locality, annotation="workers", **kwargs):
+    """Call ``opener`` and annotate the input layers of the resulting collection(s)"""
+    out = opener(**kwargs)
+    if isinstance(out, tuple):
+        return (annotate_input_layers(out[0], data_locality, annotation),) + out[1:]
+    return annotate_input_layers(out, data_locality, annotation)
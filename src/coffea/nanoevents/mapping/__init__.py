@@ -4,12 +4,19 @@ from .preloaded import (
     PreloadedSourceMapping,
     SimplePreloadedColumnSource,
 )
-from .uproot import TrivialUprootOpener, UprootSourceMapping
+from .uproot import (
+    FailoverSource,
+    TrivialUprootOpener,
+    UprootSourceMapping,
+    replicas_uproot_options,
+)
 from .util import ArrayLifecycleMapping, CachedMapping
 
 __all__ = [
     "TrivialUprootOpener",
     "UprootSourceMapping",
+    "FailoverSource",
+    "replicas_uproot_options",
     "TrivialParquetOpener",
     "ParquetSourceMapping",
     "SimplePreloadedColumnSource",
@@ -1,4 +1,9 @@
+import collections
+import concurrent.futures
 import json
+import queue
+import threading
+import time
 import warnings
 
 import awkward
@@ -24,6 +29,252 @@ class TrivialUprootOpener(UUIDOpener):
         return rootdir
 
 
+class _ChunkResult:
+    """Future-like view of one of the ranges read by a FailoverSource request"""
+
+    def __init__(self, future, index):
+        self._future = future
+        self._index = index
+
+    def result(self, timeout=None):
+        return self._future.result(timeout)[self._index]
+
+
+_failover_executors = None
+_failover_executors_lock = threading.Lock()
+
+
+def _get_failover_executors():
+    """The thread pools shared by all the FailoverSource objects
+
+    The requests are run by the first pool and the hedged reads by the second one,
+    so that a request waiting for its hedged reads never holds a thread they need.
+    """
+    global _failover_executors
+    with _failover_executors_lock:
+        if _failover_executors is None:
+            _failover_executors = (
+                concurrent.futures.ThreadPoolExecutor(
+                    thread_name_prefix="coffea-failover"
+                ),
+                concurrent.futures.ThreadPoolExecutor(
+                    thread_name_prefix="coffea-failover-hedge"
+                ),
+            )
+        return _failover_executors
+
+
+class FailoverSource(uproot.source.chunk.Source):
+    """An uproot Source that reads from an ordered list of replicas of the same file
+
+    If opening the file or reading from the current replica fails with one of
+    ``failover_exceptions``, the next replica is tried and becomes the current one.
+    Optionally, when a read takes longer than the ``hedge_quantile`` of the latencies
+    observed so far, a hedged request is sent to the next replica and the first
+    answer is used.
+
+    It is used by passing ``handler=FailoverSource`` in the uproot options, together with:
+
+        replicas : dict[str, list[str]]
+            For each file path, the ordered list of alternative physical file names
+        replica_handler : uproot.source.chunk.Source, optional
+            The Source class used to read each replica (by default chosen by uproot from the path)
+        hedge_quantile : float, optional
+            Quantile of the observed read latencies above which a hedged request is sent, e.g. 0.95
+        hedge_min_reads : int, default 10
+            Number of reads to observe before hedging
+        failover_exceptions : tuple[Exception], default (OSError, ValueError)
+            Exceptions triggering a failover to the next replica
+    """
+
+    def __init__(
+        self,
+        file_path,
+        replicas=None,
+        replica_handler=None,
+        hedge_quantile=None,
+        hedge_min_reads=10,
+        hedge_history=100,
+        failover_exceptions=(OSError, ValueError),
+        **options,
+    ):
+        super().__init__()
+        self._file_path = file_path
+        self._replicas = [file_path] + [
+            pfn for pfn in (replicas or {}).get(file_path, []) if pfn != file_path
+        ]
+        self._replica_options = dict(options, handler=replica_handler)
+        self._hedge_quantile = hedge_quantile
+        self._hedge_min_reads = hedge_min_reads
+        self._latencies = collections.deque(maxlen=hedge_history)
+        self._failover_exceptions = failover_exceptions
+        self._sources = {}
+        self._current = 0
+        self._lock = threading.Lock()
+        self._executor, self._hedge_executor = _get_failover_executors()
+        self._closed = False
+
+        # open the first usable replica
+        errors = []
+        for index in range(len(self._replicas)):
+            try:
+                self._num_bytes = self._source(index).num_bytes
+                self._current = index
+                break
+            except self._failover_exceptions as err:
+                errors.append(err)
+        else:
+            raise errors[-1]
+
+    def __repr__(self):
+        return f"<{type(self).__name__} {self._file_path!r} ({len(self._replicas)} replicas) at 0x{id(self):012x}>"
+
+    @property
+    def replicas(self):
+        """The ordered list of replicas of this file"""
+        return list(self._replicas)
+
+    @property
+    def current_replica(self):
+        """The replica currently used for reading"""
+        return self._replicas[self._current]
+
+    def _source(self, index):
+        with self._lock:
+            if index not in self._sources:
+                pfn = self._replicas[index]
+                source_cls, path = uproot._util.file_path_to_source_class(
+                    pfn, self._replica_options
+                )
+                options = dict(self._replica_options)
+                options.pop("handler", None)
+                self._sources[index] = source_cls(path, **options)
+            return self._sources[index]
+
+    def _read_from(self, index, ranges):
+        start = time.perf_counter()
+        chunks = self._source(index).chunks(ranges, queue.Queue())
+        out = [chunk.detach_memmap().raw_data for chunk in chunks]
+        self._latencies.append(time.perf_counter() - start)
+        return out
+
+    def _read_hedged(self, index, ranges):
+        alternate = (index + 1) % len(self._replicas)
+        if (
+            self._hedge_quantile is None
+            or alternate == index
+            or len(self._latencies) < self._hedge_min_reads
+        ):
+            return index, self._read_from(index, ranges)
+
+        threshold = numpy.quantile(numpy.array(self._latencies), self._hedge_quantile)
+        primary = self._hedge_executor.submit(self._read_from, index, ranges)
+        try:
+            return index, primary.result(timeout=threshold)
+        except concurrent.futures.TimeoutError:
+            pass
+        hedge = self._hedge_executor.submit(self._read_from, alternate, ranges)
+        pending = {primary: index, hedge: alternate}
+        error = None
+        while pending:
+            done, _ = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                which = pending.pop(future)
+                try:
+                    return which, future.result()
+                except self._failover_exceptions as err:
+                    error = err
+        raise error
+
+    def _read(self, ranges):
+        errors = []
+        nreplicas = len(self._replicas)
+        for shift in range(nreplicas):
+            index = (self._current + shift) % nreplicas
+            try:
+                used, out = self._read_hedged(index, ranges)
+            except self._failover_exceptions as err:
+                errors.append(err)
+                continue
+            # a replica that answered faster (or at all) becomes the current one
+            self._current = used
+            return out
+        raise errors[-1]
+
+    def chunk(self, start, stop):
+        self._num_requests += 1
+        self._num_requested_chunks += 1
+        self._num_requested_bytes += stop - start
+        (data,) = self._read([(start, stop)])
+        return uproot.source.chunk.Chunk(
+            self, start, stop, uproot.source.futures.TrivialFuture(data)
+        )
+
+    def chunks(self, ranges, notifications):
+        self._num_requests += 1
+        self._num_requested_chunks += len(ranges)
+        self._num_requested_bytes += sum(stop - start for start, stop in ranges)
+
+        future = self._executor.submit(self._read, ranges)
+        chunks = []
+        for index, (start, stop) in enumerate(ranges):
+            chunk = uproot.source.chunk.Chunk(
+                self, start, stop, _ChunkResult(future, index)
+            )
+            future.add_done_callback(uproot.source.chunk.notifier(chunk, notifications))
+            chunks.append(chunk)
+        return chunks
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        # the executors are shared by all the sources and are left running
+        for source in self._sources.values():
+            source.__exit__(exception_type, exception_value, traceback)
+        self._closed = True
+
+
+def replicas_uproot_options(files, uproot_options={}):
+    """Add the FailoverSource handler to the uproot options if any file in ``files`` has replicas
+
+    Parameters
+    ----------
+        files : dict
+            A files specification, as accepted by ``uproot.dask``, whose entries may have
+            a ``replicas`` key with the ordered list of alternative physical file names.
+        uproot_options : dict, default {}
+            The uproot options to extend.
+
+    Returns
+    -------
+        uproot_options : dict
+            A copy of the uproot options, including ``handler`` and ``replicas`` if needed.
+    """
+    if not isinstance(files, dict):
+        return uproot_options
+    replicas = {
+        pfn: list(info["replicas"])
+        for pfn, info in files.items()
+        if isinstance(info, dict) and info.get("replicas")
+    }
+    if len(replicas) == 0:
+        return uproot_options
+    out = dict(uproot_options)
+    if out.get("handler", None) is not FailoverSource:
+        # the handler given by the caller reads the replicas, unless set explicitly
+        out.setdefault("replica_handler", out.get("handler", None))
+        out["handler"] = FailoverSource
+    out["replicas"] = dict(out.get("replicas", {}), **replicas)
+    return out
+
+
 class CannotBeNanoEvents(Exception):
     pass
 
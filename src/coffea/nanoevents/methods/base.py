@@ -1,18 +1,12 @@
 """Basic NanoEvents and NanoCollection mixins"""
 
-import re
 from abc import abstractmethod
-from functools import partial
 from typing import Any, Callable, List, Tuple, Union
 
 import awkward
 import dask_awkward
-import numpy
 from dask_awkward import dask_method, dask_property
 
-import coffea
-from coffea.util import awkward_rewrap, rewrap_recordarray
-
 behavior = {}
 
 
@@ -24,9 +18,93 @@ class _ClassMethodFn:
         return getattr(coll, self.attr)(*args, **kwargs)
 
 
+class _Variations:
+    """The variations of a systematic, as views of the varied array (see ``Systematic.systematics``)"""
+
+    def __init__(self, array, name, kind, what, astype, variations):
+        self._array = array
+        self._name = name
+        self._kind = kind
+        self._what = what
+        self._astype = astype
+        self._variations = variations
+
+    def __repr__(self):
+        return f"<{self._name} {self._kind} systematic of {self._what}: {self._variations}>"
+
+    def __dir__(self):
+        return list(self._variations)
+
+    def __iter__(self):
+        return iter(self._variations)
+
+    def __getitem__(self, variation):
+        if variation not in self._variations:
+            raise KeyError(f"{variation} is not a variation of {self._name}")
+        as_syst_type = awkward.with_name(self._array, self._kind)
+        return getattr(as_syst_type, variation)(self._name, self._what, self._astype)
+
+    def __getattr__(self, variation):
+        if variation.startswith("_"):
+            raise AttributeError(variation)
+        try:
+            return self[variation]
+        except KeyError as err:
+            raise AttributeError(str(err)) from None
+
+
+class _Systematics:
+    """The systematics attached to an array, by name (see ``Systematic.systematics``)"""
+
+    def __init__(self, array, meta):
+        self._array = array
+        self._meta = meta
+        self._names = []
+        if "__systematics__" in awkward.fields(meta):
+            self._names = awkward.fields(meta["__systematics__"])
+
+    def __repr__(self):
+        return f"<systematics: {self._names}>"
+
+    def __dir__(self):
+        return list(self._names)
+
+    def __iter__(self):
+        return iter(self._names)
+
+    def __len__(self):
+        return len(self._names)
+
+    def __getitem__(self, name):
+        if name not in self._names:
+            raise KeyError(f"{name} is not a systematic of this object")
+        layout = self._meta["__systematics__", name].layout
+        return _Variations(
+            self._array,
+            name,
+            layout.purelist_parameter("kind"),
+            layout.purelist_parameter("what"),
+            layout.purelist_parameter("astype"),
+            awkward.fields(self._meta["__systematics__", name]),
+        )
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        try:
+            return self[name]
+        except KeyError as err:
+            raise AttributeError(str(err)) from None
+
+
 @awkward.mixin_class(behavior)
 class Systematic:
-    """A base mixin class to describe and build variations on a feature of an nanoevents object."""
+    """A base mixin class to describe and build variations on a feature of an nanoevents object.
+
+    The varied values of each systematic are stored alongside the object, and each variation is
+    built on request as a view of the object with only the varied field replaced, sharing the
+    buffers of all the other fields.
+    """
 
     _systematic_kinds = set()
 
@@ -37,24 +115,19 @@ class Systematic:
         """
         cls._systematic_kinds.add(kind)
 
-    def _ensure_systematics(self):
-        """
-        Make sure that the parent object always has a field called '__systematics__'.
-        """
-        if "__systematics__" not in awkward.fields(self):
-            self["__systematics__"] = {}
-
-    @property
+    @dask_property
     def systematics(self):
         """
-        Return the list of all systematics attached to this object.
+        Return the systematics attached to this object.
+
+        A variation is accessed as ``obj.systematics.name.variation`` (or by item), and is a
+        copy of this object with only the varied field replaced.
         """
-        regex = re.compile(r"\_{2}.*\_{2}")
-        self._ensure_systematics()
-        fields = [
-            f for f in awkward.fields(self["__systematics__"]) if not regex.match(f)
-        ]
-        return self["__systematics__"][fields]
+        return _Systematics(self, self)
+
+    @systematics.dask
+    def systematics(self, dask_array):
+        return _Systematics(dask_array, self)
 
     @abstractmethod
     def _build_variations(
@@ -70,6 +143,8 @@ class Systematic:
         varying_function: Union[function, bound method, partial], a function that describes how 'what' is varied
         define how to manipulate the output of varying_function to produce all systematic variations. Varying function
         must close over all non-event-data arguments.
+        Returns the varied values, with an innermost regular dimension indexing the variations in the order
+        of ``describe_variations``.
         """
         pass
 
@@ -88,22 +163,21 @@ class Systematic:
         """returns a list of variation names"""
         pass
 
-    def add_systematic(
+    def _systematics_with(
         self,
+        array,
         name: str,
         kind: str,
         what: Union[str, List[str], Tuple[str]],
         varying_function: Callable,
     ):
         """
-        name: str, name of the systematic variation / uncertainty source
-        kind: str, the name of the kind of systematic variation
-        what: Union[str, List[str], Tuple[str]], name what gets varied, this could be a list or tuple of column names
-        varying_function: Union[function, bound method], a function that describes how 'what' is varied, it must close over all non-event-data arguments.
+        Return the systematics of array (this object, or the dask array of which this object is the meta)
+        with the varied values of a new systematic.
         """
-        self._ensure_systematics()
-
-        if name in awkward.fields(self["__systematics__"]):
+        if "__systematics__" in awkward.fields(self) and name in awkward.fields(
+            self["__systematics__"]
+        ):
             raise ValueError(f"{name} already exists as a systematic for this object!")
 
         if kind not in self._systematic_kinds:
@@ -111,38 +185,55 @@ class Systematic:
                 f"{kind} is not an available systematics type, please add it and try again!"
             )
 
-        wrap = partial(
-            awkward_rewrap, like_what=self["__systematics__"], gfunc=rewrap_recordarray
+        zip = dask_awkward.zip if isinstance(array, dask_awkward.Array) else awkward.zip
+        rendered_type = self.layout.purelist_parameter("__record__")
+        variations = awkward.with_name(self, kind).describe_variations()
+        varied = awkward.with_name(array, kind)._build_variations(
+            name, what, varying_function
         )
-        flat = (
-            self
-            if isinstance(self, coffea.nanoevents.methods.base.NanoEvents)
-            else awkward.flatten(self)
+        where = (slice(None),) * self.ndim
+        systematic = zip(
+            {v: varied[where + (i,)] for i, v in enumerate(variations)},
+            depth_limit=self.ndim,
+            with_name=f"{name}Systematics",
+            parameters={"kind": kind, "what": what, "astype": rendered_type},
         )
+        if "__systematics__" in awkward.fields(self):
+            return awkward.with_field(array["__systematics__"], systematic, name)
+        return zip({name: systematic}, depth_limit=self.ndim)
 
-        if what == "weight" and "__ones__" not in awkward.fields(
-            flat["__systematics__"]
-        ):
-            flat["__systematics__", "__ones__"] = numpy.ones(
-                len(flat), dtype=numpy.float32
-            )
+    @dask_method
+    def add_systematic(
+        self,
+        name: str,
+        kind: str,
+        what: Union[str, List[str], Tuple[str]],
+        varying_function: Callable,
+    ):
+        """
+        name: str, name of the systematic variation / uncertainty source
+        kind: str, the name of the kind of systematic variation
+        what: Union[str, List[str], Tuple[str]], name what gets varied, this could be a list or tuple of column names
+        varying_function: Union[function, bound method], a function that describes how 'what' is varied, it must close over all non-event-data arguments.
 
-        rendered_type = flat.layout.parameters["__record__"]
-        as_syst_type = awkward.with_parameter(flat, "__record__", kind)
-        as_syst_type._build_variations(name, what, varying_function)
-        variations = as_syst_type.describe_variations()
-
-        flat["__systematics__", name] = awkward.zip(
-            {
-                v: getattr(as_syst_type, v)(name, what, rendered_type)
-                for v in variations
-            },
-            depth_limit=1,
-            with_name=f"{name}Systematics",
+        Only the varied values of 'what' are computed and stored, in the '__systematics__' field of this object.
+        """
+        self["__systematics__"] = self._systematics_with(
+            self, name, kind, what, varying_function
         )
 
-        self["__systematics__"] = wrap(flat["__systematics__"])
-        self.behavior[("__typestr__", f"{name}Systematics")] = f"{kind}"
+    @add_systematic.dask
+    def add_systematic(
+        self,
+        dask_array,
+        name: str,
+        kind: str,
+        what: Union[str, List[str], Tuple[str]],
+        varying_function: Callable,
+    ):
+        dask_array["__systematics__"] = self._systematics_with(
+            dask_array, name, kind, what, varying_function
+        )
 
 
 behavior[("__typestr__", "Systematic")] = "Systematic"
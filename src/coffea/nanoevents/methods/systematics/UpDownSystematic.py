@@ -1,6 +1,5 @@
-from copy import copy
-
 import awkward
+import numpy
 
 from coffea.nanoevents.methods.base import Systematic, behavior
 
@@ -12,62 +11,48 @@ class UpDownSystematic(Systematic):
     _udmap = {"up": 0, "down": 1}
 
     def _build_variations(self, name, what, varying_function, *args, **kwargs):
-        whatarray = (
-            self[what] if what != "weight" else self["__systematics__", "__ones__"]
-        )
+        """Calculate the up and down values of what, from its flattened values."""
+        if what == "weight":
+            whatarray = awkward.ones_like(
+                awkward.local_index(self, axis=self.ndim - 1), dtype=numpy.float32
+            )
+        else:
+            whatarray = self[what]
 
-        self["__systematics__", f"__{name}__"] = awkward.virtual(
-            varying_function,
-            args=(whatarray, *args),
-            kwargs=kwargs,
-            length=len(whatarray),
-        )
+        if whatarray.ndim == 1:
+            return awkward.Array(varying_function(whatarray, *args, **kwargs))
+        varied = varying_function(awkward.flatten(whatarray), *args, **kwargs)
+        return awkward.unflatten(varied, awkward.num(whatarray, axis=1))
 
     def describe_variations(self):
         """Show the map of variation names to indices."""
         return list(self._udmap.keys())
 
     def get_variation(self, name, what, astype, updown):
-        """Calculate and up or down variation."""
-        fields = awkward.fields(self)
-        fields.remove("__systematics__")
-
-        varied = self["__systematics__", f"__{name}__", :, self._udmap[updown]]
-
-        params = copy(self.layout.parameters)
-        params["variation"] = f"{name}-{what}-{updown}"
-
-        out = {field: self[field] for field in fields}
-        if what == "weight":
-            out[f"weight_{name}"] = varied
+        """Calculate and up or down variation.
+
+        Only the varied fields are replaced, the other fields of the result share the
+        buffers of this array.
+        """
+        fields = [field for field in awkward.fields(self) if field != "__systematics__"]
+        varied = self["__systematics__", name, updown]
+        out = self[fields]
+        if isinstance(what, str):
+            out = awkward.with_field(
+                out, varied, f"weight_{name}" if what == "weight" else what
+            )
         else:
-            out[what] = varied
-
-        return awkward.zip(
-            out,
-            depth_limit=1,
-            parameters=params,
-            behavior=self.behavior,
-            with_name=astype,
-        )
+            for field in what:
+                out = awkward.with_field(out, varied[field], field)
+        return awkward.with_name(out, astype)
 
     def up(self, name, what, astype):
         """Return the "up" variation of this observable."""
-        return awkward.virtual(
-            self.get_variation,
-            args=(name, what, astype, "up"),
-            length=len(self),
-            parameters=self[what].layout.parameters if what != "weight" else None,
-        )
+        return self.get_variation(name, what, astype, "up")
 
     def down(self, name, what, astype):
         """Return the "down" variation of this observable."""
-        return awkward.virtual(
-            self.get_variation,
-            args=(name, what, astype, "down"),
-            length=len(self),
-            parameters=self[what].layout.parameters if what != "weight" else None,
-        )
+        return self.get_variation(name, what, astype, "down")
 
 
 behavior[("__typestr__", "UpDownSystematic")] = "UpDownSystematic"
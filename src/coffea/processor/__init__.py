@@ -3,8 +3,32 @@
 
 """
 
+from .accumulator import (
+    Accumulatable,
+    Addable,
+    accumulate,
+    accumulate_delayed,
+    accumulate_futures,
+    accumulate_submitted,
+    add,
+    iadd,
+)
+from .checkpoint import CheckpointStore
+from .executor import FuturesExecutor, WorkItem, fileset_workitems
 from .processor import ProcessorABC
 
 __all__ = [
     "ProcessorABC",
+    "FuturesExecutor",
+    "WorkItem",
+    "fileset_workitems",
+    "Accumulatable",
+    "Addable",
+    "accumulate",
+    "accumulate_delayed",
+    "accumulate_futures",
+    "accumulate_submitted",
+    "add",
+    "iadd",
+    "CheckpointStore",
 ]
@@ -0,0 +1,273 @@
+"""Merging of processor outputs
+
+Processor outputs are arbitrary nesting of mappings (e.g. ``dict``), sets and addable
+objects (numbers, ``hist.Hist``, ``numpy`` arrays, ``LumiList``, ``WeightStatistics``, ...),
+collectively called accumulatables. They are merged key by key, sets are merged by union,
+and ``collections.Counter`` values are summed, keeping zero and negative counts.
+"""
+
+import concurrent.futures
+import copy
+from collections import Counter
+from collections.abc import MutableMapping, MutableSet
+from typing import Iterable, Optional, Protocol, TypeVar, Union, runtime_checkable
+
+T = TypeVar("T")
+
+
+@runtime_checkable
+class Addable(Protocol):
+    def __add__(self: T, other: T) -> T: ...
+
+
+Accumulatable = Union[Addable, MutableSet, MutableMapping]
+
+
+def _incompatible(a, b):
+    return ValueError(
+        f"Cannot add accumulators of incompatible type ({type(a)} vs. {type(b)})"
+    )
+
+
+def add(a: Accumulatable, b: Accumulatable) -> Accumulatable:
+    """Add two accumulatables together, without altering inputs
+
+    This may make copies in certain situations
+    """
+    if isinstance(a, Counter) and isinstance(b, Counter):
+        out = copy.copy(a)
+        out.update(b)
+        return out
+    if isinstance(a, Addable) and isinstance(b, Addable):
+        return a + b
+    if isinstance(a, MutableSet) and isinstance(b, MutableSet):
+        return a | b
+    elif isinstance(a, MutableMapping) and isinstance(b, MutableMapping):
+        # capture type(X) by shallow copy and clear
+        # since we don't know the signature of type(X).__init__
+        if isinstance(b, type(a)):
+            out = copy.copy(a)
+        elif isinstance(a, type(b)):
+            out = copy.copy(b)
+        else:
+            raise ValueError(
+                f"Cannot add two mappings of incompatible type ({type(a)} vs. {type(b)})"
+            )
+        out.clear()
+        lhs, rhs = set(a), set(b)
+        # keep the order of elements as far as possible
+        for key in a:
+            if key in rhs:
+                out[key] = add(a[key], b[key])
+            else:
+                out[key] = copy.deepcopy(a[key])
+        for key in b:
+            if key not in lhs:
+                out[key] = copy.deepcopy(b[key])
+        return out
+    raise _incompatible(a, b)
+
+
+def _iadd(a, b, adopt):
+    if isinstance(a, Counter) and isinstance(b, Counter):
+        a.update(b)
+        return a
+    if isinstance(a, Addable) and isinstance(b, Addable):
+        a += b
+        return a
+    elif isinstance(a, MutableSet) and isinstance(b, MutableSet):
+        a |= b
+        return a
+    elif isinstance(a, MutableMapping) and isinstance(b, MutableMapping):
+        for key in b:
+            if key in a:
+                a[key] = _iadd(a[key], b[key], adopt)
+            else:
+                a[key] = b[key] if adopt else copy.deepcopy(b[key])
+        return a
+    raise _incompatible(a, b)
+
+
+def iadd(a: Accumulatable, b: Accumulatable) -> Accumulatable:
+    """Add two accumulatables together, assuming the first is mutable
+
+    The content of ``b`` is not altered, the mapping values missing from ``a`` are copied.
+    """
+    return _iadd(a, b, adopt=False)
+
+
+def accumulate(
+    items: Iterable[Optional[Accumulatable]],
+    accum: Optional[Accumulatable] = None,
+    inplace: bool = False,
+) -> Optional[Accumulatable]:
+    """Merge accumulatables together
+
+    Parameters
+    ----------
+        items : Iterable[Accumulatable]
+            The accumulatables to merge, None values are skipped
+        accum : Accumulatable, optional
+            An existing accumulatable to merge the items into (in place)
+        inplace : bool, default False
+            If True, the items are owned by the caller and are not used afterwards:
+            the first item is used as accumulator and the values of the others are
+            moved rather than copied into it. Otherwise the items are left untouched,
+            at the price of copying the first one.
+
+    Returns
+    -------
+        accum : Accumulatable or None
+    """
+    gen = (x for x in items if x is not None)
+    try:
+        if accum is None:
+            accum = next(gen)
+            if not inplace:
+                # we want to produce a new object so that the input is not mutated
+                accum = add(accum, next(gen))
+        while True:
+            # subsequent additions can happen in-place, which may be more performant
+            accum = _iadd(accum, next(gen), adopt=inplace)
+    except StopIteration:
+        pass
+    return accum
+
+
+def _accumulate_owned(items):
+    return accumulate(items, inplace=True)
+
+
+def _accumulate_new(items):
+    # a new object, not sharing any state with the items
+    if len(items) == 1:
+        return copy.deepcopy(items[0])
+    return accumulate(items)
+
+
+def accumulate_futures(futures, pool=None, fanin=8, function=_accumulate_owned):
+    """Merge the results of futures as they complete, in a k-ary tree
+
+    At most ``fanin - 1`` completed results are held before being merged, so that the
+    memory usage is bounded independently of the number of futures.
+
+    Parameters
+    ----------
+        futures : Iterable[concurrent.futures.Future]
+            The futures whose results are to be merged. Their results are owned by this
+            function (merged in place).
+        pool : concurrent.futures.Executor, optional
+            If given, the merges are submitted to this pool as tasks (a parallel tree
+            reduction), otherwise the results are merged by the caller as they complete
+            (a streaming reduction).
+        fanin : int, default 8
+            Number of results merged together by each merge task
+        function : Callable[[list], Any], default ``accumulate(items, inplace=True)``
+            The merge function, e.g. to decompress the results before merging
+
+    Returns
+    -------
+        accum : Accumulatable or None
+    """
+    if fanin < 2:
+        raise ValueError("fanin must be at least 2")
+    if pool is None:
+        accum = None
+        for future in concurrent.futures.as_completed(futures):
+            accum = function([accum, future.result()])
+        return accum
+
+    running = set(futures)
+    to_merge = []
+    while running or len(to_merge) > 1:
+        while len(to_merge) >= fanin or (not running and len(to_merge) > 1):
+            batch, to_merge = to_merge[:fanin], to_merge[fanin:]
+            running.add(pool.submit(function, batch))
+        done, running = concurrent.futures.wait(
+            running, return_when=concurrent.futures.FIRST_COMPLETED
+        )
+        to_merge.extend(future.result() for future in done)
+    return to_merge[0] if to_merge else None
+
+
+def accumulate_submitted(
+    pool, function, arguments, fanin=8, max_in_flight=None, merge=_accumulate_owned
+):
+    """Submit ``function(argument)`` for each argument to a pool and merge the results in a k-ary tree
+
+    Unlike ``accumulate_futures``, the tasks are submitted as the previous ones complete, so
+    that at most ``max_in_flight`` results are computed or waiting to be merged at any time.
+
+    Parameters
+    ----------
+        pool : concurrent.futures.Executor
+            The pool running the tasks and the merges
+        function : Callable
+            The task function
+        arguments : Iterable
+            The argument of each task
+        fanin : int, default 8
+            Number of results merged together by each merge task
+        max_in_flight : int, optional
+            Maximum number of submitted tasks, by default unbounded
+        merge : Callable[[list], Any], default ``accumulate(items, inplace=True)``
+            The merge function, e.g. to decompress the results before merging
+
+    Returns
+    -------
+        accum : Accumulatable or None
+    """
+    if fanin < 2:
+        raise ValueError("fanin must be at least 2")
+    arguments = iter(arguments)
+    exhausted = False
+    running = set()
+    to_merge = []
+    while not exhausted or running or len(to_merge) > 1:
+        while not exhausted and (max_in_flight is None or len(running) < max_in_flight):
+            try:
+                running.add(pool.submit(function, next(arguments)))
+            except StopIteration:
+                exhausted = True
+        while len(to_merge) >= fanin or (
+            exhausted and not running and len(to_merge) > 1
+        ):
+            batch, to_merge = to_merge[:fanin], to_merge[fanin:]
+            running.add(pool.submit(merge, batch))
+        if not running:
+            continue
+        done, running = concurrent.futures.wait(
+            running, return_when=concurrent.futures.FIRST_COMPLETED
+        )
+        to_merge.extend(future.result() for future in done)
+    return to_merge[0] if to_merge else None
+
+
+def accumulate_delayed(items, fanin=8):
+    """Merge dask delayed accumulatables in a k-ary tree
+
+    Parameters
+    ----------
+        items : list[dask.delayed.Delayed]
+            The delayed objects to merge. They are not altered: only the intermediate
+            results of the tree are merged in place.
+        fanin : int, default 8
+            Number of objects merged together by each task
+
+    Returns
+    -------
+        accum : dask.delayed.Delayed
+    """
+    import dask
+
+    if fanin < 2:
+        raise ValueError("fanin must be at least 2")
+    if len(items) == 0:
+        raise ValueError("No items to accumulate")
+    merge = dask.delayed(_accumulate_new, pure=True)
+    merge_owned = dask.delayed(_accumulate_owned, pure=True)
+
+    level = [merge(items[i : i + fanin]) for i in range(0, len(items), fanin)]
+    while len(level) > 1:
+        level = [merge_owned(level[i : i + fanin]) for i in range(0, len(level), fanin)]
+    return level[0]
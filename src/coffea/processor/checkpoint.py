@@ -0,0 +1,144 @@
+"""Checkpointing of per-step results
+
+A ``CheckpointStore`` keeps the output of each processed step (range of entries of a file)
+in a local directory, so that an interrupted computation can be resumed by only processing
+the steps missing from the store and merging the stored outputs.
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+
+import lz4.frame as lz4f
+
+from .executor import _PICKLE_PROTOCOL, _decompress
+
+
+class CheckpointStore:
+    """Directory of per-step outputs, indexed by dataset, file, uuid and step
+
+    Each output is written to its own file, atomically (written to a temporary file which is
+    then renamed), before being recorded in an append-only index. An interrupted write thus
+    never leaves a partial output in the store.
+
+    Parameters
+    ----------
+        directory : str
+            The directory of the store, created if needed
+        compression : int, default 1
+            lz4 compression level of the stored outputs (0 for the fastest)
+    """
+
+    index_name = "index.jsonl"
+
+    def __init__(self, directory, compression=1):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.compression = compression
+        self._index = {}
+        self._load_index()
+
+    @staticmethod
+    def key(dataset, filename, uuid, step):
+        """The key of a step of a file
+
+        Parameters
+        ----------
+            dataset : str
+            filename : str
+            uuid : str or None
+            step : tuple[int, int]
+                The entry range of the step
+
+        Returns
+        -------
+            key : tuple
+        """
+        return (dataset, filename, uuid, int(step[0]), int(step[1]))
+
+    def _load_index(self):
+        path = os.path.join(self.directory, self.index_name)
+        if not os.path.exists(path):
+            return
+        with open(path) as fin:
+            lines = fin.readlines()
+        if lines and not lines[-1].endswith("\n"):
+            # a truncated last line, from an interrupted write
+            with open(path, "a") as fout:
+                fout.write("\n")
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            key = self.key(
+                entry["dataset"], entry["filename"], entry["uuid"], entry["step"]
+            )
+            if os.path.exists(os.path.join(self.directory, entry["file"])):
+                self._index[key] = entry["file"]
+
+    def _filename(self, key):
+        return hashlib.sha1(json.dumps(key).encode()).hexdigest() + ".coffea"
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def __len__(self):
+        return len(self._index)
+
+    def keys(self):
+        """The keys of the stored outputs"""
+        return self._index.keys()
+
+    def save(self, key, output, compressed=False):
+        """Store the output of a step
+
+        Parameters
+        ----------
+            key : tuple
+                The key of the step, see ``CheckpointStore.key``
+            output
+                The output to store
+            compressed : bool, default False
+                If True, ``output`` is already compressed (bytes, as returned by the
+                ``FuturesExecutor`` worker processes) and is stored as-is.
+        """
+        if compressed:
+            data = output
+        else:
+            data = lz4f.compress(
+                pickle.dumps(output, protocol=_PICKLE_PROTOCOL),
+                compression_level=self.compression,
+            )
+        filename = self._filename(key)
+        fd, tmppath = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fout:
+                fout.write(data)
+            os.replace(tmppath, os.path.join(self.directory, filename))
+        except BaseException:
+            os.unlink(tmppath)
+            raise
+
+        dataset, path, uuid, start, stop = key
+        entry = {
+            "dataset": dataset,
+            "filename": path,
+            "uuid": uuid,
+            "step": [start, stop],
+            "file": filename,
+        }
+        with open(os.path.join(self.directory, self.index_name), "a") as fout:
+            fout.write(json.dumps(entry) + "\n")
+        self._index[key] = filename
+
+    def load_compressed(self, key):
+        """The compressed (bytes) output of a step"""
+        with open(os.path.join(self.directory, self._index[key]), "rb") as fin:
+            return fin.read()
+
+    def load(self, key):
+        """The output of a step"""
+        return _decompress(self.load_compressed(key))
@@ -0,0 +1,394 @@
+"""A dask-free executor running processors on the local node
+
+The dask-based path (``coffea.dataset_tools.apply_to_fileset``) builds a task graph for
+the whole fileset before anything runs, which is a significant overhead for small and
+medium sized jobs. The ``FuturesExecutor`` instead builds eager NanoEvents for each step
+of a preprocessed fileset and runs ``ProcessorABC.process`` on a ``concurrent.futures``
+pool, keeping a bounded number of chunks in flight and merging the outputs in a tree.
+"""
+
+import concurrent.futures
+import multiprocessing
+import pickle
+from dataclasses import dataclass, field
+from functools import lru_cache
+from io import BytesIO
+from typing import TYPE_CHECKING, Any, Callable, Dict, Optional, Union
+
+import cloudpickle
+import lz4.frame as lz4f
+
+from coffea.nanoevents import NanoAODSchema, NanoEventsFactory
+from coffea.nanoevents.mapping import replicas_uproot_options
+from coffea.util import rich_bar
+
+from .accumulator import accumulate
+from .processor import ProcessorABC
+
+if TYPE_CHECKING:
+    from .checkpoint import CheckpointStore
+
+_PICKLE_PROTOCOL = pickle.HIGHEST_PROTOCOL
+
+
+@dataclass(unsafe_hash=True, frozen=True)
+class WorkItem:
+    """A step (range of entries) of a file to be processed"""
+
+    dataset: str
+    filename: str
+    treename: str
+    entrystart: int
+    entrystop: int
+    fileuuid: str
+    usermeta: Optional[Dict] = field(default=None, compare=False)
+
+    def __len__(self) -> int:
+        return self.entrystop - self.entrystart
+
+
+def _compress(item, compression):
+    if item is None or compression is None:
+        return item
+    else:
+        with BytesIO() as bf:
+            with lz4f.open(bf, mode="wb", compression_level=compression) as f:
+                pickle.dump(item, f, protocol=_PICKLE_PROTOCOL)
+            result = bf.getvalue()
+        return result
+
+
+def _decompress(item):
+    if isinstance(item, bytes):
+        return pickle.loads(lz4f.decompress(item))
+    else:
+        return item
+
+
+class _compression_wrapper:
+    def __init__(self, level, function, name=None):
+        self.level = level
+        self.function = function
+        self.name = name
+
+    def __str__(self):
+        if self.name is not None:
+            return self.name
+        try:
+            name = self.function.__name__
+            if name == "<lambda>":
+                return "lambda"
+            return name
+        except AttributeError:
+            return str(self.function)
+
+    # no @wraps due to pickle
+    def __call__(self, *args, **kwargs):
+        out = self.function(*args, **kwargs)
+        return _compress(out, self.level)
+
+
+def _checkpoint_key(item):
+    return (
+        item.dataset,
+        item.filename,
+        item.fileuuid,
+        item.entrystart,
+        item.entrystop,
+    )
+
+
+def _merge_compressed(items, compression):
+    out = accumulate((_decompress(item) for item in items), inplace=True)
+    return _compress(out, compression)
+
+
+def fileset_workitems(fileset):
+    """Build the list of work items (one per step) of a preprocessed fileset
+
+    Parameters
+    ----------
+        fileset : FilesetSpec
+            The fileset, as returned by ``coffea.dataset_tools.preprocess``
+
+    Returns
+    -------
+        items : list[WorkItem]
+    """
+    items = []
+    for dataset, spec in fileset.items():
+        usermeta = spec.get("metadata", None)
+        for filename, info in spec["files"].items():
+            steps = info.get("steps", None)
+            if steps is None:
+                raise ValueError(
+                    f"File {filename} of dataset {dataset} has no steps, please preprocess the fileset"
+                )
+            for start, stop in steps:
+                items.append(
+                    WorkItem(
+                        dataset,
+                        filename,
+                        info["object_path"],
+                        start,
+                        stop,
+                        info.get("uuid", None),
+                        usermeta,
+                    )
+                )
+    return items
+
+
+class _ProcessChunk:
+    def __init__(
+        self,
+        data_manipulation,
+        schemaclass,
+        uproot_options,
+        iteritems_options,
+        compression,
+    ):
+        self.data_manipulation = data_manipulation
+        self.schemaclass = schemaclass
+        self.uproot_options = uproot_options
+        self.iteritems_options = iteritems_options
+        self.compression = compression
+
+    def __call__(self, item):
+        metadata = dict(item.usermeta or {})
+        metadata.update(
+            {
+                "dataset": item.dataset,
+                "filename": item.filename,
+                "treename": item.treename,
+                "entrystart": item.entrystart,
+                "entrystop": item.entrystop,
+                "fileuuid": item.fileuuid,
+            }
+        )
+        events = NanoEventsFactory.from_root(
+            {item.filename: item.treename},
+            entry_start=item.entrystart,
+            entry_stop=item.entrystop,
+            schemaclass=self.schemaclass,
+            metadata=metadata,
+            uproot_options=self.uproot_options.get(item.dataset, {}),
+            iteritems_options=self.iteritems_options,
+            delayed=False,
+        ).events()
+        if isinstance(self.data_manipulation, ProcessorABC):
+            out = self.data_manipulation.process(events)
+        else:
+            out = self.data_manipulation(events)
+        return _compress(out, self.compression)
+
+
+@lru_cache(maxsize=4)
+def _load_function(pickled):
+    return cloudpickle.loads(pickled)
+
+
+def _call_pickled(pickled, *args):
+    return _load_function(pickled)(*args)
+
+
+class _PickledFunction:
+    """Function (cloud)pickled once, rather than at every submission"""
+
+    def __init__(self, function):
+        self.pickled = cloudpickle.dumps(function)
+
+    def __call__(self, *args):
+        return _call_pickled(self.pickled, *args)
+
+
+@dataclass
+class FuturesExecutor:
+    """Run a processor on a preprocessed fileset using a ``concurrent.futures`` pool
+
+    Each step of each file is read into eager NanoEvents and processed independently,
+    on a single node and without any dask scheduler. At most ``max_in_flight`` tasks
+    are submitted at any time, and the chunk outputs are merged in place (see
+    ``accumulate``), ``merge_fanin`` at a time, by merge tasks submitted to the same pool
+    (a k-ary tree reduction), or by the calling process as they arrive.
+
+    Parameters
+    ----------
+        workers : int, default 1
+            Number of parallel workers
+        pool : str or Callable[[int], concurrent.futures.Executor], default "processes"
+            "processes" (spawned, as forking a process running threads may deadlock) or
+            "threads", or a function of the number of workers returning an executor
+            (e.g. a ``ProcessPoolExecutor`` with a different ``mp_context``).
+        max_in_flight : int, optional
+            Maximum number of submitted tasks, default twice the number of workers.
+        merge_fanin : int, default 8
+            Number of outputs merged by each merge task.
+        merge_in_pool : bool, default True
+            Merge the outputs in the pool. If False, the outputs are merged one at a time
+            by the calling process (a streaming reduction), which is preferable when the
+            outputs are small or the workers are memory constrained.
+        compression : int, optional, default 1
+            lz4 compression level of the outputs sent back from the workers.
+            Unused with a thread pool, set to None to disable.
+        status : bool, default True
+            Show a progress bar.
+        checkpoint : CheckpointStore, optional
+            Store the output of each step as soon as it is received, and skip the steps
+            already in the store, merging their stored outputs instead. An interrupted
+            run can thus be resumed by running again with the same store.
+    """
+
+    workers: int = 1
+    pool: Union[str, Callable[[int], concurrent.futures.Executor]] = "processes"
+    max_in_flight: Optional[int] = None
+    merge_fanin: int = 8
+    merge_in_pool: bool = True
+    compression: Optional[int] = 1
+    status: bool = True
+    checkpoint: Optional["CheckpointStore"] = None
+
+    def _make_pool(self):
+        if self.pool == "processes":
+            return (
+                concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                ),
+                True,
+            )
+        elif self.pool == "threads":
+            return (
+                concurrent.futures.ThreadPoolExecutor(max_workers=self.workers),
+                False,
+            )
+        elif callable(self.pool):
+            pool = self.pool(self.workers)
+            return pool, not isinstance(pool, concurrent.futures.ThreadPoolExecutor)
+        raise ValueError(f"Invalid pool {self.pool!r}, use processes or threads")
+
+    def __call__(
+        self,
+        data_manipulation: Union[ProcessorABC, Callable[[Any], Any]],
+        fileset: Dict[str, Any],
+        schemaclass=NanoAODSchema,
+        uproot_options: Dict[str, Any] = {},
+        iteritems_options: Dict[str, Any] = {},
+    ):
+        """Run ``data_manipulation`` on all the steps of ``fileset``
+
+        Parameters
+        ----------
+            data_manipulation : ProcessorABC or Callable
+                The processor (or function of the events) to run on each chunk
+            fileset : FilesetSpec
+                The fileset, as returned by ``coffea.dataset_tools.preprocess``
+            schemaclass : BaseSchema, default NanoAODSchema
+                The nanoevents schema to interpret the input files with
+            uproot_options : dict[str, Any], default {}
+                Options to pass to ``uproot.open``
+            iteritems_options : dict[str, Any], default {}
+                Options to pass to ``TTree.iteritems``, e.g. ``filter_name`` to only read the
+                branches used by the processor (eager NanoEvents read all the branches)
+
+        Returns
+        -------
+            out
+                The merged outputs of all chunks, after ``postprocess`` for a processor
+        """
+        if not isinstance(data_manipulation, (ProcessorABC, Callable)):
+            raise ValueError(
+                "data_manipulation must either be a ProcessorABC or Callable"
+            )
+        if self.merge_fanin < 2:
+            raise ValueError("merge_fanin must be at least 2")
+        items = fileset_workitems(fileset)
+        options = {
+            dataset: replicas_uproot_options(spec["files"], uproot_options)
+            for dataset, spec in fileset.items()
+        }
+        max_in_flight = self.max_in_flight or 2 * self.workers
+
+        pool, remote = self._make_pool()
+        compression = self.compression if remote else None
+        function = _ProcessChunk(
+            data_manipulation, schemaclass, options, iteritems_options, compression
+        )
+        if remote:
+            function = _PickledFunction(function)
+        merge = _PickledFunction(_merge_compressed) if remote else _merge_compressed
+
+        progress = rich_bar()
+        if self.status:
+            progress.start()
+        task = progress.add_task("Processing", total=len(items), unit="chunk")
+        try:
+            out = self._run(
+                pool, function, merge, compression, items, max_in_flight, progress, task
+            )
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+            progress.refresh()
+            progress.stop()
+
+        out = _decompress(out)
+        if isinstance(data_manipulation, ProcessorABC):
+            postprocessed = data_manipulation.postprocess(out)
+            if postprocessed is not None:
+                out = postprocessed
+        return out
+
+    def _run(
+        self, pool, function, merge, compression, items, max_in_flight, progress, task
+    ):
+        checkpoint = self.checkpoint
+        stored = []
+        if checkpoint is not None:
+            stored = [item for item in items if _checkpoint_key(item) in checkpoint]
+            items = [item for item in items if _checkpoint_key(item) not in checkpoint]
+        items = list(reversed(items))
+        running = {}
+        to_merge = []
+
+        def collect(result):
+            if self.merge_in_pool:
+                to_merge.append(result)
+            else:
+                to_merge[:] = [
+                    accumulate(to_merge + [_decompress(result)], inplace=True)
+                ]
+
+        while items or stored or running or len(to_merge) > 1:
+            while items and len(running) < max_in_flight:
+                item = items.pop()
+                running[pool.submit(function, item)] = item
+            while stored and len(to_merge) < self.merge_fanin:
+                collect(checkpoint.load_compressed(_checkpoint_key(stored.pop())))
+                progress.update(task, advance=1)
+            while len(to_merge) >= self.merge_fanin or (
+                not items and not stored and not running and len(to_merge) > 1
+            ):
+                batch, to_merge[:] = (
+                    to_merge[: self.merge_fanin],
+                    to_merge[self.merge_fanin :],
+                )
+                running[pool.submit(merge, batch, compression)] = None
+            if not running:
+                continue
+            done, _ = concurrent.futures.wait(
+                running, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                item = running.pop(future)
+                result = future.result()
+                if item is not None:
+                    if checkpoint is not None:
+                        checkpoint.save(
+                            _checkpoint_key(item),
+                            result,
+                            compressed=compression is not None,
+                        )
+                    progress.update(task, advance=1)
+                collect(result)
+            progress.refresh()
+        return to_merge[0] if to_merge else None
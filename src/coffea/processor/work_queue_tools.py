@@ -1,10 +1,13 @@
 import collections
 import math
+import multiprocessing
 import os
 import random
 import re
 import signal
 import textwrap
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
 from os.path import basename, getsize, join
 from tempfile import NamedTemporaryFile, TemporaryDirectory
 
@@ -14,8 +17,14 @@ import scipy
 
 from coffea.util import deprecate, rich_bar
 
-from .accumulator import accumulate
-from .executor import WorkItem, _compression_wrapper, _decompress
+from .accumulator import accumulate, accumulate_submitted
+from .executor import (
+    WorkItem,
+    _compress,
+    _compression_wrapper,
+    _decompress,
+    _merge_compressed,
+)
 
 # The Work Queue object is global b/c we want to
 # retain state between runs of the executor, such
@@ -27,25 +36,81 @@ _wq_queue = None
 early_terminate = False
 
 
+def _load_result_file(filename):
+    with open(filename, "rb") as rf:
+        return _decompress(rf.read())
+
+
+def _accumulate_result_files_compressed(files_to_accumulate, compression):
+    return _compress(accumulate_result_files(files_to_accumulate), compression)
+
+
 # This function that accumulates results from files does not require wq.
 # We declare it before checking for wq so that we do not need to install wq at
 # the remote site.
-def accumulate_result_files(files_to_accumulate, accumulator=None):
+def accumulate_result_files(
+    files_to_accumulate, accumulator=None, workers=1, fanin=8, compression=1
+):
+    """Merge the (compressed) results stored in files
+
+    Parameters
+    ----------
+        files_to_accumulate : Iterable[str]
+            The result files
+        accumulator : Accumulatable, optional
+            An existing accumulator to merge the results into
+        workers : int, default 1
+            If larger than one, the files are loaded and merged in a k-ary tree by a local
+            pool of processes, holding at most ``2 * workers`` partial results at a time.
+            Otherwise, the next file is loaded while the previous one is merged.
+        fanin : int, default 8
+            Number of files, or partial results, merged together by each task of the pool
+        compression : int, optional, default 1
+            lz4 compression level of the partial results sent back by the pool
+
+    Returns
+    -------
+        accumulator : Accumulatable
+    """
     from coffea.processor import accumulate
 
     # work on local copy of list
     files_to_accumulate = list(files_to_accumulate)
-    while files_to_accumulate:
-        f = files_to_accumulate.pop()
-
-        with open(f, "rb") as rf:
-            result = _decompress(rf.read())
-        if not accumulator:
-            accumulator = result
-            continue
-
-        accumulator = accumulate([result], accumulator)
-        del result
+    if workers > 1 and len(files_to_accumulate) > fanin:
+        batches = [
+            files_to_accumulate[i : i + fanin]
+            for i in range(0, len(files_to_accumulate), fanin)
+        ]
+        with ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+        ) as pool:
+            result = accumulate_submitted(
+                pool,
+                partial(_accumulate_result_files_compressed, compression=compression),
+                batches,
+                fanin=fanin,
+                max_in_flight=2 * workers,
+                merge=partial(_merge_compressed, compression=compression),
+            )
+        return accumulate([_decompress(result)], accumulator, inplace=True)
+
+    # load the next file while merging the current one
+    with ThreadPoolExecutor(max_workers=1) as loader:
+        files_to_accumulate.reverse()
+        next_result = (
+            loader.submit(_load_result_file, files_to_accumulate.pop())
+            if files_to_accumulate
+            else None
+        )
+        while next_result is not None:
+            result = next_result.result()
+            next_result = (
+                loader.submit(_load_result_file, files_to_accumulate.pop())
+                if files_to_accumulate
+                else None
+            )
+            accumulator = accumulate([result], accumulator, inplace=True)
+            del result
     return accumulator
 
 
@@ -319,7 +384,11 @@ class CoffeaWQ(WorkQueue):
 
         self.console("Merging with local final accumulator...")
         accumulator = accumulate_result_files(
-            [t.outfile_output for t in self.tasks_to_accumulate], accumulator
+            [t.outfile_output for t in self.tasks_to_accumulate],
+            accumulator,
+            workers=os.cpu_count() or 1,
+            fanin=self.executor.treereduction,
+            compression=self.executor.compression,
         )
 
         total_accumulated_events = 0
@@ -8,6 +8,7 @@ import hashlib
 from typing import Any, List, Optional
 
 import awkward
+import dask
 import dask_awkward
 import hist
 import numba
@@ -29,25 +30,243 @@ dak = dask_awkward
 np = numpy
 nb = numba
 
+import collections
+import copy
+import mmap
+import os
+import pickle
+import struct
 import warnings
+from concurrent.futures import ThreadPoolExecutor
 from functools import partial
 
 import cloudpickle
+import lz4.block
 import lz4.frame
 
+# out-of-band buffers format: magic, blocks, footer (pickled index), footer offset, magic
+_OOB_MAGIC = b"COFFEAOB"
+_OOB_ALIGN = 64
+_OOB_TRAILER = struct.Struct("<Q8s")
 
-def load(filename):
-    """Load a coffea file from disk"""
+
+def _oob_compress(block, compression_level):
+    if compression_level < 3:
+        return lz4.block.compress(block, store_size=False)
+    return lz4.block.compress(
+        block, mode="high_compression", compression=compression_level, store_size=False
+    )
+
+
+class _OOBWriter:
+    """Write buffers as (optionally compressed) blocks, compressing in parallel"""
+
+    def __init__(self, fout, pool, compression_level, block_size, window):
+        self.fout = fout
+        self.pool = pool
+        self.compression_level = compression_level
+        self.block_size = block_size
+        self.window = window
+
+    def _write_block(self, raw, compressed):
+        # keep compressed blocks only if they save at least 10%
+        if compressed is not None and len(compressed) < 0.9 * len(raw):
+            data, is_compressed = compressed, True
+        else:
+            data, is_compressed = raw, False
+        offset = self.fout.tell()
+        self.fout.write(data)
+        return (offset, len(data), len(raw), is_compressed)
+
+    def write(self, buffer):
+        raw = memoryview(buffer).cast("B")
+        # align the buffers, so that uncompressed ones can be memory-mapped
+        padding = -self.fout.tell() % _OOB_ALIGN
+        self.fout.write(b"\0" * padding)
+        slices = [
+            raw[i : i + self.block_size] for i in range(0, len(raw), self.block_size)
+        ]
+        blocks = []
+        if self.compression_level is None:
+            blocks = [self._write_block(block, None) for block in slices]
+        else:
+            inflight = collections.deque()
+            for block in slices:
+                if len(inflight) >= self.window:
+                    blocks.append(self._write_block(*_result(inflight.popleft())))
+                future = self.pool.submit(_oob_compress, block, self.compression_level)
+                inflight.append((block, future))
+            while inflight:
+                blocks.append(self._write_block(*_result(inflight.popleft())))
+        return (len(raw), blocks)
+
+
+def _result(item):
+    block, future = item
+    return block, future.result()
+
+
+def _oob_buffer(buffers, buffer):
+    try:
+        buffer.raw()
+    except BufferError:
+        # non-contiguous, keep in-band
+        return True
+    buffers.append(buffer)
+    return False
+
+
+def _oob_save(output, filename, compression_level, block_size, threads):
+    container = None
+    if isinstance(output, dict):
+        items = list(output.items())
+        # the (empty) mapping itself, to restore dict subclasses such as defaultdict
+        container = copy.copy(output)
+        container.clear()
+        container = cloudpickle.dumps(container, protocol=5)
+    else:
+        items = [(None, output)]
+    threads = threads or os.cpu_count() or 1
+    with open(filename, "wb") as fout, ThreadPoolExecutor(threads) as pool:
+        fout.write(_OOB_MAGIC)
+        writer = _OOBWriter(fout, pool, compression_level, block_size, 2 * threads)
+        index = []
+        # one top-level item at a time, so that only its pickle is held in memory
+        for key, value in items:
+            buffers = []
+            payload = cloudpickle.dumps(
+                value, protocol=5, buffer_callback=partial(_oob_buffer, buffers)
+            )
+            entry = {
+                "pickle": writer.write(payload),
+                "buffers": [writer.write(buffer.raw()) for buffer in buffers],
+            }
+            index.append((key, entry))
+        footer_offset = fout.tell()
+        fout.write(
+            pickle.dumps(
+                {"dict": container is not None, "container": container, "index": index},
+                protocol=5,
+            )
+        )
+        fout.write(_OOB_TRAILER.pack(footer_offset, _OOB_MAGIC))
+
+
+def _oob_read(mapped, nbytes, blocks, pool):
+    if all(not is_compressed for _, _, _, is_compressed in blocks):
+        # contiguous uncompressed blocks, memory-mapped (copy-on-write)
+        start = blocks[0][0] if blocks else 0
+        return memoryview(mapped)[start : start + nbytes]
+    out = bytearray(nbytes)
+    view = memoryview(out)
+
+    def read_block(position, block):
+        offset, length, rawlength, is_compressed = block
+        data = memoryview(mapped)[offset : offset + length]
+        if is_compressed:
+            data = lz4.block.decompress(data, uncompressed_size=rawlength)
+        view[position : position + rawlength] = data
+
+    positions = numpy.cumsum([0] + [block[2] for block in blocks])
+    for future in [
+        pool.submit(read_block, position, block)
+        for position, block in zip(positions, blocks)
+    ]:
+        future.result()
+    return out
+
+
+def _oob_load(filename, key, threads):
+    with open(filename, "rb") as fin:
+        mapped = mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_COPY)
+    footer_offset, magic = _OOB_TRAILER.unpack(mapped[-_OOB_TRAILER.size :])
+    if magic != _OOB_MAGIC:
+        raise ValueError(f"{filename} is truncated or corrupted")
+    footer = pickle.loads(mapped[footer_offset : -_OOB_TRAILER.size])
+    index = footer["index"]
+    if key is not None:
+        if not footer["dict"]:
+            raise ValueError(f"{filename} does not contain a dict, cannot load {key!r}")
+        index = [(k, entry) for k, entry in index if k == key]
+        if len(index) == 0:
+            raise KeyError(key)
+
+    out = {}
+    if key is None and footer.get("container", None) is not None:
+        out = pickle.loads(footer["container"])
+    with ThreadPoolExecutor(threads) as pool:
+        for k, entry in index:
+            payload = _oob_read(mapped, *entry["pickle"], pool)
+            buffers = [_oob_read(mapped, *buffer, pool) for buffer in entry["buffers"]]
+            out[k] = pickle.loads(payload, buffers=buffers)
+    if key is not None:
+        return out[key]
+    if not footer["dict"]:
+        return out[None]
+    return out
+
+
+def load(filename, key=None, threads=None):
+    """Load a coffea file from disk
+
+    Parameters
+    ----------
+        filename : str
+            The file, written by ``save``
+        key : Hashable, optional
+            For files written with ``out_of_band=True`` whose content is a dict, only load
+            (and read from disk) the value of this key.
+        threads : int, optional
+            Number of threads decompressing the blocks of files written with ``out_of_band=True``.
+            The uncompressed blocks are memory-mapped rather than read.
+    """
+    with open(filename, "rb") as fin:
+        magic = fin.read(len(_OOB_MAGIC))
+    if magic == _OOB_MAGIC:
+        return _oob_load(filename, key, threads)
+    if key is not None:
+        raise ValueError(
+            f"{filename} was not saved with out_of_band=True, it can only be loaded entirely"
+        )
     with lz4.frame.open(filename) as fin:
         output = cloudpickle.load(fin)
     return output
 
 
-def save(output, filename):
+def save(
+    output,
+    filename,
+    out_of_band=False,
+    compression_level=0,
+    block_size=4 * 1024 * 1024,
+    threads=None,
+):
     """Save a coffea object or collection thereof to disk
 
     This function can accept any picklable object.  Suggested suffix: ``.coffea``
+
+    Parameters
+    ----------
+        output
+            The object to save
+        filename : str
+            The output file
+        out_of_band : bool, default False
+            Use the out-of-band buffers format: the object is pickled with protocol 5 and its large
+            buffers (e.g. histogram storages and numpy arrays) are written as separate blocks, compressed
+            in parallel and streamed to the file, rather than pickled and compressed in memory as a whole.
+            The values of a dict are stored separately, so that one of them can be loaded alone.
+        compression_level : int or None, default 0
+            lz4 compression level (levels 3 and above use the slower high compression mode) of the
+            out-of-band format blocks, or None to store them uncompressed.
+        block_size : int, default 4 MiB
+            Size of the compressed blocks of the out-of-band format
+        threads : int, optional
+            Number of threads compressing the blocks of the out-of-band format
     """
+    if out_of_band:
+        _oob_save(output, filename, compression_level, block_size, threads)
+        return
     with lz4.frame.open(filename, "wb") as fout:
         thepickle = cloudpickle.dumps(output)
         fout.write(thepickle)
@@ -120,6 +339,33 @@ def _gethistogramaxis(name, var, bins, start, stop, edges, transform, delayed_mo
     )
 
 
+def _gethistogramaxes(vars, bins, start, stop, edges, transform, delayed_mode):
+    """Get the hist axes of several variables for plot_vars in PackedSelection
+
+    The missing ranges of all the variables are computed together, by a single compute in
+    delayed mode.
+    """
+    ranges = {}
+    for (name, var), s1, s2, e in zip(vars.items(), start, stop, edges):
+        if e is not None:
+            continue
+        if s1 is None:
+            ranges[name, "start"] = (dak if delayed_mode else ak).min(var)
+        if s2 is None:
+            ranges[name, "stop"] = (dak if delayed_mode else ak).max(var)
+    if delayed_mode:
+        (ranges,) = dask.compute(ranges)
+
+    axes = []
+    for (name, var), b, s1, s2, e, t in zip(
+        vars.items(), bins, start, stop, edges, transform
+    ):
+        s1 = ranges[name, "start"] - 1e-6 if (name, "start") in ranges else s1
+        s2 = ranges[name, "stop"] + 1e-6 if (name, "stop") in ranges else s2
+        axes.append(_gethistogramaxis(name, var, b, s1, s2, e, t, delayed_mode))
+    return axes
+
+
 def _exception_chain(exc: BaseException) -> List[BaseException]:
     """Retrieves the entire exception chain as a list."""
     ret = []
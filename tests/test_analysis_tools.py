@@ -368,6 +368,256 @@ def test_weights_partial_dak(optimization_enabled):
         assert error_raised
 
 
+@pytest.mark.parametrize("modifierStorage", ["separate", "block", "lazy"])
+@pytest.mark.parametrize("dtype", ["float64", "float32"])
+def test_weights_storage(modifierStorage, dtype):
+    from coffea.analysis_tools import Weights
+
+    counts, _, _ = dummy_jagged_eta_pt()
+    rng = np.random.default_rng(42)
+    w1 = rng.normal(loc=1.0, scale=0.01, size=counts.size)
+    w2 = rng.normal(loc=1.3, scale=0.05, size=counts.size)
+    ups = [w2 * (1.0 + 0.01 * i) for i in range(10)]
+    downs = [w2 * (1.0 - 0.01 * i) for i in range(10)]
+
+    def fill(weights):
+        weights.add("w1", w1, weightUp=w1 * 1.1, weightDown=0.1 * w1, shift=True)
+        weights.add_multivariation(
+            "w2",
+            w2,
+            [f"syst{i}" for i in range(10)],
+            [up.copy() for up in ups],
+            [down.copy() for down in downs],
+        )
+        weights.add("w3", w1, weightUp=w1 * 1.2)
+        return weights
+
+    reference = fill(Weights(counts.size, storeIndividual=True))
+    weights = fill(
+        Weights(
+            counts.size,
+            storeIndividual=True,
+            dtype=dtype,
+            modifierStorage=modifierStorage,
+        )
+    )
+    rtol = 1e-6 if dtype == "float32" else 1e-12
+
+    assert weights.variations == reference.variations
+    assert weights.weight().dtype == np.dtype(dtype)
+    assert np.allclose(weights.weight(), reference.weight(), rtol=rtol)
+    for modifier in reference.variations:
+        assert weights.weight(modifier).dtype == np.dtype(dtype)
+        assert np.allclose(
+            weights.weight(modifier), reference.weight(modifier), rtol=rtol
+        )
+    for modifier in ["w1Up", "w1Down", "w3Up", "w3Down"]:
+        assert np.allclose(
+            weights.partial_weight(include=["w1", "w3"], modifier=modifier),
+            reference.partial_weight(include=["w1", "w3"], modifier=modifier),
+            rtol=rtol,
+        )
+    assert np.allclose(
+        weights.partial_weight(exclude=["w1"]),
+        reference.partial_weight(exclude=["w1"]),
+        rtol=rtol,
+    )
+    assert np.allclose(weights.weight_matrix(), reference.weight_matrix(), rtol=rtol)
+    assert weights.weightStatistics["w2"].sumw == pytest.approx(
+        reference.weightStatistics["w2"].sumw, rel=rtol
+    )
+
+    if modifierStorage == "block":
+        # one row per stored modifier, in a single array
+        block = weights._modifiers.block
+        assert block.shape == (23, counts.size)
+        assert block.dtype == np.dtype(dtype)
+        # stacked once, the modifiers are then views of the block
+        assert weights._modifiers.block is block
+        assert np.shares_memory(weights._modifiers["w2_syst3Up"], block)
+    if modifierStorage == "lazy":
+        # the modifiers are recomputed from the added arrays, which are left untouched
+        assert np.array_equal(weights._modifiers._inputs["w2_syst3Up"][1], ups[3])
+        assert np.allclose(weights._modifiers["w2_syst3Up"], ups[3] / w2, rtol=rtol)
+
+    with pytest.raises(ValueError):
+        Weights(counts.size, modifierStorage="compact")
+
+
+@pytest.mark.parametrize("optimization_enabled", [True, False])
+def test_weights_storage_dak(optimization_enabled):
+    import dask
+    import dask.array as da
+    import dask_awkward as dak
+
+    from coffea.analysis_tools import Weights
+
+    with dask.config.set({"awkward.optimization.enabled": optimization_enabled}):
+        counts, _, _ = dummy_jagged_eta_pt()
+        w1 = dak.from_dask_array(
+            da.random.normal(loc=1.0, scale=0.01, size=counts.size)
+        )
+
+        weights = Weights(None, dtype="float32", modifierStorage="block")
+        weights.add("w1", w1, weightUp=w1 * 1.1)
+        assert weights.weight().compute().layout.dtype == np.float32
+        assert weights.weight("w1Up").compute().layout.dtype == np.float32
+        assert np.allclose(
+            weights.weight("w1Up").compute(), (w1 * 1.1).compute(), rtol=1e-6
+        )
+
+
+def test_weights_memo():
+    import gc
+    import weakref
+
+    from coffea.analysis_tools import Weights
+
+    counts, _, _ = dummy_jagged_eta_pt()
+    w1 = np.random.normal(loc=1.0, scale=0.01, size=counts.size)
+    w2 = np.random.normal(loc=1.3, scale=0.05, size=counts.size)
+
+    weights = Weights(counts.size, storeIndividual=True, cache_size=3)
+    weights.add("w1", w1, weightUp=w1 * 1.1)
+    weights.add("w2", w2)
+
+    # include and exclude are order-insensitive
+    partial = weights.partial_weight(include=["w1", "w2"])
+    assert weights.partial_weight(include=("w2", "w1")) is partial
+    assert weights.weight("w1Up") is weights.weight("w1Up")
+    assert len(weights._memo) == 2
+    assert weights._memo.nbytes == 2 * partial.nbytes
+
+    # adding a weight invalidates the memo
+    weights.add("w3", w1, weightUp=w1 * 1.2)
+    assert len(weights._memo) == 0
+    assert np.allclose(weights.partial_weight(include=["w2", "w1"]), w1 * w2)
+    assert np.allclose(weights.weight("w1Up"), w1 * w1 * w2 * 1.1)
+
+    # bounded in size and bytes, least recently used first
+    for modifier in ["w1Up", "w1Down", "w3Up", "w3Down"]:
+        weights.weight(modifier)
+    assert len(weights._memo) == 3
+    assert ("weight", "w1Up") not in weights._memo._entries
+    weights = Weights(counts.size, cache_bytes=w1.nbytes)
+    weights.add("w1", w1, weightUp=w1 * 1.1)
+    weights.weight("w1Up")
+    weights.weight("w1Down")
+    assert len(weights._memo) == 1
+    assert weights._memo.nbytes == w1.nbytes
+
+    # the memo belongs to the instance
+    ref = weakref.ref(weights)
+    del weights
+    gc.collect()
+    assert ref() is None
+
+
+def test_weights_variation_matrix():
+    import hist
+
+    from coffea.analysis_tools import Weights
+
+    counts, _, test_pt = dummy_jagged_eta_pt()
+    x = np.random.uniform(-1, 11, size=counts.size)
+    flavor = np.random.choice(["b", "c", "l"], size=counts.size)
+    scale_central = np.random.normal(loc=1.0, scale=0.01, size=counts.size)
+
+    weight = Weights(counts.size)
+    weight.add("test", scale_central, weightUp=scale_central * 1.10)
+    weight.add(
+        "testShift",
+        scale_central,
+        weightUp=0.10 * scale_central,
+        weightDown=0.05 * scale_central,
+        shift=True,
+    )
+
+    modifiers = ["testUp", "testDown", "testShiftUp", "testShiftDown"]
+    matrix = weight.weight_matrix(modifiers)
+    assert matrix.shape == (counts.size, 5)
+    assert np.allclose(matrix[:, 0], weight.weight())
+    for i, modifier in enumerate(modifiers):
+        assert np.allclose(matrix[:, i + 1], weight.weight(modifier))
+    assert weight.weight_matrix(nominal=False).shape == (counts.size, 4)
+
+    labels = ["nominal"] + modifiers
+    expected = (
+        hist.Hist.new.Reg(10, 0, 10, name="x")
+        .StrCat(["b", "c"], name="flavor")
+        .StrCat(labels, name="syst")
+        .Weight()
+    )
+    for label, modifier in zip(labels, [None] + modifiers):
+        expected.fill(x=x, flavor=flavor, syst=label, weight=weight.weight(modifier))
+
+    # single bincount, and one fill per variation for a growing axis
+    for growth in (False, True):
+        h = (
+            hist.Hist.new.Reg(10, 0, 10, name="x")
+            .StrCat(["b", "c"], name="flavor")
+            .StrCat([] if growth else labels, name="syst", growth=growth)
+            .Weight()
+        )
+        out = weight.fill_variations(h, "syst", modifiers, x=x, flavor=flavor)
+        assert out is h
+        for label in labels:
+            assert np.allclose(
+                h[:, :, label].values(flow=True),
+                expected[:, :, label].values(flow=True),
+            )
+            assert np.allclose(
+                h[:, :, label].variances(flow=True),
+                expected[:, :, label].variances(flow=True),
+            )
+
+
+@pytest.mark.parametrize("optimization_enabled", [True, False])
+def test_weights_variation_matrix_dak(optimization_enabled):
+    import dask
+    import dask.array as da
+    import dask_awkward as dak
+    import hist
+    import hist.dask
+
+    from coffea.analysis_tools import Weights
+
+    with dask.config.set({"awkward.optimization.enabled": optimization_enabled}):
+        counts, _, _ = dummy_jagged_eta_pt()
+        scale_central = dak.from_dask_array(
+            da.random.normal(loc=1.0, scale=0.01, size=counts.size)
+        )
+        x = dak.from_dask_array(da.random.uniform(0, 10, size=counts.size))
+
+        weight = Weights(None)
+        weight.add("test", scale_central, weightUp=scale_central * 1.10)
+
+        matrix = weight.weight_matrix()
+        nominal, up, down = dask.compute(
+            weight.weight(), weight.weight("testUp"), weight.weight("testDown")
+        )
+        computed = matrix.compute().to_numpy()
+        assert computed.shape == (counts.size, 3)
+        assert np.allclose(computed[:, 0], nominal)
+        assert np.allclose(computed[:, 1], down)
+        assert np.allclose(computed[:, 2], up)
+
+        template = (
+            hist.dask.Hist.new.Reg(10, 0, 10, name="x")
+            .StrCat(["nominal", "testDown", "testUp"], name="syst")
+            .Weight()
+        )
+        filled = weight.fill_variations(template, "syst", x=x)
+        assert filled is template
+        h, xs = dask.compute(filled, x)
+        assert isinstance(h, hist.Hist)
+        for i, w in enumerate([nominal, down, up]):
+            c, _ = np.histogram(xs, bins=10, range=(0, 10), weights=w)
+            assert np.allclose(h.values()[:, i], c)
+            c, _ = np.histogram(xs, bins=10, range=(0, 10), weights=w**2)
+            assert np.allclose(h.variances()[:, i], c)
+
+
 @pytest.mark.parametrize("dtype", ["uint16", "uint32", "uint64"])
 def test_packed_selection_basic(dtype):
     import awkward as ak
@@ -458,6 +708,309 @@ def test_packed_selection_basic(dtype):
         sel.add("dask_array", daskarray)
 
 
+def test_packed_selection_memo():
+    from coffea.analysis_tools import PackedSelection
+
+    fizz = np.arange(10) % 3 == 0
+    buzz = np.arange(10) % 5 == 0
+
+    sel = PackedSelection(cache_size=2)
+    sel.add("fizz", fizz)
+    sel.add("buzz", buzz)
+
+    # requirements are order-insensitive
+    mask = sel.require(fizz=True, buzz=False)
+    assert sel.require(buzz=False, fizz=True) is mask
+    assert sel.require(buzz=0, fizz=1) is mask
+    assert sel.any("buzz", "fizz") is sel.any("fizz", "buzz")
+    assert np.all(mask == (fizz & ~buzz))
+
+    # adding a selection invalidates the memo
+    sel.add("fizzbuzz", fizz & buzz)
+    assert len(sel._memo) == 0
+    assert np.all(sel.all() == (fizz & buzz))
+    sel.any("fizz")
+    sel.any("buzz")
+    assert len(sel._memo) == 2
+
+    sel = PackedSelection(cache_size=0)
+    sel.add("fizz", fizz)
+    assert sel.all("fizz") is not sel.all("fizz")
+    assert len(sel._memo) == 0
+
+
+def test_packed_selection_bitset():
+    from coffea.analysis_tools import PackedSelection
+
+    rng = np.random.default_rng(42)
+    cuts = {f"cut{i}": rng.random(100) < 0.9 for i in range(150)}
+    names = list(cuts)
+
+    sel = PackedSelection(dtype="bitset")
+    assert sel.maxitems is None
+    sel.add_multiple(cuts)
+    # about one bit per selection per event
+    assert sel._data.shape == (100, 3)
+    assert sel._data.dtype == np.uint64
+
+    required = {"cut3": True, "cut70": False, "cut140": True}
+    assert np.array_equal(
+        sel.require(**required), cuts["cut3"] & ~cuts["cut70"] & cuts["cut140"]
+    )
+    assert np.array_equal(sel.all(), np.all([cuts[n] for n in names], axis=0))
+    assert np.array_equal(sel.allfalse(), ~np.any([cuts[n] for n in names], axis=0))
+    assert np.array_equal(
+        sel.any("cut0", "cut64", "cut149"),
+        cuts["cut0"] | cuts["cut64"] | cuts["cut149"],
+    )
+
+    # the same results as a single word for the first 64 selections
+    packed = PackedSelection(dtype="uint64")
+    packed.add_multiple({name: cuts[name] for name in names[:64]})
+    nminusone = sel.nminusone(*names[50:64]).result()
+    expected = packed.nminusone(*names[50:64]).result()
+    assert np.array_equal(nminusone.nev, expected.nev)
+    cutflow = sel.cutflow(*names[60:64]).result()
+    expected = packed.cutflow(*names[60:64]).result()
+    assert np.array_equal(cutflow.nevcutflow, expected.nevcutflow)
+    assert np.array_equal(cutflow.nevonecut, expected.nevonecut)
+
+    with pytest.raises(
+        ValueError,
+        match=r"New selection 'wrong_shape' has a different shape than existing selections \(\(5,\) vs. \(100,\)\)",
+    ):
+        sel.add("wrong_shape", np.ones(5, dtype=bool))
+
+
+@pytest.mark.parametrize("optimization_enabled", [True, False])
+def test_packed_selection_bitset_dak(optimization_enabled):
+    import awkward as ak
+    import dask
+    import dask_awkward as dak
+
+    from coffea.analysis_tools import PackedSelection
+
+    with dask.config.set({"awkward.optimization.enabled": optimization_enabled}):
+        events = dakevents
+        eager = eagerevents
+        sel = PackedSelection(dtype="bitset")
+        expected = PackedSelection(dtype="bitset")
+        for i in range(70):
+            threshold = 5.0 + i
+            sel.add(f"pt{i}", dak.any(events.Muon.pt > threshold, axis=1))
+            expected.add(
+                f"pt{i}", ak.to_numpy(ak.any(eager.Muon.pt > threshold, axis=1))
+            )
+            if i == 40:
+                sel.require(pt3=True)
+
+        assert sel.delayed_mode is True
+        # the selections added before and after the first use are packed by one layer each
+        layers = [
+            name
+            for name in sel._data.dask.layers
+            if name.startswith("packed-selection-add")
+        ]
+        assert len(layers) == 2
+        assert sel.require(pt3=True, pt65=False).compute().tolist() == (
+            expected.require(pt3=True, pt65=False).tolist()
+        )
+        assert sel.any("pt69", "pt10").compute().tolist() == (
+            expected.any("pt69", "pt10").tolist()
+        )
+        assert sel.all().compute().tolist() == expected.all().tolist()
+
+        (nev,) = dask.compute(sel.nminusone("pt3", "pt65", "pt69").result().nev)
+        assert nev == list(expected.nminusone("pt3", "pt65", "pt69").result().nev)
+        (nev,) = dask.compute(sel.cutflow("pt3", "pt65").result().nevcutflow)
+        assert nev == list(expected.cutflow("pt3", "pt65").result().nevcutflow)
+
+
+@pytest.mark.parametrize("dtype", ["uint16", "uint64", "bitset"])
+def test_packed_selection_counts(dtype):
+    from coffea.analysis_tools import PackedSelection, _selection_counts
+
+    rng = np.random.default_rng(7)
+    ncuts = 16 if dtype == "uint16" else 80 if dtype == "bitset" else 64
+    cuts = {f"cut{i}": rng.random(200) < 0.95 for i in range(ncuts)}
+    weights = rng.normal(1.0, 0.2, size=200)
+    sel = PackedSelection(dtype=dtype)
+    sel.add_multiple(cuts)
+
+    names = list(cuts)[-8:]
+    indices = [sel.names.index(name) for name in names]
+    counts, sums = _selection_counts(sel._data, indices, weights)
+    masks = (
+        [np.ones(200, dtype=bool)]
+        + [cuts[name] for name in names]
+        + [np.all([cuts[n] for n in names[: i + 1]], axis=0) for i in range(8)]
+        + [np.all([cuts[n] for n in names if n != name], axis=0) for name in names]
+        + [np.all([cuts[n] for n in names], axis=0)]
+    )
+    assert counts.tolist() == [mask.sum() for mask in masks]
+    assert np.allclose(sums[0], [weights[mask].sum() for mask in masks])
+    assert np.allclose(sums[1], [(weights[mask] ** 2).sum() for mask in masks])
+
+    # the masks of eager results are only computed when used
+    nminusone = sel.nminusone(*names)
+    assert nminusone._NminusOne__masks is None
+    assert nminusone.result().nev == counts[:1].tolist() + counts[17:].tolist()
+    assert np.array_equal(nminusone.result().masks[-1], masks[-1])
+    cutflow = sel.cutflow(*names)
+    assert cutflow._Cutflow__maskscutflow is None
+    assert cutflow.result().nevcutflow == counts[:1].tolist() + counts[9:17].tolist()
+    assert np.array_equal(cutflow.result().maskscutflow[2], masks[11])
+
+
+@pytest.mark.parametrize("delayed", [False, True])
+def test_packed_selection_weighted_yields(delayed, tmp_path):
+    import awkward as ak
+    import dask
+    import dask_awkward as dak
+
+    from coffea.analysis_tools import PackedSelection, Weights
+
+    rng = np.random.default_rng(11)
+    cuts = {name: rng.random(500) < p for name, p in zip("abc", (0.5, 0.7, 0.9))}
+    weight = rng.normal(1.0, 0.2, size=500)
+    shift = 1.0 + 0.1 * rng.random(500)
+
+    def convert(array):
+        return dak.from_awkward(ak.Array(array), 3) if delayed else array
+
+    sel = PackedSelection()
+    sel.add_multiple({name: convert(cut) for name, cut in cuts.items()})
+    weights = Weights(None if delayed else 500)
+    weights.add("w", convert(weight), convert(weight * shift))
+    variations = {"nominal": weight, "wUp": weight * shift}
+
+    def sums(masks):
+        return (
+            {v: [w[mask].sum() for mask in masks] for v, w in variations.items()},
+            {
+                v: [(w[mask] ** 2).sum() for mask in masks]
+                for v, w in variations.items()
+            },
+        )
+
+    everything = np.ones(500, dtype=bool)
+    onecut = [everything] + list(cuts.values())
+    cutflow = [everything] + [
+        cuts["a"],
+        cuts["a"] & cuts["b"],
+        cuts["a"] & cuts["b"] & cuts["c"],
+    ]
+    nminusone = [
+        everything,
+        cuts["b"] & cuts["c"],
+        cuts["a"] & cuts["c"],
+        cuts["a"] & cuts["b"],
+        cutflow[-1],
+    ]
+
+    with pytest.raises(ValueError, match="modifiers can only be given"):
+        sel.cutflow("a", "b", "c", weights=convert(weight), modifiers=["wUp"])
+    with pytest.raises(ValueError, match="no weights"):
+        sel.cutflow("a", "b", "c").weighted_result()
+
+    result = sel.cutflow("a", "b", "c", weights=weights, modifiers=["wUp"])
+    (weighted,) = dask.compute(result.weighted_result())
+    assert weighted.variations == ["nominal", "wUp"]
+    for variation in variations:
+        for actual, expected in zip(weighted[2:], sums(onecut) + sums(cutflow)):
+            assert np.allclose(actual[variation], expected[variation])
+    honecut, hcutflow, labels = result.yieldhist()
+    if delayed:
+        honecut, hcutflow = dask.compute(honecut, hcutflow)
+    assert hcutflow.axes.name == ("cutflow", "variation")
+    assert np.allclose(honecut.values()[:, 1], sums(onecut)[0]["wUp"])
+    assert np.allclose(hcutflow.variances()[:, 0], sums(cutflow)[1]["nominal"])
+    result.to_npz(tmp_path / "cutflow.npz", compute=True)
+    with np.load(tmp_path / "cutflow.npz") as npz:
+        assert npz["variations"].tolist() == ["nominal", "wUp"]
+        assert np.allclose(npz["sumw2onecut"], [sums(onecut)[1][v] for v in variations])
+
+    result = sel.nminusone("a", "b", "c", weights=convert(weight))
+    (weighted,) = dask.compute(result.weighted_result())
+    assert weighted.variations == ["nominal"]
+    assert np.allclose(weighted.sumw["nominal"], sums(nminusone)[0]["nominal"])
+    assert np.allclose(weighted.sumw2["nominal"], sums(nminusone)[1]["nominal"])
+    h, labels = result.yieldhist()
+    h = h.compute() if delayed else h
+    assert np.allclose(h.values()[:, 0], sums(nminusone)[0]["nominal"])
+    result.to_npz(tmp_path / "nminusone.npz", compute=True)
+    with np.load(tmp_path / "nminusone.npz") as npz:
+        assert np.allclose(npz["sumw"], [sums(nminusone)[0]["nominal"]])
+
+
+@pytest.mark.parametrize("delayed", [False, True])
+def test_packed_selection_plot_vars_steps(delayed, monkeypatch):
+    import awkward as ak
+    import dask
+    import dask_awkward as dak
+
+    from coffea.analysis_tools import NminusOne, PackedSelection
+
+    rng = np.random.default_rng(3)
+    cuts = {name: rng.random(300) < p for name, p in zip("abc", (0.5, 0.7, 0.9))}
+    jagged = ak.unflatten(rng.random(450), rng.multinomial(450, [1 / 300] * 300))
+    flat = rng.random(300)
+
+    def convert(array):
+        return dak.from_awkward(ak.Array(array), 3) if delayed else array
+
+    sel = PackedSelection(dtype="bitset")
+    sel.add_multiple({name: convert(cut) for name, cut in cuts.items()})
+
+    # the ranges of all the variables are computed at once
+    computes = []
+    compute = dask.compute
+    monkeypatch.setattr(
+        dask,
+        "compute",
+        lambda *args, **kwargs: computes.append(args) or compute(*args, **kwargs),
+    )
+    nminusone = sel.nminusone("c", "a", "b")
+    hists, labels = nminusone.plot_vars(
+        {"jagged": convert(jagged), "flat": convert(flat)}
+    )
+    assert len(computes) == (1 if delayed else 0)
+    monkeypatch.undo()
+    if delayed:
+        (hists,) = dask.compute(hists)
+
+    masks = [
+        np.ones(300, dtype=bool),
+        cuts["a"] & cuts["b"],
+        cuts["c"] & cuts["b"],
+        cuts["c"] & cuts["a"],
+        cuts["a"] & cuts["b"] & cuts["c"],
+    ]
+    for h, array in zip(hists, [jagged, flat]):
+        for i, mask in enumerate(masks):
+            values = ak.to_numpy(ak.flatten(array[mask], axis=None))
+            assert np.array_equal(
+                h[:, i].counts(), np.histogram(values, bins=h.axes[0].edges)[0]
+            )
+
+    # the histograms of results built from masks only are the same
+    frommasks = NminusOne(nminusone._names, nminusone._nev, nminusone._masks, delayed)
+    h = frommasks.plot_vars({"jagged": convert(jagged)})[0][0]
+    assert np.array_equal((h.compute() if delayed else h).values(), hists[0].values())
+
+    honecut, hcutflow, labels = sel.cutflow("c", "a", "b").plot_vars(
+        {"jagged": convert(jagged)}, bins=[5], start=[0], stop=[1]
+    )
+    if delayed:
+        honecut, hcutflow = dask.compute(honecut, hcutflow)
+    assert hcutflow[0].axes.name == ("jagged", "cutflow")
+    for i, mask in enumerate([masks[0], cuts["c"], cuts["c"] & cuts["a"], masks[-1]]):
+        values = ak.to_numpy(ak.flatten(jagged[mask]))
+        assert np.array_equal(
+            hcutflow[0][:, i].counts(), np.histogram(values, bins=5, range=(0, 1))[0]
+        )
+
+
 def test_packed_selection_nminusone():
     import awkward as ak
 
@@ -679,6 +1232,36 @@ def test_packed_selection_cutflow():
             assert np.all(counts == c)
 
 
+@pytest.mark.parametrize("dtype", ["uint32", "bitset"])
+def test_packed_selection_results_pickle(dtype):
+    import pickle
+
+    from coffea.analysis_tools import PackedSelection
+
+    rng = np.random.default_rng(3)
+    cuts = {f"cut{i}": rng.random(100) < 0.8 for i in range(5)}
+    sel = PackedSelection(dtype=dtype)
+    sel.add_multiple(cuts)
+    names = ["cut4", "cut0", "cut2"]
+
+    nminusone = pickle.loads(pickle.dumps(sel.nminusone(*names)))
+    assert np.array_equal(nminusone.result().nev, sel.nminusone(*names).result().nev)
+    for i, mask in enumerate(nminusone._masks[:-1]):
+        assert np.array_equal(mask, sel.all(*(names[:i] + names[i + 1 :])))
+    assert np.array_equal(nminusone._masks[-1], sel.all(*names))
+
+    cutflow = pickle.loads(pickle.dumps(sel.cutflow(*names)))
+    assert np.array_equal(
+        cutflow.result().nevcutflow, sel.cutflow(*names).result().nevcutflow
+    )
+    for i, name in enumerate(names):
+        assert np.array_equal(cutflow._masksonecut[i], sel.any(name))
+        assert np.array_equal(cutflow._maskscutflow[i], sel.all(*names[: i + 1]))
+    # the masks are pickled once computed
+    cutflow = pickle.loads(pickle.dumps(cutflow))
+    assert np.array_equal(cutflow._maskscutflow[-1], sel.all(*names))
+
+
 @pytest.mark.parametrize("optimization_enabled", [True, False])
 @pytest.mark.parametrize("dtype", ["uint16", "uint32", "uint64"])
 def test_packed_selection_basic_dak(optimization_enabled, dtype):
@@ -1298,3 +1881,82 @@ def test_packed_selection_cutflow_dak_uproot_only(optimization_enabled):
                 counts = h[:, i].counts()
                 c, e = np.histogram(dak.flatten(array[truth]).compute(), bins=edges)
                 assert np.all(counts == c)
+
+
+@pytest.mark.parametrize("delayed", [False, True])
+def test_histogram_book(delayed):
+    import awkward as ak
+    import dask
+    import dask_awkward as dak
+    import hist
+    import hist.dask
+
+    from coffea.analysis_tools import HistogramBook
+
+    rng = np.random.default_rng(5)
+    counts = rng.integers(0, 4, size=400)
+    jetpt = ak.unflatten(rng.uniform(0, 100, size=counts.sum()), counts)
+    met = rng.uniform(0, 100, size=400)
+    weight = rng.normal(1.0, 0.2, size=400)
+    lowmet, highmet = met < 50, met >= 50
+
+    def convert(array):
+        return dak.from_awkward(ak.Array(array), 4) if delayed else array
+
+    Hist = hist.dask.Hist if delayed else hist.Hist
+    book = HistogramBook(delayed=delayed)
+    book.book("met", Hist(hist.axis.Regular(10, 0, 100, name="met"), storage="weight"))
+    book.book(
+        "jetpt",
+        Hist(
+            hist.axis.Regular(10, 0, 100, name="pt"),
+            hist.axis.StrCategory(["low", "high"], name="region"),
+        ),
+    )
+    with pytest.raises(ValueError, match="already booked"):
+        book.book("met", Hist(hist.axis.Regular(10, 0, 100, name="met")))
+    with pytest.raises(ValueError, match="No histogram named"):
+        book.fill("ht", ht=convert(met))
+    with pytest.raises(ValueError, match="one array of values for each axis"):
+        book.fill("jetpt", pt=convert(jetpt))
+    with pytest.raises(ValueError, match="dask_awkward.Array objects in delayed mode"):
+        book.fill("met", met=met if delayed else dak.from_awkward(ak.Array(met), 1))
+
+    book.fill("met", met=convert(met), mask=convert(lowmet), weight=convert(weight))
+    book.fill("met", met=convert(met))
+    for region, mask in [("low", lowmet), ("high", highmet)]:
+        book.fill(
+            "jetpt",
+            pt=convert(jetpt),
+            region=region,
+            mask=convert(mask),
+            weight=convert(weight),
+        )
+    assert book.names == ["met", "jetpt"]
+
+    hists = book.result()
+    if delayed:
+        assert all(isinstance(h, hist.dask.Hist) for h in hists.values())
+        # all the histograms are filled by the same task of each partition
+        layers = [
+            {name for name in h.dask.layers if name.startswith("histogram-book-")}
+            for h in hists.values()
+        ]
+        assert len(set.union(*layers)) == 3
+        assert len(set.intersection(*layers)) == 1
+        (hists,) = dask.compute(hists)
+
+    expected = hist.Hist(hist.axis.Regular(10, 0, 100, name="met"), storage="weight")
+    expected.fill(met=met[lowmet], weight=weight[lowmet])
+    expected.fill(met=met)
+    assert np.allclose(hists["met"].values(), expected.values())
+    assert np.allclose(hists["met"].variances(), expected.variances())
+    for region, mask in [("low", lowmet), ("high", highmet)]:
+        jetweight = ak.broadcast_arrays(weight, jetpt)[0]
+        values, _ = np.histogram(
+            ak.to_numpy(ak.flatten(jetpt[mask])),
+            bins=10,
+            range=(0, 100),
+            weights=ak.to_numpy(ak.flatten(jetweight[mask])),
+        )
+        assert np.allclose(hists["jetpt"][:, region].values(), values)
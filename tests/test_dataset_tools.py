@@ -1,10 +1,14 @@
 import dask
+import dask_awkward
+import distributed
 import pytest
 import uproot
 from distributed import Client
 
 from coffea.dataset_tools import (
     apply_to_fileset,
+    compute_with_checkpoints,
+    compute_with_dynamic_steps,
     filter_files,
     get_failed_steps_for_fileset,
     max_chunks,
@@ -392,6 +396,120 @@ def test_preprocess_failed_file():
         )
 
 
+def test_preprocess_replicas_failover():
+    fileset = {
+        "ZJets": {
+            "files": {
+                "tests/samples/nano_dy_not_there.root": {
+                    "object_path": "Events",
+                    "replicas": ["tests/samples/nano_dy.root"],
+                }
+            }
+        }
+    }
+    with Client() as _:
+        dataset_runnable, dataset_updated = preprocess(
+            fileset,
+            step_size=7,
+            align_clusters=False,
+            files_per_batch=10,
+        )
+
+        finfo = dataset_runnable["ZJets"]["files"][
+            "tests/samples/nano_dy_not_there.root"
+        ]
+        assert finfo["num_entries"] == 40
+        assert finfo["replicas"] == ["tests/samples/nano_dy.root"]
+
+        out = apply_to_fileset(
+            lambda events: dask_awkward.num(events, axis=0),
+            dataset_runnable,
+            schemaclass=NanoAODSchema,
+        )
+        (out,) = dask.compute(out)
+        assert out == {"ZJets": 40}
+
+
+def test_preprocess_sums():
+    with Client() as _:
+        dataset_runnable, dataset_updated = preprocess(
+            _starting_fileset,
+            step_size=7,
+            skip_bad_files=True,
+            sums_object_path="Runs",
+        )
+
+    sums = dataset_runnable["ZJets"]["metadata"]["sums"]
+    assert sums["object_path"] == "Runs"
+    assert sums["total"]["num_entries"] == 40
+    assert sums["total"]["genEventCount"] == 850098
+    assert sums["total"]["genEventSumw"] == pytest.approx(1.51666867e10)
+    assert sums["files"]["tests/samples/nano_dy.root"] == sums["total"]
+
+    data_sums = dataset_updated["Data"]["metadata"]["sums"]
+    assert data_sums["total"] == {"num_entries": 40}
+    assert list(data_sums["files"].keys()) == ["tests/samples/nano_dimuon.root"]
+
+
+def _scheduler_restrictions(dask_scheduler):
+    return [
+        (ts.host_restrictions, ts.resource_restrictions, ts.loose_restrictions)
+        for ts in dask_scheduler.tasks.values()
+        if ts.host_restrictions or ts.resource_restrictions
+    ]
+
+
+def test_apply_to_fileset_data_locality():
+    from coffea.nanoevents.locality import discover_data_locality
+
+    fileset = max_chunks(_runnable_result, 2)
+    with Client(n_workers=1, resources={"T2_LOCAL": 1}) as client:
+        data_locality = {"tests/samples/nano_dy": "127.0.0.1", "tests/": "junk.host"}
+        out = apply_to_fileset(
+            lambda events: dask_awkward.count(events.run, axis=None),
+            fileset,
+            schemaclass=NanoAODSchema,
+            data_locality=data_locality,
+        )
+        optimizations = dask.config.get("optimizations", ())
+        persisted = dict(zip(out, client.persist(list(out.values()))))
+        distributed.wait(list(persisted.values()))
+        restrictions = client.run_on_scheduler(_scheduler_restrictions)
+        assert (
+            sorted((sorted(hosts), loose) for hosts, _, loose in restrictions)
+            == [(["127.0.0.1"], True)] * 2 + [(["junk.host"], True)] * 2
+        )
+        assert {key: value.compute() for key, value in persisted.items()} == {
+            "ZJets": 14,
+            "Data": 14,
+        }
+        del persisted
+
+        out = apply_to_fileset(
+            lambda events: dask_awkward.count(events.run, axis=None),
+            fileset,
+            schemaclass=NanoAODSchema,
+            data_locality={"tests/": "T2_LOCAL"},
+            locality_annotation="resources",
+        )
+        persisted = dict(zip(out, client.persist(list(out.values()))))
+        distributed.wait(list(persisted.values()))
+        restrictions = client.run_on_scheduler(_scheduler_restrictions)
+        assert [resources for _, resources, _ in restrictions if resources] == [
+            {"T2_LOCAL": 1}
+        ] * 4
+        assert {key: value.compute() for key, value in persisted.items()} == {
+            "ZJets": 14,
+            "Data": 14,
+        }
+        # the annotations are carried by the collections, not by the dask configuration
+        assert dask.config.get("optimizations", ()) == optimizations
+
+        locality = discover_data_locality(client)
+        assert locality("root://127.0.0.1:1094//store/file.root") == ["127.0.0.1"]
+        assert locality("root://eos.example.org//store/file.root") is None
+
+
 def test_filter_files():
     filtered_files = filter_files(_updated_result)
 
@@ -566,3 +684,356 @@ def test_recover_failed_chunks():
             }
         }
     }
+
+
+class _FakeRucioClient:
+    def __init__(self, nfiles, sites, types={}):
+        self.nfiles = nfiles
+        self.sites = sites
+        self.types = types
+        self.nqueries = 0
+
+    def list_dids(self, scope, filters, long=False):
+        name = filters["name"].replace("*", "")
+        return [f"{name}/Run-v1/NANOAODSIM", f"{name}/Run-v2/NANOAODSIM"]
+
+    def list_replicas(self, dids):
+        self.nqueries += 1
+        for i in range(self.nfiles):
+            name = f"/store/mc/file{i}.root"
+            yield {
+                "name": name,
+                "bytes": 1000000,
+                "rses": {site: [f"{site}:{name}"] for site in self.sites},
+                "pfns": {
+                    f"{site}:{name}": {
+                        "type": self.types.get(site, "DISK"),
+                        "volatile": False,
+                    }
+                    for site in self.sites
+                },
+                "states": {site: "AVAILABLE" for site in self.sites},
+            }
+
+
+def test_rucio_best_replicas():
+    pytest.importorskip("rucio")
+    from coffea.dataset_tools import rucio_utils
+
+    sites = ["T2_SLOW", "T2_FAST", "T3_MEDIUM"]
+    sites_map = {site: f"root://{site.lower()}.example.org/" for site in sites}
+    latencies = {"T2_SLOW": 0.2, "T2_FAST": 0.0001, "T3_MEDIUM": 0.01}
+    probed = []
+    now = [0.0]
+
+    def clock():
+        return now[0]
+
+    def probe_reader(pfn, nbytes):
+        # advances the fake clock by the latency and the transfer time at 100 MB/s
+        site = pfn.split("//")[1].split(".")[0].upper()
+        probed.append(site)
+        now[0] += latencies[site] + nbytes / 1e8
+        return b"0" * nbytes
+
+    client = _FakeRucioClient(10, sites)
+
+    with pytest.raises(NotImplementedError):
+        rucio_utils.get_dataset_files_replicas(
+            "/dataset", mode="roundrobin", client=client, sites_xrootd_prefix=sites_map
+        )
+
+    files, outsites, counts = rucio_utils.get_dataset_files_replicas(
+        "/dataset",
+        mode="first",
+        client=client,
+        sites_xrootd_prefix=sites_map,
+    )
+    assert outsites == ["T2_SLOW"] * 10
+    assert counts == {"T2_SLOW": 10}
+
+    # each site is probed once (latency and throughput reads) and then cached
+    cache = {}
+    for _ in range(2):
+        for site in sites:
+            performance = rucio_utils.probe_site_performance(
+                site, sites_map[site], probe_reader, cache=cache, clock=clock
+            )
+            assert performance["latency"] == pytest.approx(latencies[site], rel=1e-3)
+            assert performance["throughput"] == pytest.approx(1e8)
+    assert sorted(probed) == sorted(sites * 2)
+
+    replicas = [
+        [{"pfn": sites_map[site] + f"file{i}.root", "site": site} for site in sites]
+        for i in range(10)
+    ]
+    files, outsites = rucio_utils.select_best_replicas(replicas, probe_cache=cache)
+    assert outsites == ["T2_FAST"] * 10
+    assert files[0] == "root://t2_fast.example.org/file0.root"
+    assert len(probed) == 6
+
+    # load balancing constraint
+    files, outsites = rucio_utils.select_best_replicas(
+        replicas, probe_cache=cache, max_site_fraction=0.5
+    )
+    assert outsites.count("T2_FAST") == 5
+    assert outsites.count("T3_MEDIUM") == 5
+
+    # replicas on tape are ranked by the cost model rather than discarded
+    rucio_utils._site_performance_cache.update(cache)
+    tape_client = _FakeRucioClient(4, sites, types={"T2_FAST": "TAPE"})
+    files, outsites, counts = rucio_utils.get_dataset_files_replicas(
+        "/dataset", mode="best", client=tape_client, sites_xrootd_prefix=sites_map
+    )
+    assert counts == {"T3_MEDIUM": 4}
+    tape_client = _FakeRucioClient(4, ["T2_FAST"], types={"T2_FAST": "TAPE"})
+    files, outsites, counts = rucio_utils.get_dataset_files_replicas(
+        "/dataset", mode="best", client=tape_client, sites_xrootd_prefix=sites_map
+    )
+    assert counts == {"T2_FAST": 4}
+    # only the replicas on disk and available are probed
+    probed.clear()
+    files, outsites = rucio_utils.select_best_replicas(
+        [
+            [
+                {"pfn": sites_map["T2_FAST"], "site": "T2_FAST", "type": "TAPE"},
+                {"pfn": sites_map["T2_SLOW"], "site": "T2_SLOW"},
+            ]
+        ],
+        probe_reader=probe_reader,
+        probe_cache={},
+    )
+    assert probed == ["T2_SLOW", "T2_SLOW"]
+    assert outsites == ["T2_SLOW"]
+    with pytest.raises(Exception, match="No SITE available"):
+        rucio_utils.get_dataset_files_replicas(
+            "/dataset", mode="first", client=tape_client, sites_xrootd_prefix=sites_map
+        )
+    rucio_utils._site_performance_cache.clear()
+
+    # custom cost model and failing probes
+    def failing_reader(pfn, nbytes):
+        if "t2_fast" in pfn:
+            raise OSError("site down")
+        return b"0" * nbytes
+
+    files, outsites, counts = rucio_utils.get_dataset_files_replicas(
+        "/dataset",
+        mode="best",
+        client=client,
+        sites_xrootd_prefix=sites_map,
+        probe_reader=failing_reader,
+        cost_model=lambda replica, perf: (0.0 if replica["site"] == "T2_SLOW" else 1.0),
+    )
+    assert counts == {"T2_SLOW": 10}
+    rucio_utils._site_performance_cache.clear()
+
+
+def test_rucio_bulk_queries(tmp_path):
+    pytest.importorskip("rucio")
+    from coffea.dataset_tools import rucio_utils
+    from coffea.dataset_tools.dataset_query import DataDiscoveryCLI
+
+    sites = ["T2_A", "T2_B"]
+    sites_map = {site: f"root://{site.lower()}.example.org" for site in sites}
+    client = _FakeRucioClient(3, sites)
+    cache_file = str(tmp_path / "replicas_cache.json")
+    datasets = [f"/Dataset{i}/Run-v1/NANOAODSIM" for i in range(20)]
+
+    results = rucio_utils.get_datasets_files_replicas(
+        datasets,
+        client=client,
+        max_workers=4,
+        cache_file=cache_file,
+        sites_xrootd_prefix=sites_map,
+    )
+    assert list(results.keys()) == datasets
+    assert client.nqueries == 20
+    files, outsites, counts = results[datasets[0]]
+    assert len(files) == 3 and outsites[0] == sites
+    assert counts == {"T2_A": 3, "T2_B": 3}
+
+    # cached results are reused, unless the query options change
+    cached = rucio_utils.get_datasets_files_replicas(
+        datasets,
+        client=client,
+        cache_file=cache_file,
+        sites_xrootd_prefix=sites_map,
+    )
+    assert client.nqueries == 20
+    assert cached == results
+    rucio_utils.get_datasets_files_replicas(
+        datasets[:2],
+        client=client,
+        mode="first",
+        cache_file=cache_file,
+        sites_xrootd_prefix=sites_map,
+    )
+    assert client.nqueries == 22
+    rucio_utils.get_datasets_files_replicas(
+        datasets[:2],
+        client=client,
+        cache_file=cache_file,
+        cache_ttl=0,
+        sites_xrootd_prefix=sites_map,
+    )
+    assert client.nqueries == 24
+
+    cli = DataDiscoveryCLI(rucio_client=client, max_workers=4, replicas_cache_file=None)
+    cli.sites_xrootd_prefix = sites_map
+    out = cli.load_dataset_definition(
+        {"/DatasetX*": {"xsec": 1.0}, "/DatasetY*": {"xsec": 2.0}},
+        replicas_strategy="first",
+    )
+    assert len(out) == 4
+    assert out["/DatasetY/Run-v2/NANOAODSIM"]["metadata"] == {"xsec": 2.0}
+    assert list(out["/DatasetX/Run-v1/NANOAODSIM"]["files"].keys()) == [
+        f"root://t2_a.example.org/store/mc/file{i}.root" for i in range(3)
+    ]
+
+    # the best replicas are selected from the bulk listing, without querying again
+    cli = DataDiscoveryCLI(rucio_client=client, max_workers=4, replicas_cache_file=None)
+    cli.sites_xrootd_prefix = sites_map
+    cli.probe_reader = lambda pfn, nbytes: b"0" * nbytes
+    nqueries = client.nqueries
+    out = cli.load_dataset_definition(
+        {"/DatasetX*": {"xsec": 1.0}}, replicas_strategy="best"
+    )
+    assert client.nqueries == nqueries + 2
+    assert all(len(dataset["files"]) == 3 for dataset in out.values())
+
+
+def test_compute_with_checkpoints(tmp_path):
+    from coffea.processor import CheckpointStore
+
+    def analysis(events):
+        return {
+            "entries": dask_awkward.count(events.run, axis=None),
+            "nmuons": dask_awkward.sum(dask_awkward.num(events.Muon, axis=1)),
+        }
+
+    fileset = max_chunks(_runnable_result, 3)
+    (expected,) = dask.compute(
+        apply_to_fileset(analysis, fileset, schemaclass=NanoAODSchema)
+    )
+
+    out = compute_with_checkpoints(
+        analysis,
+        fileset,
+        str(tmp_path / "checkpoint"),
+        schemaclass=NanoAODSchema,
+        max_in_flight=3,
+    )
+    assert out == expected
+    assert out["ZJets"]["entries"] == 21
+
+    store = CheckpointStore(str(tmp_path / "checkpoint"))
+    assert len(store) == 6
+    key = CheckpointStore.key(
+        "ZJets",
+        "tests/samples/nano_dy.root",
+        "a9490124-3648-11ea-89e9-f5b55c90beef",
+        [7, 14],
+    )
+    assert store.load(key)["entries"] == 7
+
+    def failing(events):
+        raise RuntimeError("should not be called")
+
+    # all steps are in the store
+    resumed = compute_with_checkpoints(failing, fileset, store)
+    assert resumed == expected
+
+    # resume after losing the last steps of the run
+    index = tmp_path / "checkpoint" / CheckpointStore.index_name
+    lines = index.read_text().splitlines(keepends=True)
+    index.write_text("".join(lines[:3]) + lines[3][:10])
+    store = CheckpointStore(str(tmp_path / "checkpoint"))
+    assert len(store) == 3
+    resumed = compute_with_checkpoints(
+        analysis, fileset, store, schemaclass=NanoAODSchema
+    )
+    assert resumed == expected
+    assert len(CheckpointStore(str(tmp_path / "checkpoint"))) == 6
+
+    # on a distributed client, with the file access reports
+    with Client(n_workers=1, threads_per_worker=2):
+        out, report = compute_with_checkpoints(
+            analysis,
+            fileset,
+            str(tmp_path / "checkpoint_report"),
+            schemaclass=NanoAODSchema,
+            uproot_options={"allow_read_errors_with_report": True},
+            max_in_flight=2,
+        )
+    assert out == expected
+    assert set(report) == {"ZJets", "Data"}
+    assert len(report["ZJets"]) == 3
+    assert sorted(int(args[-3]) for args in report["ZJets"].args.tolist()) == [0, 7, 14]
+    resumed, resumed_report = compute_with_checkpoints(
+        failing,
+        fileset,
+        str(tmp_path / "checkpoint_report"),
+        uproot_options={"allow_read_errors_with_report": True},
+    )
+    assert resumed == expected
+    assert len(resumed_report["Data"]) == 3
+
+    with pytest.raises(ValueError):
+        compute_with_checkpoints(analysis, fileset, store, max_in_flight=0)
+
+
+def test_compute_with_dynamic_steps():
+    from coffea.dataset_tools.apply_processor import _fit_step_size, _resize_steps
+
+    def analysis(events):
+        return {
+            "entries": dask_awkward.count(events.run, axis=None),
+            "nmuons": dask_awkward.sum(dask_awkward.num(events.Muon, axis=1)),
+        }
+
+    (expected,) = dask.compute(
+        apply_to_fileset(analysis, _runnable_result, schemaclass=NanoAODSchema)
+    )
+
+    out, step_sizes = compute_with_dynamic_steps(
+        analysis,
+        _runnable_result,
+        target_wall_time=1e6,
+        target_memory="1 GiB",
+        max_step_size=15,
+        schemaclass=NanoAODSchema,
+        scheduler="sync",
+    )
+    assert out == expected
+    assert step_sizes == {"ZJets": 15, "Data": 15}
+
+    out, step_sizes = compute_with_dynamic_steps(
+        analysis,
+        _runnable_result,
+        target_wall_time=None,
+        samples_per_dataset=3,
+        schemaclass=NanoAODSchema,
+    )
+    assert out == expected
+    assert step_sizes == {"ZJets": None, "Data": None}
+
+    # 1 s and 100 B fixed costs, 0.05 s and 5 B per entry
+    samples = [(10, 1.5, 150), (20, 2.0, 200)]
+    assert _fit_step_size(samples, 2.0, 400) == 20
+    assert _fit_step_size(samples, 4.0, 400) == 60
+    assert _fit_step_size(samples, 3.0, None) == 40
+    # the fixed cost cannot be measured from a single size
+    assert _fit_step_size([(10, 1.5, 150)], 3.0, None) == 20
+    # nor when the cost does not grow with the size
+    assert _fit_step_size([(10, 1.0, 100), (20, 1.0, 400)], 2.0, None) == 26
+    # or when it exceeds the target
+    assert _fit_step_size(samples, 0.5, None) == 4
+    assert _fit_step_size([(0, 1.0, 100)], 2.0, None) is None
+    assert _resize_steps([[0, 7], [7, 14], [14, 21], [21, 25]], 4, {(7, 14)}) == [
+        [0, 4],
+        [4, 7],
+        [14, 18],
+        [18, 22],
+        [22, 25],
+    ]
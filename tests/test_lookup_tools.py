@@ -472,6 +472,216 @@ def test_dense_lookup():
     assert ak.to_list(lookup(a, a)) == [[1.0, 1.0], [1.0]]
 
 
+@pytest.mark.parametrize("dtype", ["float64", "float32", "int64"])
+def test_dense_lookup_binning(dtype):
+    import numpy
+
+    from coffea.lookup_tools.dense_lookup import dense_lookup
+
+    rng = numpy.random.default_rng(42)
+    axes = (
+        numpy.linspace(-2.5, 2.5, 11),
+        numpy.array([20.0, 30.0, 50.0, 100.0, 200.0, 1000.0]),
+        numpy.arange(0, 7),
+    )
+    values = rng.random((10, 5, 6))
+    lookup = dense_lookup(values, axes)
+    # the first and last axes are evaluated arithmetically
+    assert lookup._packed_axes[3].tolist() == [2.0, 0.0, 1.0]
+
+    args = []
+    for axis in axes:
+        x = rng.uniform(axis[0] - 10, axis[-1] + 10, size=1000)
+        # values at the bin edges and outside the axis
+        x[:50] = rng.choice(axis, size=50)
+        if dtype != "int64":
+            x[50:53] = [numpy.nan, numpy.inf, -numpy.inf]
+        args.append(x.astype(dtype))
+    indices = tuple(
+        numpy.clip(numpy.searchsorted(axis, x, side="right") - 1, 0, len(axis) - 2)
+        for axis, x in zip(axes, args)
+    )
+    assert numpy.array_equal(lookup(*args), values[indices])
+    assert numpy.array_equal(lookup(args[0][:1], 25.0, 3), values[indices[0][:1], 0, 3])
+
+
+def test_jme_packed_bin_eval():
+    import numpy
+
+    from coffea.lookup_tools.jme_standard_function import pack_bins, packed_bin_eval
+
+    rng = numpy.random.default_rng(42)
+    dimN_bins = [
+        numpy.sort(rng.uniform(0, 100, size=n)) for n in rng.integers(2, 10, size=20)
+    ]
+    edges, offsets = pack_bins(dimN_bins)
+    assert offsets.tolist()[-1] == len(edges)
+
+    dim1_indices = rng.integers(0, len(dimN_bins), size=1000)
+    dimN_vals = rng.uniform(-10, 110, size=1000)
+    dimN_vals[:20] = [dimN_bins[i][0] for i in dim1_indices[:20]]
+    dimN_vals[20:40] = [dimN_bins[i][-1] for i in dim1_indices[20:40]]
+    indices, overflows = packed_bin_eval(dim1_indices, edges, offsets, dimN_vals)
+
+    for i, bins in enumerate(dimN_bins):
+        idx = dim1_indices == i
+        assert numpy.array_equal(
+            indices[idx],
+            numpy.clip(
+                numpy.searchsorted(bins, dimN_vals[idx], side="right") - 1,
+                0,
+                len(bins) - 2,
+            ),
+        )
+        assert numpy.array_equal(
+            overflows[idx], (dimN_vals[idx] > bins[-1]) | (dimN_vals[idx] < bins[0])
+        )
+
+
+def test_jme_wrap_formula(tmp_path, monkeypatch):
+    import pickle
+
+    import numpy
+    import scipy.special
+
+    from coffea.lookup_tools.jme_standard_function import (
+        _compile_formula,
+        jme_standard_function,
+        wrap_formula,
+    )
+
+    rng = numpy.random.default_rng(42)
+    p0, p1, p2 = rng.uniform(0.5, 2.0, size=(3, 1000)).astype(numpy.float32)
+    x = rng.uniform(10.0, 1000.0, size=1000).astype(numpy.float32)
+
+    fstr = "max(0.0001,p0+((JetPt-p1)*(p2+((JetPt-p1)*p0*0.25))))"
+    _compile_formula.cache_clear()
+    monkeypatch.delenv("COFFEA_FORMULA_CACHE", raising=False)
+    formula = wrap_formula(fstr, ["p0", "p1", "p2", "JetPt"])
+    # compiled once per formula string, in memory unless a cache directory is given
+    assert wrap_formula(fstr, ["p0", "p1", "p2", "JetPt"]) is formula
+    _compile_formula.cache_clear()
+    monkeypatch.setenv("COFFEA_FORMULA_CACHE", str(tmp_path))
+    formula = wrap_formula(fstr, ["p0", "p1", "p2", "JetPt"])
+    assert any(path.suffix == ".py" for path in tmp_path.iterdir())
+    expected = numpy.maximum(0.0001, p0 + ((x - p1) * (p2 + ((x - p1) * p0 * 0.25))))
+    assert formula(p0, p1, p2, x).dtype == numpy.float32
+    assert numpy.allclose(formula(p0, p1, p2, x), expected, rtol=1e-6)
+    assert formula(p0, p1, p2, x.astype(numpy.float64)).dtype == numpy.float64
+
+    formula = wrap_formula(
+        "sqrt(p0*p0/x+pow(x,p1)*log10(x)+p2)+erf(p0)*exp(-p2)", ["p0", "p1", "p2", "x"]
+    )
+    expected = numpy.sqrt(p0 * p0 / x + numpy.power(x, p1) * numpy.log10(x) + p2)
+    expected += scipy.special.erf(p0) * numpy.exp(-p2)
+    assert numpy.allclose(formula(p0, p1, p2, x), expected, rtol=1e-6)
+
+    assert numpy.array_equal(wrap_formula("1.5", ["p0", "x"])(p0, x), 1.5 + 0 * p0)
+
+    lookup = jme_standard_function(
+        fstr,
+        ({"JetEta": numpy.array([-5.0, 0.0, 5.0])}, ["JetEta"]),
+        (
+            {"JetPt": numpy.array([[0.0], [0.0]])},
+            {"JetPt": numpy.array([[1000.0], [1000.0]])},
+            ["JetPt"],
+        ),
+        (
+            [numpy.array([1.0, 2.0]), numpy.array([3.0, 4.0]), numpy.array([5.0, 6.0])],
+            ["p0", "p1", "p2"],
+        ),
+    )
+    eta = numpy.array([-1.0, 1.0, 6.0])
+    pt = numpy.array([20.0, 50.0, 70.0])
+    assert numpy.array_equal(
+        pickle.loads(pickle.dumps(lookup))(eta, pt), lookup(eta, pt)
+    )
+    _compile_formula.cache_clear()
+
+
+def test_jec_uncertainty_interpolation():
+    import numpy
+    from scipy.interpolate import interp1d
+
+    from coffea.lookup_tools.jec_uncertainty_lookup import jec_uncertainty_lookup
+    from coffea.lookup_tools.txt_converters import convert_junc_txt_file
+
+    (args,) = convert_junc_txt_file(
+        "tests/samples/Summer16_23Sep2016V3_MC_Uncertainty_AK4PFPuppi.junc.txt.gz"
+    ).values()
+    lookup = jec_uncertainty_lookup(*args)
+    knots = lookup._eval_knots
+    bins = lookup._bins["JetEta"]
+
+    rng = numpy.random.default_rng(42)
+    eta = rng.uniform(-6.0, 6.0, size=1000).astype(numpy.float32)
+    pt = rng.uniform(0.0, 1.5 * knots[-1], size=1000).astype(numpy.float32)
+    pt[:20] = knots[:20]
+    out = lookup(eta, pt)
+
+    # reference from the interp1d of each bin, as scipy would compute it
+    dim1_indices = numpy.clip(
+        numpy.searchsorted(bins, eta, side="right") - 1, 0, bins.size - 2
+    )
+    vals = numpy.clip(pt, knots[0], knots[-1])
+    expected = numpy.ones(shape=(eta.size, 2), dtype=numpy.float32)
+    for i in numpy.unique(dim1_indices):
+        mask = dim1_indices == i
+        expected[mask, 0] += interp1d(knots, args[2][0]["ups"][i])(vals[mask])
+        expected[mask, 1] -= interp1d(knots, args[2][0]["downs"][i])(vals[mask])
+    assert out.dtype == numpy.float32
+    assert numpy.array_equal(out, expected)
+
+
+def test_dense_evaluated_lookup():
+    import pickle
+
+    import numba
+    import numpy
+
+    from coffea.lookup_tools.dense_evaluated_lookup import dense_evaluated_lookup
+
+    formulas = ["0.9*((1.+(0.0113*x))/(1.+(0.0107*x)))", "1.05", "0.98+log(x)*0.01"]
+    eta_axis = numpy.array([0.0, 1.2, 2.4])
+    pt_axis = numpy.array([20.0, 50.0, 100.0, 1000.0])
+    # values are indexed by the axes in reverse order
+    values = numpy.array(
+        [
+            [formulas[0], formulas[1]],
+            [formulas[2], formulas[0]],
+            [formulas[1], formulas[2]],
+        ]
+    )
+    lookup = dense_evaluated_lookup(values, (eta_axis, pt_axis), feval_dim=[1])
+    assert lookup._formulas.size == 3
+
+    rng = numpy.random.default_rng(42)
+    eta = rng.uniform(-1.0, 3.0, size=1000)
+    pt = rng.uniform(10.0, 1200.0, size=1000)
+    out = lookup(eta, pt)
+
+    ieta = numpy.clip(numpy.searchsorted(eta_axis, eta, side="right") - 1, 0, 1)
+    ipt = numpy.clip(numpy.searchsorted(pt_axis, pt, side="right") - 1, 0, 2)
+    expected = [
+        eval(values[j, i], {"log": numpy.log, "x": x}) for i, j, x in zip(ieta, ipt, pt)
+    ]
+    assert out.dtype == numpy.float64
+    assert numpy.allclose(out, expected, rtol=1e-12)
+
+    # pickles of older versions hold the numba function of each bin instead
+    old = object.__new__(dense_evaluated_lookup)
+    old.__dict__.update(
+        {k: v for k, v in lookup.__dict__.items() if k not in ("_formulas", "_mapping")}
+    )
+    old._values = numpy.empty(values.shape, dtype="O")
+    for idx, formula in numpy.ndenumerate(values):
+        func = eval("lambda x: " + formula, {"log": numpy.log, "sqrt": numpy.sqrt})
+        old._values[idx] = numba.njit(func)
+    old = pickle.loads(pickle.dumps(old))
+    assert old._formulas.size == 3
+    assert numpy.allclose(old(eta, pt), expected, rtol=1e-12)
+
+
 def test_549(tests_directory):
     import awkward as ak
 
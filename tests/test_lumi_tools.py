@@ -127,6 +127,14 @@ def test_lumilist():
 
     assert abs(lumi3 - (lumi1 + lumi2)) < 1e-4
 
+    # pickled state of the lists saved before the merges were deferred
+    old = LumiList(delayed=False)
+    old.__dict__ = {"array": llist3.array.copy()}
+    restored = cloudpickle.loads(cloudpickle.dumps(old))
+    assert np.array_equal(restored.array, llist3.array)
+    restored += llist1
+    assert abs(lumidata.get_lumi(restored) - lumi3) < 1e-4
+
     llist1.clear()
     assert llist1.array.size == 0
 
@@ -1,7 +1,9 @@
+import time
 from pathlib import Path
 
 import awkward as ak
 import pytest
+import uproot
 from distributed import Client
 
 from coffea.nanoevents import NanoAODSchema, NanoEventsFactory
@@ -191,3 +193,134 @@ def test_missing_eventIds_warning_dask(tests_directory):
             delayed=True,
         ).events()
         events.Muon.pt.compute()
+
+
+class _TestReplicaSource(uproot.source.chunk.Source):
+    """Reads a local file, failing or sleeping depending on the replica name"""
+
+    delays = {}
+    failed_reads = []
+
+    def __init__(self, file_path, **options):
+        super().__init__()
+        self._file_path = file_path
+        if "broken_open" in file_path:
+            raise OSError(f"cannot open {file_path}")
+        self._data = Path(file_path.split("?")[0]).read_bytes()
+        self._num_bytes = len(self._data)
+        self.num_reads = 0
+
+    def chunk(self, start, stop):
+        if "broken_read" in self._file_path and self.num_reads > 0:
+            self.failed_reads.append(self._file_path)
+            raise OSError(f"cannot read {self._file_path}")
+        self.num_reads += 1
+        time.sleep(self.delays.get(self._file_path, 0.0))
+        return uproot.source.chunk.Chunk.wrap(self, self._data[start:stop], start)
+
+    def chunks(self, ranges, notifications):
+        return [self.chunk(start, stop) for start, stop in ranges]
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        pass
+
+
+def test_failover_source(tests_directory):
+    from coffea.nanoevents.mapping import FailoverSource
+
+    path = f"{tests_directory}/samples/nano_dy.root"
+    replicas = {
+        "broken_open": [f"{path}?broken_read", path],
+    }
+    events = NanoEventsFactory.from_root(
+        {"broken_open": {"object_path": "Events", "replicas": replicas["broken_open"]}},
+        schemaclass=NanoAODSchema,
+        delayed=True,
+        uproot_options={"replica_handler": _TestReplicaSource},
+    ).events()
+    assert ak.sum(events.Muon.pt.compute()) == pytest.approx(538.3694, rel=1e-6)
+    # the replicas are read by the given handler, failing over at read time
+    assert f"{path}?broken_read" in _TestReplicaSource.failed_reads
+
+    # hedged reads: the slow replica is abandoned for the fast one
+    _TestReplicaSource.delays = {f"{path}?slow": 0.5}
+    with FailoverSource(
+        f"{path}?slow",
+        replicas={f"{path}?slow": [path]},
+        replica_handler=_TestReplicaSource,
+        hedge_quantile=0.5,
+        hedge_min_reads=0,
+    ) as source:
+        assert source.current_replica == f"{path}?slow"
+        source._latencies.extend([0.01] * 10)
+        chunk = source.chunk(0, 4)
+        assert chunk.raw_data.tobytes() == b"root"
+        assert source.current_replica == path
+        # all the sources share the same thread pools
+        with FailoverSource(path, replica_handler=_TestReplicaSource) as other:
+            assert other._executor is source._executor
+            assert other._hedge_executor is source._hedge_executor
+    _TestReplicaSource.delays = {}
+
+
+@pytest.mark.parametrize("delayed", [False, True])
+def test_systematics(tests_directory, delayed):
+    import numpy as np
+
+    events = NanoEventsFactory.from_root(
+        {f"{tests_directory}/samples/nano_dy.root": "Events"},
+        schemaclass=NanoAODSchema,
+        delayed=delayed,
+    ).events()
+
+    def compute(array):
+        return array.compute() if delayed else array
+
+    def updown(values):
+        return (1.0 + np.array([0.05, -0.05], dtype=np.float32)) * values[:, None]
+
+    events.add_systematic("RenFactScale", "UpDownSystematic", "weight", updown)
+    renfact_down = events.systematics.RenFactScale.down
+    assert ak.all(np.isclose(compute(renfact_down.weight_RenFactScale), 0.95))
+
+    muons = events.Muon
+    muons.add_systematic("PtScale", "UpDownSystematic", "pt", updown)
+    muons.add_systematic("PtResolution", "UpDownSystematic", "pt", updown)
+    with pytest.raises(ValueError, match="already exists"):
+        muons.add_systematic("PtScale", "UpDownSystematic", "pt", updown)
+    with pytest.raises(ValueError, match="not an available systematics type"):
+        muons.add_systematic("EtaScale", "SomeSystematic", "eta", updown)
+
+    assert list(muons.systematics) == ["PtScale", "PtResolution"]
+    assert list(muons.systematics.PtScale) == ["up", "down"]
+    up = compute(muons.systematics.PtScale.up)
+    down = compute(muons.systematics["PtResolution"]["down"])
+    expected = compute(muons)
+    assert type(up) is type(expected)
+    assert ak.all(np.isclose(up.pt, expected.pt * 1.05))
+    assert ak.all(np.isclose(down.pt, expected.pt * 0.95))
+    assert ak.all(up.eta == expected.eta)
+    assert "__systematics__" not in ak.fields(up)
+    # the cross-references of the collection are preserved
+    assert ak.all(
+        compute(muons.systematics.PtScale.up.matched_jet.pt)
+        == compute(muons.matched_jet.pt)
+    )
+    if not delayed:
+        # the variations share the unchanged columns of the collection
+        assert np.shares_memory(
+            ak.to_numpy(ak.flatten(up.eta)), ak.to_numpy(ak.flatten(expected.eta))
+        )
+
+    # several columns can be varied together
+    def scale(values):
+        return ak.zip(
+            {field: updown(values[field]) for field in ak.fields(values)},
+            depth_limit=1,
+        )
+
+    muons.add_systematic("Scale", "UpDownSystematic", ["pt", "mass"], scale)
+    up = compute(muons.systematics.Scale.up)
+    assert ak.all(np.isclose(up.pt, expected.pt * 1.05))
+    assert ak.all(np.isclose(up.mass, expected.mass * 1.05))
+    assert ak.all(up.eta == expected.eta)
@@ -25,3 +25,230 @@ def test_processorabc():
 
     acc = None
     super(test, proc).postprocess(acc)
+
+
+_fileset = {
+    "ZJets": {
+        "files": {
+            "tests/samples/nano_dy.root": {
+                "object_path": "Events",
+                "steps": [[0, 7], [7, 14], [14, 21], [21, 28], [28, 35], [35, 40]],
+                "uuid": "a9490124-3648-11ea-89e9-f5b55c90beef",
+            }
+        },
+        "metadata": {"isMC": True},
+    },
+    "Data": {
+        "files": {
+            "tests/samples/nano_dimuon.root": {
+                "object_path": "Events",
+                "steps": [[0, 20], [20, 40]],
+                "uuid": "a210a3f8-3648-11ea-a29f-f5b55c90beef",
+            }
+        },
+        "metadata": None,
+    },
+}
+
+
+@pytest.mark.parametrize("pool", ["threads", "processes"])
+def test_futures_executor(pool):
+    import awkward as ak
+    import hist
+
+    from coffea.nanoevents import NanoAODSchema
+    from coffea.processor import FuturesExecutor, ProcessorABC, fileset_workitems
+
+    class MuonProcessor(ProcessorABC):
+        def process(self, events):
+            dataset = events.metadata["dataset"]
+            h = hist.Hist.new.Reg(10, 0, 100, name="pt").Double()
+            h.fill(pt=ak.flatten(events.Muon.pt))
+            return {
+                dataset: {
+                    "entries": len(events),
+                    "nmuons": int(ak.sum(ak.num(events.Muon))),
+                    "pt": h,
+                    "chunks": {
+                        (
+                            events.metadata["entrystart"],
+                            events.metadata.get("isMC", False),
+                        )
+                    },
+                }
+            }
+
+        def postprocess(self, accumulator):
+            accumulator["postprocessed"] = True
+
+    assert len(fileset_workitems(_fileset)) == 8
+
+    executor = FuturesExecutor(workers=2, pool=pool, merge_fanin=2, status=False)
+    out = executor(
+        MuonProcessor(),
+        _fileset,
+        schemaclass=NanoAODSchema,
+        iteritems_options={
+            "filter_name": ["run", "luminosityBlock", "event", "nMuon", "Muon_*"]
+        },
+    )
+    assert out["postprocessed"]
+    assert out["ZJets"]["entries"] == 40
+    assert out["Data"]["entries"] == 40
+    assert out["ZJets"]["chunks"] == {(start, True) for start in range(0, 40, 7)}
+    assert out["Data"]["chunks"] == {(0, False), (20, False)}
+    for dataset in ("ZJets", "Data"):
+        h = out[dataset]["pt"]
+        assert h.sum(flow=True) == out[dataset]["nmuons"]
+
+    streamed = FuturesExecutor(workers=2, pool=pool, merge_in_pool=False, status=False)(
+        MuonProcessor(),
+        _fileset,
+        iteritems_options={
+            "filter_name": ["run", "luminosityBlock", "event", "nMuon", "Muon_*"]
+        },
+    )
+    assert streamed["ZJets"]["chunks"] == out["ZJets"]["chunks"]
+    assert streamed["Data"]["pt"] == out["Data"]["pt"]
+
+    counts = FuturesExecutor(pool=pool, status=False)(
+        lambda events: len(events),
+        _fileset,
+        iteritems_options={"filter_name": ["run", "luminosityBlock", "event"]},
+    )
+    assert counts == 80
+
+    with pytest.raises(ValueError):
+        FuturesExecutor(pool="spark", status=False)(lambda events: 0, _fileset)
+
+
+def test_accumulators():
+    import concurrent.futures
+    from collections import Counter
+
+    import dask
+    import hist
+    import numpy as np
+
+    from coffea.analysis_tools import WeightStatistics
+    from coffea.lumi_tools import LumiList
+    from coffea.processor import (
+        accumulate,
+        accumulate_delayed,
+        accumulate_futures,
+        accumulate_submitted,
+        add,
+        iadd,
+    )
+
+    def make(i):
+        h = hist.Hist.new.Reg(4, 0, 4, name="x").Double()
+        h.fill(x=[i % 4])
+        lumis = LumiList(
+            runs=np.array([1, 1]), lumis=np.array([i, i + 1]), delayed=False
+        )
+        return {
+            "h": h,
+            "n": i,
+            "counts": Counter({"a": 1, "b": -1}),
+            "chunks": {i},
+            "weights": WeightStatistics(float(i), float(i * i), float(i), float(i), 1),
+            "lumis": lumis,
+            f"only{i}": np.array([i]),
+        }
+
+    a, b = make(0), make(1)
+    c = add(a, b)
+    assert c["n"] == 1 and a["n"] == 0 and b["n"] == 1
+    assert c["counts"] == Counter({"a": 2, "b": -2})
+    assert c["h"].sum() == 2 and a["h"].sum() == 1
+    c["only1"] += 1
+    assert b["only1"][0] == 1
+
+    d = iadd(make(2), b)
+    assert d["n"] == 3 and d["chunks"] == {1, 2}
+    assert d["weights"].sumw == 3.0 and d["weights"].n == 2
+    d["only1"] += 1
+    assert b["only1"][0] == 1
+
+    with pytest.raises(ValueError):
+        add({"x": {1}}, {"x": 1})
+
+    items = [make(i) for i in range(20)]
+    total = accumulate(items)
+    assert items[0]["n"] == 0 and items[0]["h"].sum() == 1
+    assert total["n"] == sum(range(20))
+    assert total["chunks"] == set(range(20))
+    assert total["counts"] == Counter({"a": 20, "b": -20})
+    assert total["h"].values().tolist() == [5, 5, 5, 5]
+    assert total["weights"].sumw2 == sum(i * i for i in range(20))
+    assert total["weights"].minw == 0 and total["weights"].maxw == 19
+    assert total["lumis"].array.shape == (21, 2)
+    assert all(f"only{i}" in total for i in range(20))
+
+    inplace = accumulate([make(i) for i in range(20)], inplace=True)
+    assert inplace["n"] == total["n"] and inplace["chunks"] == total["chunks"]
+    assert accumulate([None, None]) is None
+
+    with concurrent.futures.ThreadPoolExecutor(4) as pool:
+        for merge_pool in (pool, None):
+            futures = [pool.submit(make, i) for i in range(20)]
+            out = accumulate_futures(futures, pool=merge_pool, fanin=3)
+            assert out["n"] == total["n"]
+            assert out["h"].values().tolist() == [5, 5, 5, 5]
+        assert accumulate_futures([], pool=pool) is None
+
+        out = accumulate_submitted(pool, make, range(20), fanin=3, max_in_flight=2)
+        assert out["n"] == total["n"] and out["chunks"] == total["chunks"]
+        assert accumulate_submitted(pool, make, []) is None
+
+    delayed_items = [dask.delayed(make)(i) for i in range(20)]
+    (out,) = dask.compute(accumulate_delayed(delayed_items, fanin=3))
+    assert out["n"] == total["n"]
+    assert out["counts"] == total["counts"]
+
+
+def test_accumulate_result_files(tmp_path):
+    import hist
+
+    from coffea.processor.executor import _compress
+    from coffea.processor.work_queue_tools import accumulate_result_files
+
+    files = []
+    for i in range(20):
+        h = hist.Hist.new.Reg(4, 0, 4, name="x").Double()
+        h.fill(x=[i % 4])
+        path = tmp_path / f"result{i}.coffea"
+        path.write_bytes(_compress({"h": h, "n": i, "chunks": {i}}, 1))
+        files.append(str(path))
+
+    serial = accumulate_result_files(files)
+    assert serial["n"] == sum(range(20)) and serial["chunks"] == set(range(20))
+    assert serial["h"].values().tolist() == [5, 5, 5, 5]
+
+    parallel = accumulate_result_files(files, {"n": 1}, workers=2, fanin=3)
+    assert parallel["n"] == serial["n"] + 1
+    assert parallel["chunks"] == serial["chunks"]
+    assert parallel["h"].values().tolist() == [5, 5, 5, 5]
+    assert accumulate_result_files([]) is None
+
+
+def test_futures_executor_checkpoint(tmp_path):
+    from coffea.processor import CheckpointStore, FuturesExecutor
+
+    options = {"filter_name": ["run", "luminosityBlock", "event"]}
+    store = CheckpointStore(str(tmp_path))
+    executor = FuturesExecutor(pool="threads", status=False, checkpoint=store)
+    out = executor(
+        lambda events: {"n": len(events)}, _fileset, iteritems_options=options
+    )
+    assert out == {"n": 80}
+    assert len(store) == 8
+
+    def failing(events):
+        raise RuntimeError("should not be called")
+
+    executor = FuturesExecutor(
+        pool="threads", status=False, checkpoint=CheckpointStore(str(tmp_path))
+    )
+    assert executor(failing, _fileset) == {"n": 80}
@@ -15,3 +15,69 @@ def test_loadsave():
     finally:
         if os.path.exists(filename):
             os.remove(filename)
+
+
+def test_loadsave_out_of_band(tmp_path):
+    import collections
+
+    import hist
+    import numpy as np
+    import pytest
+
+    h = hist.Hist.new.Reg(100_000, 0, 1, name="x").Weight()
+    h.fill(x=np.linspace(0, 1, 1000), weight=2.0)
+    output = {
+        "hist": h,
+        "random": np.random.default_rng(42).normal(size=300_000),
+        "zeros": np.zeros(1_000_000),
+        "strided": np.arange(100)[::3],
+        "meta": {"dataset": "ZJets", "n": 3},
+    }
+
+    for compression_level in (0, 9, None):
+        filename = str(tmp_path / f"out{compression_level}.coffea")
+        save(
+            output,
+            filename,
+            out_of_band=True,
+            compression_level=compression_level,
+            block_size=1 << 20,
+            threads=2,
+        )
+        loaded = load(filename)
+        assert loaded.keys() == output.keys()
+        assert loaded["hist"] == h
+        assert np.array_equal(loaded["random"], output["random"])
+        assert np.array_equal(loaded["strided"], output["strided"])
+        assert loaded["meta"] == output["meta"]
+        # loaded arrays can be modified
+        loaded["zeros"] += 1
+        loaded["hist"].fill(x=[0.5])
+
+        assert np.array_equal(load(filename, key="zeros"), output["zeros"])
+        with pytest.raises(KeyError):
+            load(filename, key="missing")
+
+    # zeros compress well
+    assert os.path.getsize(tmp_path / "out0.coffea") < 0.7 * os.path.getsize(
+        tmp_path / "outNone.coffea"
+    )
+
+    # dict subclasses keep their type, and can still be loaded by key
+    counts = collections.defaultdict(int, a=1)
+    counts["b"] += 2
+    save(counts, str(tmp_path / "counts.coffea"), out_of_band=True)
+    loaded = load(str(tmp_path / "counts.coffea"))
+    assert type(loaded) is collections.defaultdict and loaded == counts
+    loaded["c"] += 1
+    assert load(str(tmp_path / "counts.coffea"), key="b") == 2
+
+    save(h, str(tmp_path / "hist.coffea"), out_of_band=True)
+    assert load(str(tmp_path / "hist.coffea")) == h
+    with pytest.raises(ValueError):
+        load(str(tmp_path / "hist.coffea"), key="hist")
+
+    save(output["meta"], str(tmp_path / "legacy.coffea"))
+    assert load(str(tmp_path / "legacy.coffea")) == output["meta"]
+    with pytest.raises(ValueError):
+        load(str(tmp_path / "legacy.coffea"), key="n")